@@ -1,7 +1,6 @@
 # app.py
 import streamlit as st
-import pandas as pd
-from modules import utils, analysis, visualization
+from modules import utils, analysis, visualization, cache, history, profiling, rules, students
 
 # --- 1. Cấu hình trang (Page Configuration) ---
 st.set_page_config(
@@ -11,6 +10,228 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+def show_history_trends(analysis_type):
+    """Xu hướng qua các kỳ đã lưu trong kho lịch sử: số bất thường, điểm trung bình và tra cứu học sinh."""
+    store = history.default_store()
+    kind = utils.ANALYSIS_KINDS[analysis_type]
+    periods = store.periods(kind)
+    if periods.empty:
+        st.info(f"Chưa lưu kỳ nào cho {analysis_type.lower()}. Lưu kết quả phân tích của từng kỳ để theo dõi xu hướng.")
+        return
+    st.caption(f"Đã lưu {len(periods)} kỳ: {', '.join(periods['Ky'])}.")
+
+    selected = st.multiselect("Lớp (để trống: toàn bộ):", store.classes(kind), key=f"history_classes_{kind}")
+    filters = {"lop": selected or None}
+    by = ["NamHoc", "HocKy", "lop"] if selected else ["NamHoc", "HocKy"]
+    counts = store.anomaly_counts(kind, by=by, filters=filters)
+    st.plotly_chart(visualization.plot_history_anomalies(counts), use_container_width=True)
+    trend = store.score_trend(kind, by=["NamHoc", "HocKy", "CotDiem"], filters=filters)
+    st.plotly_chart(visualization.plot_history_scores(trend), use_container_width=True)
+    with st.expander("Bảng số liệu theo kỳ"):
+        st.dataframe(counts, hide_index=True, use_container_width=True)
+
+    student_id = st.text_input("Tra cứu học sinh theo MaHS:", key=f"history_student_{kind}").strip()
+    if student_id:
+        scores, anomalies = store.student_history(student_id, kind)
+        if scores.empty:
+            st.warning(f"Không tìm thấy học sinh '{student_id}' trong lịch sử.")
+        else:
+            st.plotly_chart(visualization.plot_history_scores(scores, title=f"Điểm của học sinh {student_id}"),
+                            use_container_width=True)
+            st.dataframe(scores, hide_index=True, use_container_width=True)
+            st.write(f"{len(anomalies)} bất thường đã ghi nhận:")
+            st.dataframe(analysis.format_anomalies(anomalies), hide_index=True, use_container_width=True)
+
+# Phần kết quả chạy trong các fragment: bấm bộ lọc chỉ chạy lại `show_results`, thao
+# tác trong một tab chỉ chạy lại tab đó, và chỉ tab đang mở được dựng.
+@st.fragment
+def show_results(df, df_anomalies, prepared, score_cols, fingerprint, analysis_type, group_col, z_score_threshold,
+                 file_name, methods):
+    """Bộ lọc và các tab kết quả."""
+    # --- Bộ lọc dữ liệu ---
+    st.subheader("Lọc và Tra cứu kết quả")
+
+    # Mã danh mục của các cột lọc được dựng một lần cho mỗi bảng bất thường
+    index = utils.anomaly_index(df_anomalies, fingerprint, analysis_type, z_score_threshold, group_col, methods)
+
+    # Tạo các cột để đặt bộ lọc
+    filter_col1, filter_col2, filter_col3 = st.columns([1, 1, 1])
+
+    # Lọc theo lớp
+    unique_classes = index.options["lop"].tolist()
+    selected_classes = filter_col1.multiselect("Lọc theo Lớp:", options=unique_classes, default=unique_classes)
+
+    # Lọc theo loại bất thường
+    unique_types = index.options["LoaiBatThuong"].tolist()
+    selected_types = filter_col2.multiselect("Lọc theo Loại bất thường:", options=unique_types, default=unique_types)
+
+    # Lọc theo Mức độ
+    unique_severities = index.options["MucDo"].tolist()
+    selected_severities = filter_col3.multiselect("Lọc theo Mức độ:", options=unique_severities, default=unique_severities)
+
+    # Áp dụng bộ lọc
+    selections = {"lop": selected_classes, "LoaiBatThuong": selected_types, "MucDo": selected_severities}
+    filtered_anomalies = index.select(df_anomalies, selections)
+
+    # --- Hiển thị kết quả trong các Tab ---
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(
+        ["📑 Bảng chi tiết", "📈 Trực quan hóa tổng quan", "🔥 Heatmap chi tiết", "🧑‍🎓 Tra cứu học sinh",
+         "📅 Xu hướng theo kỳ"],
+        key="result_tab", on_change="rerun"
+    )
+
+    if tab1.open:
+        with tab1:
+            report_key = (fingerprint, analysis_type, group_col, z_score_threshold, tuple(methods),
+                          *(tuple(selected) for selected in selections.values()))
+            show_table_tab(df, df_anomalies, filtered_anomalies, prepared, analysis_type, report_key)
+    if tab2.open:
+        with tab2:
+            show_charts_tab(df, filtered_anomalies, score_cols, fingerprint)
+    if tab3.open:
+        with tab3:
+            show_heatmap_tab(df, df_anomalies, score_cols)
+    if tab4.open:
+        with tab4:
+            show_student_tab(df, df_anomalies, index, score_cols, fingerprint)
+    if tab5.open:
+        with tab5:
+            show_history_tab(df, df_anomalies, analysis_type, z_score_threshold, group_col, file_name)
+
+@st.fragment
+def show_table_tab(df, df_anomalies, filtered_anomalies, prepared, analysis_type, report_key):
+    st.write(f"Hiển thị {len(filtered_anomalies)} trên {len(df_anomalies)} kết quả.")
+    # Câu giải thích chỉ được tạo cho các dòng hiển thị/xuất
+    st.dataframe(analysis.format_anomalies(filtered_anomalies), use_container_width=True)
+
+    # --- Chức năng Xuất báo cáo ---
+    st.subheader("Tải về Báo cáo")
+
+    # Báo cáo chỉ được tạo khi người dùng bấm nút (không tạo lại ở mỗi lần tương tác)
+    report_col1, report_col2 = st.columns([2, 1])
+    report_format = report_col1.radio("Định dạng:", list(utils.REPORT_FORMATS), horizontal=True)
+    report_fn, report_ext, report_mime = utils.REPORT_FORMATS[report_format]
+    report_key = (*report_key, report_format)
+
+    if report_col2.button("⚙️ Tạo báo cáo"):
+        with st.spinner("Đang tạo báo cáo..."):
+            report_sheets = {
+                "Bất thường đã lọc": filtered_anomalies,
+                "Tất cả bất thường": df_anomalies,
+                "Dữ liệu gốc": df
+            }
+            if prepared.rule_timings is not None:
+                report_sheets["Thời gian quy tắc"] = prepared.rule_timings
+            st.session_state["report"] = (report_key, report_fn(
+                report_sheets,
+                formatters={
+                    "Bất thường đã lọc": analysis.format_anomalies,
+                    "Tất cả bất thường": analysis.format_anomalies,
+                    "Dữ liệu gốc": analysis.restore_scores
+                }
+            ))
+
+    report = st.session_state.get("report")
+    if report is not None and report[0] == report_key:
+        st.download_button(
+            label=f"📥 Tải Báo cáo {report_format}",
+            data=report[1],
+            file_name=f"BaoCao_BatThuong_{analysis_type.replace(' ', '')}.{report_ext}",
+            mime=report_mime
+        )
+    else:
+        st.caption("Bấm \"Tạo báo cáo\" để chuẩn bị tệp tải về theo bộ lọc hiện tại.")
+
+@st.fragment
+def show_charts_tab(df, filtered_anomalies, score_cols, fingerprint):
+    st.plotly_chart(visualization.plot_anomalies_by_class(filtered_anomalies), use_container_width=True)
+    st.plotly_chart(visualization.plot_anomaly_types(filtered_anomalies), use_container_width=True)
+
+    selected_column_for_dist = st.selectbox("Chọn cột điểm để xem phân bố:", score_cols)
+    if selected_column_for_dist:
+        dist_group_col = "lop" if "lop" in df.columns else None
+        distribution = utils.score_distribution(df, fingerprint, selected_column_for_dist, dist_group_col)
+        dist_groups = []
+        if dist_group_col is not None:
+            dist_groups = st.multiselect(
+                "So sánh phân bố của các lớp:", distribution.labels[1:].tolist(),
+                max_selections=visualization.DISTRIBUTION_MAX_OVERLAYS,
+                help="Để trống để xem phân bố của cả tệp cùng biểu đồ hộp của từng lớp."
+            )
+        st.plotly_chart(visualization.plot_score_distribution(
+            df, selected_column_for_dist, dist_group_col, dist_groups, distribution
+        ), use_container_width=True)
+
+@st.fragment
+def show_heatmap_tab(df, df_anomalies, score_cols):
+    st.info("Heatmap hiển thị bảng điểm theo từng trang. Các ô có dấu 🔥 là vị trí của các điểm bất thường đã được phát hiện (trước khi lọc).")
+    heat_col1, heat_col2, heat_col3 = st.columns([1, 1, 1])
+    rows_per_page = heat_col1.selectbox("Số học sinh mỗi trang:", (100, 200, 500, 1000, 2000), index=1)
+    sort_by_anomalies = heat_col2.checkbox("Ưu tiên học sinh có nhiều bất thường", value=True)
+    rows_per_page, n_pages = visualization.heatmap_layout(len(df), len(score_cols), rows_per_page)
+    page = heat_col3.number_input(f"Trang (1-{n_pages}):", min_value=1, max_value=n_pages, value=1, step=1)
+
+    fig_heatmap = visualization.plot_anomalies_heatmap(
+        df, df_anomalies, score_cols,
+        page=page - 1, rows_per_page=rows_per_page, sort_by_anomalies=sort_by_anomalies
+    )
+    st.plotly_chart(fig_heatmap, use_container_width=True)
+
+@st.fragment
+def show_student_tab(df, df_anomalies, index, score_cols, fingerprint):
+    # Chỉ mục MaHS/họ tên/lớp dựng một lần cho mỗi tệp; mỗi lần gõ chỉ tìm kiếm nhị phân
+    student_index = utils.student_index(df, fingerprint)
+    search_hint = "MaHS hoặc họ tên" if student_index.name_column else "MaHS"
+    query = st.text_input(f"Tìm học sinh theo {search_hint} (gõ phần đầu):", key="student_query")
+    if not query.strip():
+        st.caption(f"Nhập {search_hint} để xem điểm, Z-score và các bất thường của một học sinh.")
+        return
+    rows = student_index.search(query)
+    if len(rows) == 0:
+        st.warning(f"Không tìm thấy học sinh nào khớp với '{query.strip()}'.")
+        return
+
+    # Nhãn chỉ được tạo cho các dòng khớp (tối đa students.SEARCH_LIMIT)
+    label_cols = [col for col in ("MaHS", student_index.name_column, "lop", analysis.SOURCE_COLUMN)
+                  if col is not None and col in df.columns]
+    labels = [" - ".join(str(value) for value in values)
+              for values in df.iloc[rows][label_cols].itertuples(index=False)]
+    choice = st.selectbox(f"{len(rows)} học sinh khớp:", range(len(rows)), format_func=labels.__getitem__,
+                          key="student_choice")
+    row = int(rows[choice])
+
+    profile = students.student_profile(df, score_cols, row, student_index)
+    st.plotly_chart(visualization.plot_student_profile(profile, title=f"Điểm của học sinh {labels[choice]}"),
+                    use_container_width=True)
+    st.dataframe(profile.round(2), hide_index=True, use_container_width=True)
+
+    student_anomalies = df_anomalies.take(index.rows_of([row]))
+    if student_anomalies.empty:
+        st.success("Học sinh này không có bất thường nào.")
+    else:
+        st.write(f"{len(student_anomalies)} bất thường của học sinh này:")
+        st.dataframe(analysis.format_anomalies(student_anomalies), hide_index=True, use_container_width=True)
+
+@st.fragment
+def show_history_tab(df, df_anomalies, analysis_type, z_score_threshold, group_col, file_name):
+    # Lưu điểm và toàn bộ bất thường (theo ngưỡng hiện tại) của tệp này vào kho lịch sử
+    save_col1, save_col2, save_col3 = st.columns([1, 1, 1])
+    school_year = save_col1.text_input("Năm học:", placeholder="2024-2025")
+    term = save_col2.selectbox("Học kỳ:", history.TERMS)
+    if save_col3.button("💾 Lưu vào lịch sử"):
+        try:
+            with st.spinner("Đang lưu..."):
+                run = history.default_store().save_run(
+                    df, df_anomalies, utils.ANALYSIS_KINDS[analysis_type], school_year, term,
+                    z_score_threshold, group_col, file_name
+                )
+            st.success(f"Đã lưu {run['SoHocSinh']} học sinh, {run['SoLop']} lớp, "
+                       f"{run['SoBatThuong']} bất thường cho {run['NamHoc']} {run['HocKy']}.")
+        except history.HistoryError as e:
+            st.error(str(e))
+    st.markdown("---")
+    show_history_trends(analysis_type)
+
 # --- 2. Giao diện Sidebar (Khu vực điều khiển) ---
 with st.sidebar:
     st.header("⚙️ Cấu hình & Tải tệp")
@@ -24,9 +245,11 @@ with st.sidebar:
     )
 
     # Tải tệp lên
-    uploaded_file = st.file_uploader(
+    uploaded_files = st.file_uploader(
         "Tải lên tệp CSV hoặc Excel:",
-        type=["csv", "xlsx"]
+        type=["csv", "xlsx"],
+        accept_multiple_files=True,
+        help="Có thể chọn nhiều tệp (ví dụ mỗi lớp một tệp) hoặc một tệp Excel mỗi sheet là một lớp; các tệp được gộp và phân tích chung, cột TepNguon cho biết nguồn của từng học sinh."
     )
 
     st.markdown("---")
@@ -38,6 +261,42 @@ with st.sidebar:
         min_value=1.0, max_value=4.0, value=2.5, step=0.1,
         help="Một điểm được xem là bất thường nếu độ lệch của nó so với trung bình (tính bằng Z-score) lớn hơn ngưỡng này. Giá trị càng cao, độ nhạy càng thấp."
     )
+    detection_methods = st.multiselect(
+        "Phương pháp phát hiện:",
+        list(analysis.DETECTION_METHODS),
+        default=list(analysis.DEFAULT_DETECTION_METHODS),
+        format_func=analysis.DETECTION_METHODS.get,
+        help="Z-score dùng trung bình và độ lệch chuẩn, vốn bị chính các điểm lệch kéo theo khi lớp ít học sinh. Trung vị/MAD và hàng rào tứ phân vị (IQR) ít bị ảnh hưởng hơn; dùng chung ngưỡng ở trên (với IQR, ngưỡng 2.7 tương ứng hàng rào 1.5 x IQR). Chọn nhiều phương pháp để so sánh: các thống kê được tính một lần và dùng chung."
+    )
+
+    # Bộ nhớ đệm trên đĩa cho tệp đã đọc và kết quả phân tích
+    with st.expander("🗄️ Bộ nhớ đệm"):
+        disk_cache = cache.default_cache()
+        if st.button("Xóa bộ nhớ đệm"):
+            disk_cache.invalidate()
+            st.cache_data.clear()
+            st.cache_resource.clear()
+        cache_stats = disk_cache.stats()
+        st.caption(
+            f"{cache_stats['entries']} mục, {cache_stats['size_bytes'] / 1024 / 1024:.1f}"
+            f"/{cache_stats['max_bytes'] / 1024 / 1024:.0f} MB · "
+            f"hit {cache_stats['hits']} / miss {cache_stats['misses']}"
+        )
+
+    # Thời gian và bộ nhớ của từng bước trong lượt chạy hiện tại
+    with st.expander("⏱️ Hiệu năng"):
+        show_performance = st.checkbox(
+            "Đo thời gian từng bước",
+            help="Ghi thời gian, số dòng, số bất thường và mức thay đổi bộ nhớ (RSS) của từng bước: đọc tệp, phân tích, vẽ biểu đồ, xuất báo cáo."
+        )
+        performance_placeholder = st.empty()
+        memory_placeholder = st.empty()
+
+session_memory = None
+if show_performance:
+    performance_records = profiling.start_collection()
+else:
+    profiling.stop_collection()
 
 # --- 3. Giao diện chính (Main Interface) ---
 st.title("🔎 Ứng dụng hỗ trợ phân tích và phát hiện điểm số bất thường của học sinh")
@@ -47,24 +306,70 @@ st.write("""
 """)
 
 # --- 4. Xử lý và Hiển thị kết quả ---
-if uploaded_file is not None:
-    df = utils.load_data(uploaded_file)
+if uploaded_files:
+    # Nhiều tệp được đọc song song rồi gộp thành một bảng
+    fingerprint = utils.files_fingerprint(uploaded_files)
+    df = utils.load_files(uploaded_files, fingerprint)
 
     if df is not None:
-        df_anomalies = pd.DataFrame()
-        score_cols = []
-
-        # Chạy phân tích dựa trên lựa chọn của người dùng
-        with st.spinner(f'Đang phân tích dữ liệu "{analysis_type}"...'):
-            if analysis_type == "Điểm thành phần":
-                df_anomalies = analysis.run_component_analysis(df, z_score_threshold)
-                score_cols = [col for col in ['TX1', 'TX2', 'TX3', 'GK', 'CK'] if col in df.columns]
-            else: # Điểm tổng hợp
-                df_anomalies = analysis.run_summary_analysis(df, z_score_threshold)
-                score_cols = [col for col in ['Toan', 'Van', 'Ly', 'Hoa', 'Ngoaingu', 'Su', 'Tin', 'Sinh', 'Dia'] if col in df.columns]
+        if analysis_type == "Điểm thành phần":
+            score_cols = [col for col in analysis.COMPONENT_SCORE_COLS if col in df.columns]
+        else: # Điểm tổng hợp
+            score_cols = [col for col in analysis.SUMMARY_SUBJECT_COLS if col in df.columns]
+
+        # Chọn nhóm so sánh: các cột khóa (không phải cột điểm/mã) của tệp đã tải
+        with st.sidebar:
+            group_options = [analysis.GLOBAL_BASELINE] + [
+                col for col in df.columns if col not in score_cols and col not in ('MaHS', 'STT')
+            ]
+            group_choice = st.selectbox(
+                "So sánh điểm với:",
+                group_options,
+                help="'Toàn bộ tệp': so sánh với trung bình của cả tệp. Chọn một cột (ví dụ 'lop') để so sánh mỗi học sinh với trung bình của nhóm mình, tránh việc lớp mạnh và lớp yếu che lấp lẫn nhau."
+            )
+        group_col = None if group_choice == analysis.GLOBAL_BASELINE else group_choice
+
+        if analysis_type == "Điểm thành phần":
+            # Tệp quy tắc kiểm tra được đọc trước để báo lỗi rõ ràng nếu tệp sai cú pháp
+            try:
+                rules.default_rules()
+            except (rules.RuleError, OSError) as e:
+                st.error(f"Không đọc được tệp quy tắc '{rules.DEFAULT_RULES_PATH}': {e}")
+                st.stop()
+
+        # Tệp mới là bản sửa của tệp vừa phân tích (cùng thiết lập): chỉ tính lại phần thay đổi
+        settings = utils.analysis_settings(analysis_type, group_col, detection_methods)
+        last = st.session_state.get("last_analysis")
+        previous = None
+        if last is not None and last["settings"] == settings and last["fingerprint"] != fingerprint:
+            previous = last["prepared"]
+
+        # Chạy phân tích dựa trên lựa chọn của người dùng. Z-score được tính một lần
+        # cho mỗi (tệp, loại dữ liệu, nhóm so sánh, phương pháp); đổi ngưỡng chỉ lọc lại kết quả.
+        prepared = utils.prepare_analysis(df, fingerprint, analysis_type, group_col, previous, detection_methods)
+        df_anomalies = utils.detect_anomalies(
+            df, fingerprint, analysis_type, z_score_threshold, group_col, previous, detection_methods
+        )
+        st.session_state["last_analysis"] = {"settings": settings, "fingerprint": fingerprint, "prepared": prepared}
+        if show_performance:
+            # Bộ nhớ của bảng điểm, phần Z-score tính sẵn (dùng chung giữa các lượt) và kết quả
+            session_memory = analysis.memory_report(df, prepared, df_anomalies)
 
         st.header("📊 Kết quả Phân tích")
 
+        changes = prepared.changes
+        if changes is not None and previous is not None:
+            st.info(f"🔁 So với tệp trước: {changes.summary()} — phân tích lại {changes.mode} "
+                    f"trong {changes.elapsed_ms:,.0f} ms.")
+            if not changes.is_empty:
+                with st.expander("Các ô điểm đã thay đổi"):
+                    st.dataframe(changes.cells(previous.df, df), hide_index=True, use_container_width=True)
+
+        if prepared.rule_timings is not None:
+            # Số vi phạm và thời gian đánh giá của từng quy tắc kiểm tra
+            with st.expander(f"📐 Quy tắc kiểm tra ({len(prepared.rule_timings)} quy tắc)"):
+                st.dataframe(prepared.rule_timings, hide_index=True, use_container_width=True)
+
         if df_anomalies.empty:
             st.success("🎉 Hoan hô! Không phát hiện thấy điểm bất thường nào với các tham số đã chọn.")
         else:
@@ -75,71 +380,17 @@ if uploaded_file is not None:
             col3.metric("Số Lớp có bất thường", f"{df_anomalies['lop'].nunique()}")
 
             st.markdown("---")
-            
-            # --- Bộ lọc dữ liệu ---
-            st.subheader("Lọc và Tra cứu kết quả")
-            
-            # Tạo các cột để đặt bộ lọc
-            filter_col1, filter_col2, filter_col3 = st.columns([1, 1, 1])
-
-            # Lọc theo lớp
-            unique_classes = sorted(df_anomalies['lop'].unique())
-            selected_classes = filter_col1.multiselect("Lọc theo Lớp:", options=unique_classes, default=unique_classes)
-            
-            # Lọc theo loại bất thường
-            unique_types = sorted(df_anomalies['LoaiBatThuong'].unique())
-            selected_types = filter_col2.multiselect("Lọc theo Loại bất thường:", options=unique_types, default=unique_types)
-            
-            # Lọc theo Mức độ
-            unique_severities = sorted(df_anomalies['MucDo'].unique(), key=lambda x: ['Thấp', 'Trung bình', 'Cao'].index(x))
-            selected_severities = filter_col3.multiselect("Lọc theo Mức độ:", options=unique_severities, default=unique_severities)
-
-            # Áp dụng bộ lọc
-            filtered_anomalies = df_anomalies[
-                (df_anomalies['lop'].isin(selected_classes)) &
-                (df_anomalies['LoaiBatThuong'].isin(selected_types)) &
-                (df_anomalies['MucDo'].isin(selected_severities))
-            ]
-
-            # --- Hiển thị kết quả trong các Tab ---
-            tab1, tab2, tab3 = st.tabs(["📑 Bảng chi tiết", "📈 Trực quan hóa tổng quan", "🔥 Heatmap chi tiết"])
-
-            with tab1:
-                st.write(f"Hiển thị {len(filtered_anomalies)} trên {len(df_anomalies)} kết quả.")
-                st.dataframe(filtered_anomalies, use_container_width=True)
-                
-                # --- Chức năng Xuất báo cáo ---
-                st.subheader("Tải về Báo cáo")
-                
-                # Chuẩn bị dữ liệu cho file Excel
-                excel_data = utils.prepare_excel_download({
-                    "Bất thường đã lọc": filtered_anomalies,
-                    "Tất cả bất thường": df_anomalies,
-                    "Dữ liệu gốc": df
-                })
-                
-                st.download_button(
-                    label="📥 Tải Báo cáo Excel",
-                    data=excel_data,
-                    file_name=f"BaoCao_BatThuong_{analysis_type.replace(' ', '')}.xlsx"
-                )
-
-            with tab2:
-                st.plotly_chart(visualization.plot_anomalies_by_class(filtered_anomalies), use_container_width=True)
-                st.plotly_chart(visualization.plot_anomaly_types(filtered_anomalies), use_container_width=True)
-                
-                selected_column_for_dist = st.selectbox("Chọn cột điểm để xem phân bố:", score_cols)
-                if selected_column_for_dist:
-                    st.plotly_chart(visualization.plot_score_distribution(df, selected_column_for_dist), use_container_width=True)
-
-            with tab3:
-                st.info("Heatmap hiển thị toàn bộ bảng điểm. Các ô có dấu 🔥 là vị trí của các điểm bất thường đã được phát hiện (trước khi lọc).")
-                fig_heatmap = visualization.plot_anomalies_heatmap(df, df_anomalies, score_cols)
-                st.plotly_chart(fig_heatmap, use_container_width=True)
+            show_results(df, df_anomalies, prepared, score_cols, fingerprint, analysis_type, group_col,
+                         z_score_threshold, ", ".join(f.name for f in uploaded_files), detection_methods)
 
 else:
     # --- Màn hình chào mừng và Hướng dẫn ---
     st.info("Vui lòng tải tệp lên từ thanh công cụ bên trái để bắt đầu phân tích.")
+
+    # Xu hướng của các kỳ đã lưu xem được mà không cần tải lại tệp cũ
+    if not history.default_store().periods(utils.ANALYSIS_KINDS[analysis_type]).empty:
+        with st.expander("📅 Xu hướng theo kỳ", expanded=True):
+            show_history_trends(analysis_type)
     
     with st.expander("📖 Hướng dẫn và Tải file mẫu"):
         st.write("""
@@ -171,3 +422,9 @@ else:
                 )
         except FileNotFoundError:
             st.error("Lỗi: Không tìm thấy tệp 'diemtonghop_mau.csv'. Vui lòng đảm bảo tệp tồn tại trong thư mục 'assets'.")
+
+# --- 5. Hiệu năng của lượt chạy (điền vào thanh bên sau khi mọi bước đã chạy) ---
+if show_performance:
+    performance_placeholder.dataframe(profiling.records_frame(performance_records), hide_index=True)
+    if session_memory is not None:
+        memory_placeholder.dataframe(session_memory, hide_index=True)
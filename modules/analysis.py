@@ -1,21 +1,640 @@
 # modules/analysis.py
 
+import math
+from dataclasses import dataclass
+
 import pandas as pd
 import numpy as np
 
+from modules import profiling, rules
+
+# Các cột điểm được hỗ trợ cho từng loại tệp
+COMPONENT_SCORE_COLS = ['TX1', 'TX2', 'TX3', 'GK', 'CK']
+SUMMARY_SUBJECT_COLS = ['Toan', 'Van', 'Ly', 'Hoa', 'Ngoaingu', 'Su', 'Tin', 'Sinh', 'Dia']
+
+# Danh mục cố định của các cột phân loại trong bảng kết quả. Các detector lưu
+# mã số nguyên của danh mục này (pd.Categorical) thay vì lặp lại chuỗi tiếng Việt.
+ANOMALY_TYPES = (
+    "Điểm cao bất thường",
+    "Điểm thấp bất thường",
+    "Môn có điểm lệch cao",
+    "Môn có điểm lệch thấp",
+    "Thiếu dữ liệu",
+    "Trùng dãy điểm",
+    "Gần trùng dãy điểm",
+    "Hồ sơ điểm bất thường",
+    "Vi phạm quy tắc",
+    "Điểm cao bất thường (trung vị/MAD)",
+    "Điểm thấp bất thường (trung vị/MAD)",
+    "Điểm cao ngoài hàng rào IQR",
+    "Điểm thấp ngoài hàng rào IQR",
+    "Môn có điểm lệch cao (trung vị/MAD)",
+    "Môn có điểm lệch thấp (trung vị/MAD)",
+    "Môn lệch cao ngoài hàng rào IQR",
+    "Môn lệch thấp ngoài hàng rào IQR",
+)
+SEVERITY_LEVELS = ("Thấp", "Trung bình", "Cao")
+
+# Mẫu câu giải thích cho từng loại bất thường. Câu giải thích chỉ được tạo
+# khi hiển thị hoặc xuất báo cáo (xem `format_anomalies`).
+EXPLANATION_TEMPLATES = {
+    "Điểm cao bất thường": "Điểm {value} ở cột '{col}' cao hơn đáng kể so với trung bình {baseline} ({mean:.2f}).",
+    "Điểm thấp bất thường": "Điểm {value} ở cột '{col}' thấp hơn đáng kể so với trung bình {baseline} ({mean:.2f}).",
+    "Môn có điểm lệch cao": (
+        "Điểm môn '{col}' ({value}) cao hơn hẳn so với năng lực chung của học sinh này "
+        "(trung bình các môn: {mean:.2f})."
+    ),
+    "Môn có điểm lệch thấp": (
+        "Điểm môn '{col}' ({value}) thấp hơn hẳn so với năng lực chung của học sinh này "
+        "(trung bình các môn: {mean:.2f})."
+    ),
+    "Thiếu dữ liệu": "Học sinh này bị thiếu điểm ở cột '{col}'.",
+    "Trùng dãy điểm": "Dãy điểm của học sinh này giống hệt các học sinh trong {baseline}.",
+    "Gần trùng dãy điểm": (
+        "Dãy điểm của học sinh này gần như giống hệt (chỉ khác ở số ít ô điểm) các học sinh trong {baseline}."
+    ),
+    "Hồ sơ điểm bất thường": (
+        "Tổng thể các điểm của học sinh này không phù hợp với tương quan điểm của {baseline} "
+        "(Z tương đương {z:.2f}); lệch nhiều nhất ở cột '{col}' ({value}, trung bình {mean:.2f})."
+    ),
+    "Vi phạm quy tắc": "Vi phạm quy tắc kiểm tra: {baseline}.",
+    "Điểm cao bất thường (trung vị/MAD)": (
+        "Điểm {value} ở cột '{col}' cao hơn đáng kể so với trung vị {baseline} ({mean:.2f}); Z cải tiến {z:.2f}."
+    ),
+    "Điểm thấp bất thường (trung vị/MAD)": (
+        "Điểm {value} ở cột '{col}' thấp hơn đáng kể so với trung vị {baseline} ({mean:.2f}); Z cải tiến {z:.2f}."
+    ),
+    "Điểm cao ngoài hàng rào IQR": (
+        "Điểm {value} ở cột '{col}' vượt hàng rào trên của khoảng tứ phân vị {baseline} "
+        "(giữa Q1 và Q3: {mean:.2f}; Z tương đương {z:.2f})."
+    ),
+    "Điểm thấp ngoài hàng rào IQR": (
+        "Điểm {value} ở cột '{col}' dưới hàng rào dưới của khoảng tứ phân vị {baseline} "
+        "(giữa Q1 và Q3: {mean:.2f}; Z tương đương {z:.2f})."
+    ),
+    "Môn có điểm lệch cao (trung vị/MAD)": (
+        "Điểm môn '{col}' ({value}) cao hơn hẳn so với năng lực chung của học sinh này "
+        "(trung vị các môn: {mean:.2f}; Z cải tiến {z:.2f})."
+    ),
+    "Môn có điểm lệch thấp (trung vị/MAD)": (
+        "Điểm môn '{col}' ({value}) thấp hơn hẳn so với năng lực chung của học sinh này "
+        "(trung vị các môn: {mean:.2f}; Z cải tiến {z:.2f})."
+    ),
+    "Môn lệch cao ngoài hàng rào IQR": (
+        "Điểm môn '{col}' ({value}) vượt hàng rào trên của khoảng tứ phân vị các môn của học sinh này "
+        "(giữa Q1 và Q3: {mean:.2f}; Z tương đương {z:.2f})."
+    ),
+    "Môn lệch thấp ngoài hàng rào IQR": (
+        "Điểm môn '{col}' ({value}) dưới hàng rào dưới của khoảng tứ phân vị các môn của học sinh này "
+        "(giữa Q1 và Q3: {mean:.2f}; Z tương đương {z:.2f})."
+    ),
+}
+
+# Nhãn nhóm tham chiếu khi so sánh với toàn bộ tệp / với chính học sinh
+GLOBAL_BASELINE = "Toàn bộ tệp"
+PERSONAL_BASELINE = "Cá nhân"
+
+# Các phương pháp phát hiện điểm lệch (xem `ScoreStatistics`), mỗi phương pháp là
+# một cặp (tâm, thang đo) và Z = (điểm - tâm) / thang đo:
+# - "zscore": trung bình / độ lệch chuẩn (bị chính các điểm lệch kéo theo);
+# - "mad": trung vị / (MAD_SCALE * MAD) — Z cải tiến; khi MAD = 0 (hơn nửa số điểm
+#   bằng nhau) dùng MEANAD_SCALE * trung bình độ lệch tuyệt đối so với trung vị;
+# - "iqr": điểm giữa Q1, Q3 / (IQR / IQR_SCALE), nên |Z| > ngưỡng t đúng bằng điểm nằm
+#   ngoài hàng rào [Q1 - k*IQR, Q3 + k*IQR] với k = t / IQR_SCALE - 0.5 (t = 2.7 ứng với k = 1.5).
+# Với dữ liệu phân phối chuẩn, ba thang đo đều ước lượng độ lệch chuẩn nên dùng chung ngưỡng.
+DETECTION_METHODS = {
+    "zscore": "Z-score (trung bình / độ lệch chuẩn)",
+    "mad": "Trung vị / MAD (Z cải tiến)",
+    "iqr": "Hàng rào tứ phân vị (IQR)",
+}
+DEFAULT_DETECTION_METHODS = ("zscore",)
+MAD_SCALE = 1.4826
+MEANAD_SCALE = 1.2533
+IQR_SCALE = 1.349
+# Số điểm tối thiểu để tính tứ phân vị/MAD của một nhóm hoặc một học sinh
+ROBUST_MIN_COUNT = 3
+# Loại bất thường (điểm cao, điểm thấp) của từng (kiểu so sánh, phương pháp);
+# kiểu so sánh là False khi so giữa các học sinh, True khi so giữa các môn của một học sinh
+DETECTION_TYPES = {
+    (False, "zscore"): ("Điểm cao bất thường", "Điểm thấp bất thường"),
+    (False, "mad"): ("Điểm cao bất thường (trung vị/MAD)", "Điểm thấp bất thường (trung vị/MAD)"),
+    (False, "iqr"): ("Điểm cao ngoài hàng rào IQR", "Điểm thấp ngoài hàng rào IQR"),
+    (True, "zscore"): ("Môn có điểm lệch cao", "Môn có điểm lệch thấp"),
+    (True, "mad"): ("Môn có điểm lệch cao (trung vị/MAD)", "Môn có điểm lệch thấp (trung vị/MAD)"),
+    (True, "iqr"): ("Môn lệch cao ngoài hàng rào IQR", "Môn lệch thấp ngoài hàng rào IQR"),
+}
+
+# Các cột nội bộ của bảng kết quả, không hiển thị cho người dùng
+INTERNAL_COLUMNS = ["ViTriDong"]
+
+# Cột tệp nguồn của từng học sinh khi nhiều tệp được gộp lại (xem ingest.merge_tables);
+# nếu có trong bảng điểm thì được chép sang bảng kết quả
+SOURCE_COLUMN = "TepNguon"
+
+# Cột điểm được lưu dạng float32 nếu làm tròn giá trị float32 đến SCORE_DECIMALS
+# chữ số thập phân cho lại đúng giá trị float64 đã đọc (ví dụ 7.8 -> 7.80000019 -> 7.8)
+SCORE_DECIMALS = 4
+# Z-score tính sẵn được lưu dạng float16 (sai số tương đối tối đa 2^-11): khi lọc
+# theo ngưỡng, các ô ứng viên được chọn với ngưỡng nới lỏng Z_CANDIDATE_TOLERANCE
+# rồi tính lại chính xác ở float64
+Z_DTYPE = np.float16
+Z_CANDIDATE_TOLERANCE = 1e-3
+
+# Phát hiện dãy điểm trùng lặp (xem `detect_duplicate_score_vectors`): điểm được
+# làm tròn đến DUPLICATE_DECIMALS chữ số trước khi so sánh; hai học sinh chỉ được
+# xem là trùng khi có ít nhất DUPLICATE_MIN_SCORES điểm giống nhau; khối ứng viên
+# gần trùng lớn hơn DUPLICATE_MAX_BUCKET là mẫu điểm phổ biến và được bỏ qua
+DUPLICATE_DECIMALS = 2
+DUPLICATE_MIN_SCORES = 5
+DUPLICATE_MAX_DIFF = 1
+DUPLICATE_MAX_BUCKET = 64
+# Số MaHS tối đa được liệt kê trong nhãn của một nhóm trùng
+DUPLICATE_LABEL_IDS = 5
+
+# Phân bố điểm tính sẵn cho biểu đồ (xem `score_distribution`): số khoảng của
+# histogram và hệ số IQR của râu biểu đồ hộp (như Plotly)
+DISTRIBUTION_BINS = 20
+DISTRIBUTION_WHISKER_IQR = 1.5
+
+# Phát hiện đa biến (xem `compute_mahalanobis_scores`): ma trận hiệp phương sai
+# của mỗi nhóm được co về ma trận chung của các nhóm với trọng số
+# MAHALANOBIS_PRIOR_WEIGHT / (số học sinh của nhóm + MAHALANOBIS_PRIOR_WEIGHT)
+MAHALANOBIS_GROUP_COL = 'lop'
+MAHALANOBIS_PRIOR_WEIGHT = 20
+MAHALANOBIS_MIN_SCORES = 3
+MAHALANOBIS_MIN_GROUP_SIZE = 3
+# Trị riêng nhỏ nhất được giữ, tính theo tỷ lệ với trị riêng trung bình
+MAHALANOBIS_EIGEN_FLOOR = 1e-3
+# Số hàng xử lý mỗi lần khi tính khoảng cách (giới hạn bộ nhớ của mảng số hàng x k x k)
+MAHALANOBIS_CHUNK_ROWS = 65_536
+
+def _decode_scores(values):
+    """Giá trị float64 chính xác của một mảng điểm float32 (xem `compact_scores`)."""
+    return np.round(values.astype(np.float64), SCORE_DECIMALS)
+
+def _column_values(series):
+    """Cột điểm dạng mảng float64 (giá trị không phải số thành NaN)."""
+    numeric = pd.to_numeric(series, errors='coerce')
+    if numeric.dtype == np.float32:
+        return _decode_scores(numeric.to_numpy())
+    return numeric.to_numpy(dtype=float, na_value=np.nan)
+
+def score_matrix(df, score_cols):
+    """
+    Ma trận điểm float64 (số hàng x số cột) của các cột `score_cols`, với giá trị
+    đúng như khi đọc từ tệp kể cả khi cột được lưu dạng float32.
+    """
+    if not len(score_cols):
+        return np.empty((len(df), 0))
+    return np.column_stack([_column_values(df[col]) for col in score_cols])
+
+def compact_scores(df, score_cols=None):
+    """
+    Lưu các cột điểm float64 dưới dạng float32 (một nửa bộ nhớ) khi việc này
+    không làm mất giá trị nào (xem SCORE_DECIMALS); cột không đạt được giữ nguyên.
+
+    Args:
+        df (pd.DataFrame): Bảng điểm, được sửa trực tiếp.
+        score_cols (list, optional): Mặc định là mọi cột điểm đã biết có trong bảng.
+
+    Returns:
+        pd.DataFrame: Chính `df`.
+    """
+    if score_cols is None:
+        score_cols = [col for col in COMPONENT_SCORE_COLS + SUMMARY_SUBJECT_COLS if col in df.columns]
+    for col in score_cols:
+        if df[col].dtype != np.float64:
+            continue
+        values = df[col].to_numpy()
+        compact = values.astype(np.float32)
+        if np.array_equal(_decode_scores(compact), values, equal_nan=True):
+            df[col] = compact
+    return df
+
+def restore_scores(df, score_cols=None):
+    """
+    Bản sao của `df` với các cột điểm float32 được đưa về float64 chính xác, dùng
+    khi xuất dữ liệu gốc (để không ghi ra 7.800000190734863).
+    """
+    if score_cols is None:
+        score_cols = [col for col in COMPONENT_SCORE_COLS + SUMMARY_SUBJECT_COLS if col in df.columns]
+    compact_cols = [col for col in score_cols if df[col].dtype == np.float32]
+    if not compact_cols:
+        return df
+    out = df.copy()
+    for col in compact_cols:
+        out[col] = _decode_scores(out[col].to_numpy())
+    return out
+
+def parse_threshold(value):
+    """
+    Đọc ngưỡng Z-score (chuỗi hoặc số) do người dùng hay hệ thống khác gửi vào.
+
+    Raises:
+        ValueError: Nếu ngưỡng không phải là số hữu hạn lớn hơn 0 (ngưỡng âm,
+            bằng 0 hoặc NaN làm mọi điểm đều thành bất thường hoặc không điểm nào).
+    """
+    try:
+        threshold = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Ngưỡng Z-score phải là số, nhận được '{value}'.") from None
+    if not (math.isfinite(threshold) and threshold > 0):
+        raise ValueError(f"Ngưỡng Z-score phải là số hữu hạn lớn hơn 0, nhận được '{value}'.")
+    return threshold
+
 def assign_severity(z_score, threshold):
     """
     Gán nhãn mức độ bất thường (Cao, Trung bình, Thấp) dựa trên Z-score.
+
+    Nhận một số hoặc một mảng Z-score; với mảng, kết quả là mảng nhãn tương ứng
+    (tính bằng `np.select`, không duyệt từng phần tử).
+    """
+    labels = np.asarray(SEVERITY_LEVELS, dtype=object)[_severity_codes(z_score, threshold)]
+    return labels.item() if np.ndim(z_score) == 0 else labels
+
+def _severity_codes(z_scores, threshold):
+    """
+    Mã mức độ (chỉ số trong SEVERITY_LEVELS) cho một số hoặc một mảng Z-score.
+    """
+    abs_z = np.abs(z_scores)
+    return np.select(
+        [abs_z > threshold + 1.0, abs_z > threshold + 0.5],
+        [SEVERITY_LEVELS.index("Cao"), SEVERITY_LEVELS.index("Trung bình")],
+        default=SEVERITY_LEVELS.index("Thấp"),
+    )
+
+def _build_anomaly_frame(df, row_idx, col_idx, score_cols, values, z_scores, means, type_codes, severity_codes,
+                         stds=None, baselines=None):
+    """
+    Dựng bảng kết quả dạng cột từ các mảng chỉ số, không tạo dict cho từng bất thường.
+
+    Args:
+        df (pd.DataFrame): DataFrame gốc (để lấy MaHS, lop và TepNguon nếu có).
+        row_idx (np.ndarray): Vị trí hàng (0..n-1) của từng bất thường.
+        col_idx (np.ndarray): Mã cột điểm (chỉ số trong score_cols).
+        score_cols (list): Danh sách cột điểm, dùng làm danh mục của CotDiem.
+        values, z_scores, means (np.ndarray): Điểm, Z-score và trung bình tham chiếu.
+        type_codes, severity_codes (np.ndarray): Mã trong ANOMALY_TYPES, SEVERITY_LEVELS.
+        stds (np.ndarray, optional): Độ lệch chuẩn tham chiếu.
+        baselines (np.ndarray, optional): Nhãn nhóm tham chiếu của từng bất thường.
+
+    Returns:
+        pd.DataFrame: Bảng bất thường với các cột phân loại dạng category.
+    """
+    n = len(row_idx)
+    if stds is None:
+        stds = np.full(n, np.nan)
+    if baselines is None:
+        baselines = np.full(n, None, dtype=object)
+    source = {SOURCE_COLUMN: df[SOURCE_COLUMN].array.take(row_idx)} if SOURCE_COLUMN in df.columns else {}
+    return pd.DataFrame({
+        **source,
+        # Chỉ lấy các hàng cần thiết, không chuyển cả cột sang mảng object
+        "MaHS": df["MaHS"].array.take(row_idx) if "MaHS" in df.columns else np.full(n, "N/A"),
+        "lop": df["lop"].array.take(row_idx) if "lop" in df.columns else np.full(n, "N/A"),
+        "CotDiem": pd.Categorical.from_codes(col_idx, categories=list(score_cols)),
+        "DiemBatThuong": np.asarray(values, dtype=float),
+        "LoaiBatThuong": pd.Categorical.from_codes(type_codes, categories=list(ANOMALY_TYPES)),
+        "MucDo": pd.Categorical.from_codes(severity_codes, categories=list(SEVERITY_LEVELS), ordered=True),
+        "ZScore": np.asarray(z_scores, dtype=float),
+        "TrungBinhThamChieu": np.asarray(means, dtype=float),
+        "DoLechChuanThamChieu": np.asarray(stds, dtype=float),
+        "NhomThamChieu": baselines,
+        "ViTriDong": np.asarray(row_idx, dtype=np.int32),
+    })
+
+def _empty_anomaly_frame(df, score_cols):
+    """Bảng kết quả rỗng nhưng giữ đúng cấu trúc cột."""
+    empty = np.array([], dtype=np.int64)
+    return _build_anomaly_frame(df, empty, empty, score_cols, empty, empty, empty, empty, empty)
+
+@profiling.profiled()
+def format_anomalies(df_anomalies, drop_internal=True):
+    """
+    Chuẩn bị bảng bất thường để hiển thị hoặc xuất báo cáo: tạo cột GiaiThich
+    từ mẫu câu, ghi "Bị trống" cho ô thiếu điểm và bỏ các cột nội bộ.
+
+    Chỉ gọi hàm này cho các dòng thực sự được hiển thị/xuất, để tránh tạo
+    hàng chục nghìn chuỗi giải thích không ai xem.
+
+    Args:
+        df_anomalies (pd.DataFrame): Bảng kết quả từ các hàm phân tích.
+        drop_internal (bool): Bỏ các cột nội bộ (INTERNAL_COLUMNS) hay không.
+
+    Returns:
+        pd.DataFrame: Bảng mới với cột GiaiThich và DiemBatThuong dạng văn bản.
+    """
+    out = df_anomalies.drop(columns=INTERNAL_COLUMNS, errors='ignore') if drop_internal else df_anomalies.copy()
+    if out.empty:
+        return out
+
+    types = out["LoaiBatThuong"].astype(str).to_numpy()
+    cols = out["CotDiem"].astype(str).to_numpy()
+    values = out["DiemBatThuong"].to_numpy(dtype=float)
+    means = out["TrungBinhThamChieu"].to_numpy(dtype=float)
+    z_scores = out["ZScore"].to_numpy(dtype=float)
+    # So với toàn bộ tệp giữ cách diễn đạt cũ ("trung bình lớp"); với quy tắc
+    # kiểm tra, NhomThamChieu là tên quy tắc
+    baselines = [
+        b if t == "Vi phạm quy tắc" else "lớp" if pd.isna(b) or b == GLOBAL_BASELINE else f"nhóm {b}"
+        for t, b in zip(types, out["NhomThamChieu"].tolist())
+    ]
+
+    missing = np.isnan(values) & (types == "Thiếu dữ liệu")
+    out["DiemBatThuong"] = np.where(missing, "Bị trống", np.where(np.isnan(values), None, values.astype(object)))
+    out["GiaiThich"] = [
+        EXPLANATION_TEMPLATES[t].format(value=v, col=c, mean=m, baseline=b, z=z)
+        for t, v, c, m, b, z in zip(types, values.tolist(), cols, means.tolist(), baselines, z_scores.tolist())
+    ]
+    # Giữ thứ tự cột quen thuộc: GiaiThich ngay sau MucDo
+    columns = list(out.columns)
+    columns.remove("GiaiThich")
+    columns.insert(columns.index("MucDo") + 1, "GiaiThich")
+    return out[columns]
+
+@dataclass
+class ZScoreMatrix:
+    """
+    Z-score của toàn bộ bảng điểm cho một kiểu so sánh. Các giá trị này không
+    phụ thuộc vào ngưỡng, nên chỉ cần tính một lần cho mỗi bộ dữ liệu; đổi
+    ngưỡng chỉ là lọc lại bằng mặt nạ (xem `_anomalies_from_zscores`).
+
+    Ma trận Z-score được lưu dạng Z_DTYPE và thống kê tham chiếu chỉ lưu một
+    dòng cho mỗi nhóm (không lặp lại cho từng học sinh); Z-score của các ô vượt
+    ngưỡng được tính lại ở float64 nên kết quả không đổi.
+    """
+    z_scores: np.ndarray        # Z-score dạng Z_DTYPE (số hàng x số cột), NaN nếu không đủ dữ liệu
+    means: np.ndarray           # Trung bình tham chiếu (số nhóm x số cột, hoặc số nhóm x 1)
+    stds: np.ndarray            # Độ lệch chuẩn tham chiếu (cùng kích thước với means), 0 thay bằng NaN
+    group_codes: np.ndarray     # Dòng trong means của từng hàng; None nếu chỉ có một nhóm hoặc mỗi hàng một dòng
+    baseline_labels: np.ndarray # Nhãn của từng dòng trong means (hoặc một nhãn chung)
+    high_type: str              # Loại bất thường khi Z > 0
+    low_type: str               # Loại bất thường khi Z < 0
+    column_major: bool          # Thứ tự kết quả: theo cột rồi hàng, hay ngược lại
+
+    def baseline_index(self, row_idx, col_idx):
+        """Vị trí (dòng, cột) trong means/stds của các ô (row_idx, col_idx)."""
+        if self.group_codes is not None:
+            stat_rows = self.group_codes[row_idx]
+        elif len(self.means) == 1:
+            stat_rows = np.zeros_like(row_idx)
+        else:
+            stat_rows = row_idx
+        stat_cols = col_idx if self.means.shape[1] > 1 else np.zeros_like(col_idx)
+        return stat_rows, stat_cols
+
+    def labels(self, stat_rows):
+        """Nhãn nhóm tham chiếu ứng với các dòng `stat_rows` của means."""
+        if len(self.baseline_labels) == len(self.means):
+            return self.baseline_labels[stat_rows]
+        return np.full(len(stat_rows), self.baseline_labels[0], dtype=object)
+
+    @property
+    def nbytes(self):
+        arrays = (self.z_scores, self.means, self.stds, self.group_codes, self.baseline_labels)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+@dataclass
+class ScoreStatistics:
+    """
+    Thống kê tham chiếu của một kiểu so sánh, tính một lần cho cả bảng điểm và
+    dùng chung cho mọi phương pháp phát hiện (DETECTION_METHODS): trung bình và
+    độ lệch chuẩn cho Z-score; tứ phân vị, trung vị và MAD cho các phương pháp
+    bền vững. Mỗi phương pháp chỉ lấy một cặp (tâm, thang đo) từ các mảng này
+    (`baseline`), nên chạy thêm phương pháp chỉ tốn thêm một phép chia ma trận.
+
+    Các mảng có một dòng cho mỗi nhóm (so sánh giữa các học sinh, một cột cho
+    mỗi cột điểm) hoặc cho mỗi học sinh (so sánh giữa các môn, một cột chung).
+    """
+    personal: bool              # True: so sánh giữa các môn của chính học sinh
+    means: np.ndarray           # Trung bình (NaN nếu không đủ điểm)
+    stds: np.ndarray            # Độ lệch chuẩn ddof=1 (NaN nếu không đủ điểm)
+    group_codes: np.ndarray     # Như ZScoreMatrix.group_codes
+    baseline_labels: np.ndarray # Như ZScoreMatrix.baseline_labels
+    q1: np.ndarray = None       # Tứ phân vị, trung vị, MAD: None nếu không cần phương pháp bền vững
+    medians: np.ndarray = None
+    q3: np.ndarray = None
+    mads: np.ndarray = None     # Thang đo của Z cải tiến (MAD_SCALE * MAD, hoặc MEANAD_SCALE * MeanAD khi MAD = 0)
+
+    def baseline(self, method):
+        """Cặp (tâm, thang đo) của phương pháp `method`; thang đo bằng 0 thay bằng NaN."""
+        if method == "zscore":
+            centre, scale = self.means, self.stds
+        elif method == "mad":
+            centre, scale = self.medians, self.mads
+        elif method == "iqr":
+            centre, scale = (self.q1 + self.q3) / 2, (self.q3 - self.q1) / IQR_SCALE
+        else:
+            raise ValueError(f"Phương pháp phát hiện không hợp lệ: '{method}'.")
+        if centre is None:
+            raise ValueError(f"Chưa tính thống kê bền vững cho phương pháp '{method}'.")
+        # Tránh trường hợp thang đo bằng 0 (khi tất cả các điểm giống nhau)
+        return centre, np.where(scale == 0, np.nan, scale)
+
+    def zscore_matrix(self, values, method="zscore"):
+        """
+        Ma trận Z-score của phương pháp `method` cho ma trận điểm `values` (ma
+        trận đã dùng để tính các thống kê này).
+        """
+        centre, scale = self.baseline(method)
+        # Z-score cho toàn bộ ma trận; nhóm/học sinh không đủ dữ liệu giữ NaN
+        rows = slice(None) if self.group_codes is None else self.group_codes
+        z_scores = ((values - centre[rows]) / scale[rows]).astype(Z_DTYPE)
+        high_type, low_type = DETECTION_TYPES[(self.personal, method)]
+        return ZScoreMatrix(
+            z_scores, centre, scale, self.group_codes, self.baseline_labels, high_type, low_type,
+            # So giữa các môn: giữ nguyên thứ tự kết quả như khi duyệt từng học sinh
+            column_major=not self.personal,
+        )
+
+    @property
+    def nbytes(self):
+        arrays = (self.means, self.stds, self.group_codes, self.baseline_labels, self.q1, self.medians, self.q3,
+                  self.mads)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+def _segment_quantile(sorted_values, starts, sizes, q):
+    """
+    Phân vị `q` (nội suy tuyến tính như np.percentile) của từng đoạn
+    sorted_values[starts:starts + sizes] đã sắp xếp tăng dần; NaN nếu đoạn rỗng.
+    """
+    if len(sorted_values) == 0:
+        # Không có điểm nào (ví dụ tệp mẫu với các cột điểm để trống)
+        return np.full(len(sizes), np.nan)
+    last = np.maximum(sizes, 1) - 1
+    position = q * last
+    low = np.floor(position).astype(np.int64)
+    frac = position - low
+    limit = len(sorted_values) - 1
+    lo = sorted_values[np.minimum(starts + low, limit)]
+    hi = sorted_values[np.minimum(starts + np.minimum(low + 1, last), limit)]
+    return np.where(sizes > 0, lo + frac * (hi - lo), np.nan)
+
+def _segment_order(segments, values):
+    """
+    Thứ tự sắp xếp theo (đoạn, giá trị) bằng một lần argsort trên khóa
+    đoạn * span + giá trị (như khóa đầu râu trong `_sorted_group_stats`),
+    nhanh hơn nhiều so với np.lexsort trên hai khóa.
+    """
+    if len(values) == 0:
+        return np.array([], dtype=np.intp)
+    low = values.min()
+    span = values.max() - low + 1.0
+    return np.argsort(segments * span + (values - low))
+
+def _robust_scale(sorted_devs, starts, sizes):
+    """Thang đo của Z cải tiến từ độ lệch tuyệt đối so với trung vị (đã sắp xếp theo đoạn)."""
+    mads = MAD_SCALE * _segment_quantile(sorted_devs, starts, sizes, 0.5)
+    # MAD = 0 khi hơn nửa số điểm bằng nhau: dùng trung bình độ lệch tuyệt đối
+    segments = np.repeat(np.arange(len(sizes)), sizes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_devs = np.bincount(segments, weights=sorted_devs, minlength=len(sizes)) / sizes
+    return np.where(mads == 0, MEANAD_SCALE * mean_devs, mads)
+
+def _grouped_robust_statistics(values, group_codes, n_groups):
+    """
+    Tứ phân vị, trung vị và thang đo MAD của mọi (nhóm, cột điểm) trong một lần
+    sắp xếp toàn bộ ma trận theo (nhóm, cột, điểm), cộng một lần sắp xếp độ
+    lệch tuyệt đối cho MAD; các giá trị được lấy từ điểm gốc nên không có sai số
+    làm tròn của khóa sắp xếp. Nhóm có dưới ROBUST_MIN_COUNT điểm nhận NaN.
+
+    Returns:
+        tuple: (q1, medians, q3, mads), mỗi mảng có kích thước số nhóm x số cột.
+    """
+    n_cols = values.shape[1]
+    observed = ~np.isnan(values)
+    row_idx, col_idx = np.nonzero(observed)
+    # Mỗi (nhóm, cột) là một đoạn liên tiếp sau khi sắp xếp
+    segments = group_codes[row_idx].astype(np.int64) * n_cols + col_idx
+    cell_values = values[row_idx, col_idx]
+    order = _segment_order(segments, cell_values)
+    sorted_values, segments = cell_values[order], segments[order]
+    sizes = np.bincount(segments, minlength=n_groups * n_cols)
+    starts = np.cumsum(sizes) - sizes
+
+    q1, medians, q3 = (_segment_quantile(sorted_values, starts, sizes, q) for q in (0.25, 0.5, 0.75))
+    devs = np.abs(sorted_values - medians[segments])
+    mads = _robust_scale(devs[_segment_order(segments, devs)], starts, sizes)
+    too_few = sizes < ROBUST_MIN_COUNT
+    shape = (n_groups, n_cols)
+    return tuple(np.where(too_few, np.nan, a).reshape(shape) for a in (q1, medians, q3, mads))
+
+def _rowwise_robust_statistics(values, min_count=ROBUST_MIN_COUNT):
+    """
+    Tứ phân vị, trung vị và thang đo MAD theo từng hàng của ma trận điểm (mỗi
+    hàng sắp xếp riêng, NaN dồn về cuối). Hàng có dưới `min_count` điểm nhận NaN.
+
+    Returns:
+        tuple: (q1, medians, q3, mads), mỗi mảng có kích thước số hàng x 1.
+    """
+    n_rows, n_cols = values.shape
+    sizes = (~np.isnan(values)).sum(axis=1)
+    starts = np.arange(n_rows, dtype=np.int64) * n_cols
+    sorted_values = np.sort(values, axis=1).ravel()
+    q1, medians, q3 = (_segment_quantile(sorted_values, starts, sizes, q) for q in (0.25, 0.5, 0.75))
+    # Độ lệch tuyệt đối so với trung vị của hàng; ô trống (NaN) vẫn ở cuối hàng và
+    # được cắt bỏ để các hàng thành các đoạn liên tiếp
+    sorted_devs = np.sort(np.abs(values - medians[:, None]), axis=1)
+    packed = sorted_devs[np.arange(n_cols) < sizes[:, None]]
+    mads = _robust_scale(packed, np.cumsum(sizes) - sizes, sizes)
+    too_few = sizes < min_count
+    return tuple(np.where(too_few, np.nan, a)[:, None] for a in (q1, medians, q3, mads))
+
+@profiling.profiled()
+def compute_score_statistics(df, score_cols, group_col=None, personal=False, robust=True, values=None):
+    """
+    Tính `ScoreStatistics` của bảng điểm trong một lượt NumPy.
+
+    Args:
+        df (pd.DataFrame): DataFrame chứa dữ liệu điểm (và cột nhóm).
+        score_cols (list): Danh sách các cột điểm.
+        group_col (str, optional): Cột chia nhóm khi so sánh giữa các học sinh.
+        personal (bool): So sánh giữa các môn của chính học sinh (bỏ qua group_col).
+        robust (bool): Tính cả tứ phân vị và MAD (cho các phương pháp "mad", "iqr").
+        values (np.ndarray, optional): Ma trận điểm đã đọc (`score_matrix`), để
+            không phải giải mã lại.
+
+    Returns:
+        ScoreStatistics: Thống kê tham chiếu.
+    """
+    if values is None:
+        values = score_matrix(df, score_cols)
+    if personal:
+        # Cần ít nhất 3 môn để phân tích có ý nghĩa
+        means, stds = _rowwise_nanmean_nanstd(values, min_count=3)
+        stats = ScoreStatistics(True, means[:, None], stds[:, None], None,
+                                np.array([PERSONAL_BASELINE], dtype=object))
+        if robust:
+            stats.q1, stats.medians, stats.q3, stats.mads = _rowwise_robust_statistics(values)
+        return stats
+
+    numeric_df = pd.DataFrame(values, columns=score_cols)
+    means, stds, group_codes, group_labels = _inter_student_baselines(numeric_df, df, group_col)
+    stats = ScoreStatistics(False, means, stds, group_codes, group_labels)
+    if robust:
+        codes = np.zeros(len(values), dtype=np.int32) if group_codes is None else group_codes
+        stats.q1, stats.medians, stats.q3, stats.mads = _grouped_robust_statistics(values, codes, len(means))
+    return stats
+
+@profiling.profiled()
+def compute_inter_student_zscores(df, score_cols, group_col=None, method="zscore"):
+    """
+    Tính Z-score Inter-student (so với toàn tệp hoặc với nhóm) cho mọi ô điểm.
+
+    Args:
+        df (pd.DataFrame): DataFrame chứa dữ liệu điểm.
+        score_cols (list): Danh sách các cột điểm cần phân tích.
+        group_col (str, optional): Cột dùng để chia nhóm so sánh.
+        method (str): Phương pháp phát hiện (khóa của DETECTION_METHODS).
+
+    Returns:
+        ZScoreMatrix: Ma trận Z-score và các giá trị tham chiếu.
+    """
+    # Chỉ xử lý trên các cột có kiểu dữ liệu số
+    values = score_matrix(df, score_cols)
+    stats = compute_score_statistics(df, score_cols, group_col, robust=method != "zscore", values=values)
+    return stats.zscore_matrix(values, method)
+
+def _cell_values(df, score_cols, row_idx, col_idx):
+    """Điểm (float64 như khi đọc từ tệp) tại các ô (row_idx, col_idx), đọc theo từng cột."""
+    values = np.empty(len(row_idx))
+    for j in np.unique(col_idx):
+        cells = col_idx == j
+        values[cells] = _column_values(df[score_cols[j]].iloc[row_idx[cells]])
+    return values
+
+def _anomalies_from_zscores(df, score_cols, zm, z_thresh):
+    """
+    Lọc các ô có |Z| vượt ngưỡng từ ma trận Z-score đã tính sẵn và dựng bảng kết quả.
+
+    Mặt nạ trên Z-score tính sẵn (với ngưỡng nới lỏng) cho ra tập ô ứng viên; Z-score của các
+    ô này được tính lại ở float64 từ điểm gốc và thống kê tham chiếu, rồi mới so
+    với ngưỡng, nên kết quả giống hệt khi lưu toàn bộ ma trận ở float64.
     """
-    abs_z = abs(z_score)
-    if abs_z > threshold + 1.0:
-        return "Cao"
-    elif abs_z > threshold + 0.5:
-        return "Trung bình"
+    candidate_mask = np.abs(zm.z_scores) >= Z_DTYPE(z_thresh * (1 - Z_CANDIDATE_TOLERANCE))
+    if zm.column_major:
+        col_idx, row_idx = np.nonzero(candidate_mask.T)
     else:
-        return "Thấp"
+        row_idx, col_idx = np.nonzero(candidate_mask)
 
-def detect_inter_student_anomalies(df, score_cols, z_thresh):
+    values = _cell_values(df, score_cols, row_idx, col_idx)
+    stat_rows, stat_cols = zm.baseline_index(row_idx, col_idx)
+    means = zm.means[stat_rows, stat_cols]
+    stds = zm.stds[stat_rows, stat_cols]
+    z = (values - means) / stds
+
+    keep = np.abs(z) > z_thresh
+    row_idx, col_idx, values, means, stds, z, stat_rows = (
+        a[keep] for a in (row_idx, col_idx, values, means, stds, z, stat_rows)
+    )
+    type_codes = np.where(z > 0, ANOMALY_TYPES.index(zm.high_type), ANOMALY_TYPES.index(zm.low_type))
+    return _build_anomaly_frame(
+        df, row_idx, col_idx, score_cols, values, z, means, type_codes, _severity_codes(z, z_thresh),
+        stds=stds, baselines=zm.labels(stat_rows),
+    )
+
+@profiling.profiled()
+def detect_inter_student_anomalies(df, score_cols, z_thresh, group_col=None, method="zscore"):
     """
     Phát hiện các điểm bất thường bằng cách so sánh điểm của một học sinh
     với điểm trung bình của toàn bộ nhóm/lớp (Inter-student).
@@ -23,64 +642,148 @@ def detect_inter_student_anomalies(df, score_cols, z_thresh):
     Sử dụng phương pháp Z-score.
     - Z-score = (Điểm - Điểm trung bình) / Độ lệch chuẩn
     - Một điểm được coi là bất thường nếu |Z-score| > ngưỡng (z_thresh).
+    Với `method` là "mad" hoặc "iqr", trung bình và độ lệch chuẩn được thay bằng
+    tâm và thang đo bền vững (xem DETECTION_METHODS), ít bị chính các điểm lệch
+    kéo theo khi lớp ít học sinh.
+
+    Khi có `group_col` (ví dụ 'lop'), trung bình và độ lệch chuẩn được tính
+    riêng cho từng nhóm bằng một lượt `groupby().transform` trên tất cả các cột
+    điểm, để lớp mạnh và lớp yếu trong cùng một tệp không che lấp lẫn nhau.
 
     Args:
         df (pd.DataFrame): DataFrame chứa dữ liệu điểm.
         score_cols (list): Danh sách các cột điểm cần phân tích.
         z_thresh (float): Ngưỡng Z-score để xác định bất thường.
+        group_col (str, optional): Cột dùng để chia nhóm so sánh. Mặc định so
+            sánh với toàn bộ tệp.
+        method (str): Phương pháp phát hiện (khóa của DETECTION_METHODS).
 
     Returns:
-        list: Danh sách các điểm bất thường được tìm thấy.
+        pd.DataFrame: Bảng các điểm bất thường được tìm thấy (dạng cột).
     """
-    anomalies = []
-    # Chỉ xử lý trên các cột có kiểu dữ liệu số
-    numeric_df = df[score_cols].apply(pd.to_numeric, errors='coerce')
+    if not score_cols or df.empty:
+        return _empty_anomaly_frame(df, score_cols)
 
-    for col in score_cols:
-        # Loại bỏ các giá trị NaN để tính toán thống kê
-        col_data = numeric_df[col].dropna()
-        if len(col_data) < 2:  # Cần ít nhất 2 điểm để tính độ lệch chuẩn
-            continue
+    zm = compute_inter_student_zscores(df, score_cols, group_col, method)
+    return _anomalies_from_zscores(df, score_cols, zm, z_thresh)
 
-        mean = col_data.mean()
-        std = col_data.std()
+def _inter_student_baselines(numeric_df, df, group_col=None):
+    """
+    Tính trung bình và độ lệch chuẩn tham chiếu cho từng ô của bảng điểm.
 
-        # Tránh trường hợp độ lệch chuẩn bằng 0 (khi tất cả các điểm giống nhau)
-        if std == 0:
-            continue
+    Args:
+        numeric_df (pd.DataFrame): Các cột điểm đã chuyển sang dạng số.
+        df (pd.DataFrame): DataFrame gốc, chứa cột nhóm.
+        group_col (str, optional): Cột chia nhóm; None để dùng toàn bộ tệp.
 
-        # Tính Z-score cho tất cả học sinh trong cột hiện tại
-        z_scores = (numeric_df[col] - mean) / std
-
-        # Tìm các học sinh có |Z-score| vượt ngưỡng
-        outliers = df[z_scores.abs() > z_thresh]
-
-        for i, row in outliers.iterrows():
-            student_score = row[col]
-            student_z_score = z_scores.loc[i]
-            
-            anomaly_type = "Điểm cao bất thường" if student_z_score > 0 else "Điểm thấp bất thường"
-            explanation = (
-                f"Điểm {student_score} ở cột '{col}' "
-                f"cao hơn đáng kể so với trung bình lớp ({mean:.2f})."
-            ) if student_z_score > 0 else (
-                f"Điểm {student_score} ở cột '{col}' "
-                f"thấp hơn đáng kể so với trung bình lớp ({mean:.2f})."
-            )
+    Returns:
+        tuple: (means, stds, group_codes, group_labels). `means`, `stds` có một
+        dòng cho mỗi nhóm (nhóm có dưới 2 điểm nhận NaN); `group_codes` là mã
+        nhóm (int32) của từng hàng, hoặc None khi so với toàn bộ tệp;
+        `group_labels` là nhãn tương ứng của mã đó.
+    """
+    n_cols = numeric_df.shape[1]
+
+    if group_col is None:
+        col_means = np.full(n_cols, np.nan)
+        col_stds = np.full(n_cols, np.nan)
+        for j, col in enumerate(numeric_df.columns):
+            # Loại bỏ các giá trị NaN để tính toán thống kê
+            col_data = numeric_df[col].dropna()
+            if len(col_data) < 2:  # Cần ít nhất 2 điểm để tính độ lệch chuẩn
+                continue
+            col_means[j] = col_data.mean()
+            col_stds[j] = col_data.std()
+        return col_means[None, :], col_stds[None, :], None, np.array([GLOBAL_BASELINE], dtype=object)
+
+    # Giá trị trống của cột nhóm cũng được xem là một nhóm riêng
+    group_codes, group_values = pd.factorize(df[group_col], use_na_sentinel=False)
+    grouped = numeric_df.groupby(group_codes, sort=False)
+    # groupby() trả về std = NaN cho nhóm có dưới 2 điểm hợp lệ
+    group_index = np.arange(len(group_values))
+    means = grouped.mean().reindex(group_index).to_numpy(dtype=float)
+    stds = grouped.std().reindex(group_index).to_numpy(dtype=float)
+    group_labels = np.array([f"{group_col}={value}" for value in group_values], dtype=object)
+    return means, stds, group_codes.astype(np.int32), group_labels
+
+def _rowwise_nanmean_nanstd(values, min_count):
+    """
+    Tính trung bình và độ lệch chuẩn (ddof=1) theo từng hàng của ma trận điểm,
+    bỏ qua NaN. Các hàng có ít hơn `min_count` giá trị hợp lệ nhận NaN.
+
+    Các giá trị hợp lệ của mỗi hàng được dồn về bên trái rồi xử lý theo từng
+    nhóm hàng có cùng số giá trị, để phép cộng diễn ra đúng thứ tự như
+    `Series.mean()`/`Series.std()` của pandas trên từng hàng. Nhờ vậy kết quả
+    trùng khớp đến từng bit với cách tính cũ, kể cả khi |Z| rơi đúng vào ngưỡng.
+
+    Args:
+        values (np.ndarray): Ma trận điểm (số hàng x số cột), NaN là thiếu.
+        min_count (int): Số giá trị hợp lệ tối thiểu của một hàng.
+
+    Returns:
+        tuple: (means, stds), mỗi phần tử là mảng 1 chiều độ dài số hàng.
+    """
+    n_rows = values.shape[0]
+    means = np.full(n_rows, np.nan)
+    stds = np.full(n_rows, np.nan)
+
+    observed = ~np.isnan(values)
+    counts = observed.sum(axis=1)
+    # Sắp xếp ổn định để dồn các giá trị hợp lệ về đầu hàng, giữ nguyên thứ tự cột
+    order = np.argsort(~observed, axis=1, kind='stable')
+    packed = np.take_along_axis(values, order, axis=1)
+
+    for count in np.unique(counts[counts >= max(min_count, 2)]):
+        rows = np.flatnonzero(counts == count)
+        block = np.ascontiguousarray(packed[rows, :count])
+        avg = block.sum(axis=1) / count
+        sqr = (avg[:, None] - block) ** 2
+        means[rows] = avg
+        stds[rows] = np.sqrt(sqr.sum(axis=1) / (count - 1))
+
+    return means, stds
+
+@profiling.profiled()
+def compute_intra_student_zscores(df, subject_cols, method="zscore"):
+    """
+    Tính Z-score cá nhân (Intra-student) cho mọi ô điểm: độ lệch của mỗi môn so
+    với trung bình (hoặc trung vị, tứ phân vị theo `method`) các môn của chính
+    học sinh đó.
+
+    Toàn bộ bảng điểm được xử lý trong một lượt NumPy 2 chiều (thống kê theo
+    hàng, mặt nạ số môn tối thiểu) thay cho việc duyệt từng học sinh.
+
+    Args:
+        df (pd.DataFrame): DataFrame chứa điểm tổng hợp.
+        subject_cols (list): Danh sách các cột môn học.
+        method (str): Phương pháp phát hiện (khóa của DETECTION_METHODS).
+
+    Returns:
+        ZScoreMatrix: Ma trận Z-score cá nhân và các giá trị tham chiếu.
+    """
+    # Ma trận điểm (số học sinh x số môn), các giá trị không hợp lệ thành NaN
+    values = score_matrix(df, subject_cols)
+    stats = compute_score_statistics(df, subject_cols, personal=True, robust=method != "zscore", values=values)
+    return stats.zscore_matrix(values, method)
+
+def compute_method_zscores(df, score_cols, group_col=None, personal=False, methods=DEFAULT_DETECTION_METHODS):
+    """
+    Ma trận Z-score của mọi phương pháp trong `methods`, từ một lượt giải mã điểm
+    và một lượt thống kê (`compute_score_statistics`) cho mỗi kiểu so sánh.
 
-            anomalies.append({
-                "MaHS": row.get("MaHS", "N/A"),
-                "lop": row.get("lop", "N/A"),
-                "CotDiem": col,
-                "DiemBatThuong": student_score,
-                "LoaiBatThuong": anomaly_type,
-                "MucDo": assign_severity(student_z_score, z_thresh),
-                "GiaiThich": explanation
-            })
-            
-    return anomalies
+    Returns:
+        list: ZScoreMatrix so với lớp/nhóm của từng phương pháp, rồi (nếu
+        `personal`) so với chính học sinh của từng phương pháp.
+    """
+    values = score_matrix(df, score_cols)
+    robust = any(method != "zscore" for method in methods)
+    views = [compute_score_statistics(df, score_cols, group_col, robust=robust, values=values)]
+    if personal:
+        views.append(compute_score_statistics(df, score_cols, personal=True, robust=robust, values=values))
+    return [stats.zscore_matrix(values, method) for stats in views for method in methods]
 
-def detect_intra_student_subject_deviation(df, subject_cols, z_thresh):
+@profiling.profiled()
+def detect_intra_student_subject_deviation(df, subject_cols, z_thresh, method="zscore"):
     """
     Phát hiện một môn học có điểm lệch bất thường so với năng lực chung
     của chính học sinh đó (Intra-student).
@@ -91,119 +794,826 @@ def detect_intra_student_subject_deviation(df, subject_cols, z_thresh):
         df (pd.DataFrame): DataFrame chứa điểm tổng hợp.
         subject_cols (list): Danh sách các cột môn học.
         z_thresh (float): Ngưỡng Z-score cá nhân để xác định bất thường.
+        method (str): Phương pháp phát hiện (khóa của DETECTION_METHODS).
 
     Returns:
-        list: Danh sách các bất thường được tìm thấy.
+        pd.DataFrame: Bảng các bất thường được tìm thấy (dạng cột).
     """
-    anomalies = []
-    # Chỉ xử lý trên các cột có kiểu dữ liệu số
-    numeric_df = df[subject_cols].apply(pd.to_numeric, errors='coerce')
+    if not subject_cols or df.empty:
+        return _empty_anomaly_frame(df, subject_cols)
 
-    for i, row in numeric_df.iterrows():
-        # Lấy điểm của các môn mà học sinh này có
-        student_scores = row.dropna()
-        if len(student_scores) < 3: # Cần ít nhất 3 môn để phân tích có ý nghĩa
-            continue
+    zm = compute_intra_student_zscores(df, subject_cols, method)
+    return _anomalies_from_zscores(df, subject_cols, zm, z_thresh)
+
+@profiling.profiled()
+def detect_missing_values(df, score_cols):
+    """
+    Phát hiện các giá trị điểm bị thiếu (NaN).
+    """
+    if not score_cols or df.empty:
+        return _empty_anomaly_frame(df, score_cols)
 
-        mean = student_scores.mean()
-        std = student_scores.std()
+    # Duyệt theo cột rồi đến hàng, giữ thứ tự kết quả như trước
+    col_idx, row_idx = np.nonzero(df[score_cols].isnull().to_numpy().T)
+    n = len(row_idx)
+    return _build_anomaly_frame(
+        df, row_idx, col_idx, score_cols, np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan),
+        np.full(n, ANOMALY_TYPES.index("Thiếu dữ liệu")), np.full(n, SEVERITY_LEVELS.index("Cao")),
+    )
 
-        if std == 0:
-            continue
+# Giá trị thay cho ô trống khi so sánh dãy điểm
+_MISSING_KEY = np.iinfo(np.int64).min
+
+def _duplicate_keys(values):
+    """Ma trận điểm đã làm tròn dưới dạng số nguyên (ô trống là _MISSING_KEY) để so sánh chính xác."""
+    scaled = np.round(values * 10**DUPLICATE_DECIMALS)
+    finite = np.isfinite(scaled)
+    keys = np.where(finite, scaled, 0).astype(np.int64)
+    keys[~finite] = _MISSING_KEY
+    return keys
+
+def _hash_rows(keys, scope):
+    """Mã băm 64-bit của từng hàng (kèm mã phạm vi), tính theo cột bằng pandas."""
+    return pd.util.hash_pandas_object(pd.DataFrame(np.column_stack([scope, keys])), index=False).to_numpy()
+
+def _exact_duplicate_pairs(keys, scope):
+    """
+    Cặp (hàng, hàng đại diện) của các dãy điểm giống hệt nhau trong cùng phạm vi:
+    gom theo mã băm, mỗi hàng nối với hàng đầu tiên có cùng mã băm.
+    """
+    codes, uniques = pd.factorize(_hash_rows(keys, scope))
+    first = np.full(len(uniques), len(codes))
+    np.minimum.at(first, codes, np.arange(len(codes)))
+    i = np.arange(len(codes))
+    j = first[codes]
+    # Xác nhận lại từng cặp để loại trừ va chạm mã băm
+    keep = (i != j) & (keys == keys[j]).all(axis=1) & (scope == scope[j])
+    return i[keep], j[keep]
+
+def _bucket_pairs(hashes, max_bucket=DUPLICATE_MAX_BUCKET):
+    """
+    Mọi cặp hàng có cùng mã băm, bỏ qua các khối có hơn `max_bucket` hàng.
+    Các hàng được sắp theo mã khối; cặp cách nhau d vị trí được lấy cho từng d.
+    """
+    codes = pd.factorize(hashes)[0]
+    sizes = np.bincount(codes)
+    candidates = np.flatnonzero((sizes[codes] >= 2) & (sizes[codes] <= max_bucket))
+    order = candidates[np.argsort(codes[candidates], kind='stable')]
+    sorted_codes = codes[order]
+    pairs_i, pairs_j = [], []
+    for d in range(1, min(max_bucket, sizes.max(initial=0))):
+        same = sorted_codes[:-d] == sorted_codes[d:]
+        pairs_i.append(order[:-d][same])
+        pairs_j.append(order[d:][same])
+    if not pairs_i:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+def _duplicate_group_labels(df, members, components):
+    """Nhãn của mỗi nhóm trùng: danh sách MaHS (hoặc số dòng) của các học sinh trong nhóm."""
+    if "MaHS" in df.columns:
+        prefix, ids = "MaHS ", pd.Series(df["MaHS"].array.take(members), dtype=object).astype(str)
+    else:
+        prefix, ids = "dòng ", pd.Series((members + 1).astype(str), dtype=object)
+    labels = ids.groupby(components, sort=False).apply(
+        lambda g: prefix + ", ".join(g.iloc[:DUPLICATE_LABEL_IDS]) + (", ..." if len(g) > DUPLICATE_LABEL_IDS else "")
+    )
+    return labels.reindex(components).to_numpy(dtype=object)
+
+@profiling.profiled()
+def detect_duplicate_score_vectors(df, score_cols, scope_col='lop', max_diff=DUPLICATE_MAX_DIFF,
+                                   min_scores=DUPLICATE_MIN_SCORES):
+    """
+    Phát hiện các học sinh có dãy điểm trùng hoặc gần trùng nhau (ví dụ sao chép
+    nhầm dòng điểm) trong cùng một nhóm `scope_col` (mặc định cùng lớp).
+
+    - Trùng: mọi ô điểm (đã làm tròn) giống nhau, kể cả vị trí ô trống. Mỗi dãy
+      điểm được băm thành một số 64-bit và gom theo mã băm (`pd.factorize`), nên
+      thời gian tăng tuyến tính theo số học sinh thay vì so sánh từng cặp.
+    - Gần trùng: khác nhau ở tối đa `max_diff` ô. Chia các cột thành `max_diff + 1`
+      dải thì hai dãy như vậy giống hệt nhau ở ít nhất một dải; mỗi dải được băm
+      để chia khối, và chỉ các cặp trong cùng khối mới được so sánh từng ô.
+
+    Một cặp chỉ được tính khi có ít nhất `min_scores` điểm (không trống) giống
+    nhau. Các học sinh nối với nhau qua các cặp tạo thành một nhóm: nhóm gồm các
+    dãy giống hệt nhau có loại "Trùng dãy điểm", ngược lại là "Gần trùng dãy điểm".
+
+    Args:
+        df (pd.DataFrame): DataFrame chứa dữ liệu điểm.
+        score_cols (list): Danh sách các cột điểm cần so sánh.
+        scope_col (str, optional): Chỉ so sánh các học sinh cùng giá trị cột này;
+            None hoặc cột không có trong df để so sánh toàn bộ tệp.
+        max_diff (int): Số ô được phép khác nhau của hai dãy gần trùng (0 để chỉ tìm dãy trùng).
+        min_scores (int): Số điểm giống nhau tối thiểu của một cặp.
+
+    Returns:
+        pd.DataFrame: Một dòng cho mỗi học sinh thuộc một nhóm trùng (CotDiem trống),
+        NhomThamChieu liệt kê các học sinh trong nhóm.
+    """
+    if not score_cols or df.empty:
+        return _empty_anomaly_frame(df, score_cols)
+
+    all_keys = _duplicate_keys(score_matrix(df, score_cols))
+    if scope_col is not None and scope_col in df.columns:
+        all_scope = pd.factorize(df[scope_col], use_na_sentinel=False)[0]
+    else:
+        all_scope = np.zeros(len(df), dtype=np.int64)
+    # Chỉ xét các học sinh có đủ số điểm tối thiểu
+    rows = np.flatnonzero((all_keys != _MISSING_KEY).sum(axis=1) >= min_scores)
+    keys, scope = all_keys[rows], all_scope[rows]
+
+    pairs = [_exact_duplicate_pairs(keys, scope)]
+    n_cols = len(score_cols)
+    if max_diff > 0 and n_cols - max_diff >= min_scores:
+        for band in np.array_split(np.arange(n_cols), max_diff + 1):
+            i, j = _bucket_pairs(_hash_rows(keys[:, band], scope))
+            same = keys[i] == keys[j]
+            n_same = (same & (keys[i] != _MISSING_KEY)).sum(axis=1)
+            keep = (n_cols - same.sum(axis=1) <= max_diff) & (n_same >= min_scores) & (scope[i] == scope[j])
+            pairs.append((i[keep], j[keep]))
+
+    pairs_i = np.concatenate([p[0] for p in pairs])
+    pairs_j = np.concatenate([p[1] for p in pairs])
+    if len(pairs_i) == 0:
+        return _empty_anomaly_frame(df, score_cols)
+
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    graph = coo_matrix((np.ones(len(pairs_i), dtype=np.int8), (pairs_i, pairs_j)), shape=(len(rows), len(rows)))
+    _, components = connected_components(graph, directed=False)
+    sizes = np.bincount(components)
+    # Mỗi nhóm có ít nhất 2 học sinh; giữ thứ tự nhóm theo học sinh đầu tiên
+    in_group = np.flatnonzero(sizes[components] >= 2)
+    in_group = in_group[np.argsort(components[in_group], kind='stable')]
+    members, components = rows[in_group], components[in_group]
+
+    # Nhóm "trùng" khi mọi dãy điểm giống dãy của học sinh đầu tiên trong nhóm
+    first = np.flatnonzero(np.r_[True, components[1:] != components[:-1]])
+    group_pos = np.cumsum(np.r_[False, components[1:] != components[:-1]])
+    differs = (all_keys[members] != all_keys[members[first]][group_pos]).any(axis=1)
+    near = np.bincount(group_pos, weights=differs)[group_pos] > 0
 
-        # Tính Z-score cá nhân cho từng môn học của học sinh này
-        personal_z_scores = (student_scores - mean) / std
-
-        # Tìm các môn có |Z-score cá nhân| vượt ngưỡng
-        outlier_subjects = personal_z_scores[personal_z_scores.abs() > z_thresh]
-        
-        for subject, z_score in outlier_subjects.items():
-            anomaly_score = student_scores[subject]
-            anomaly_type = "Môn có điểm lệch cao" if z_score > 0 else "Môn có điểm lệch thấp"
-            explanation = (
-                f"Điểm môn '{subject}' ({anomaly_score}) "
-                f"cao hơn hẳn so với năng lực chung của học sinh này (trung bình các môn: {mean:.2f})."
-            ) if z_score > 0 else (
-                f"Điểm môn '{subject}' ({anomaly_score}) "
-                f"thấp hơn hẳn so với năng lực chung của học sinh này (trung bình các môn: {mean:.2f})."
+    n = len(members)
+    type_codes = np.where(near, ANOMALY_TYPES.index("Gần trùng dãy điểm"), ANOMALY_TYPES.index("Trùng dãy điểm"))
+    severity_codes = np.where(near, SEVERITY_LEVELS.index("Trung bình"), SEVERITY_LEVELS.index("Cao"))
+    return _build_anomaly_frame(
+        df, members, np.full(n, -1), score_cols, np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan),
+        type_codes, severity_codes, baselines=_duplicate_group_labels(df, members, group_pos),
+    )
+
+@dataclass
+class MahalanobisScores:
+    """
+    Khoảng cách Mahalanobis của từng học sinh tới trung bình nhóm, không phụ
+    thuộc ngưỡng. Bình phương khoảng cách được đổi sang Z tương đương (cùng xác
+    suất đuôi, số bậc tự do bằng số điểm có giá trị), nên Z > ngưỡng tương ứng
+    với ngưỡng khi bình phương/F ở cùng mức ý nghĩa và các mức độ dùng chung cách
+    gán với phát hiện theo từng cột.
+    """
+    z_scores: np.ndarray        # Z tương đương của từng hàng, NaN nếu không đủ dữ liệu
+    worst_cols: np.ndarray      # Cột đóng góp nhiều nhất vào khoảng cách của từng hàng
+    means: np.ndarray           # Trung bình của từng nhóm (số nhóm x số cột)
+    stds: np.ndarray            # Độ lệch chuẩn của từng cột trong từng nhóm
+    group_codes: np.ndarray     # Mã nhóm (int32) của từng hàng
+    baseline_labels: np.ndarray # Nhãn của từng nhóm
+    pooled_cross: np.ndarray = None  # Tổng tích chéo của mọi nhóm (k x k), để gộp ma trận chung
+    pooled_dof: np.ndarray = None    # Tổng số bậc tự do tương ứng (k x k)
+
+    def anomalies(self, df, score_cols, z_thresh):
+        """Bảng bất thường gồm các học sinh có Z tương đương vượt ngưỡng."""
+        row_idx = np.flatnonzero(self.z_scores > z_thresh)
+        col_idx = self.worst_cols[row_idx].astype(np.intp)
+        codes = self.group_codes[row_idx]
+        z = self.z_scores[row_idx]
+        n = len(row_idx)
+        return _build_anomaly_frame(
+            df, row_idx, col_idx, score_cols, _cell_values(df, score_cols, row_idx, col_idx), z,
+            self.means[codes, col_idx], np.full(n, ANOMALY_TYPES.index("Hồ sơ điểm bất thường")),
+            _severity_codes(z, z_thresh), stds=self.stds[codes, col_idx], baselines=self.baseline_labels[codes],
+        )
+
+    @property
+    def nbytes(self):
+        arrays = (self.z_scores, self.worst_cols, self.means, self.stds, self.group_codes, self.baseline_labels,
+                  self.pooled_cross, self.pooled_dof)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+def _grouped_covariances(values, observed, codes, n_groups, prior=None):
+    """
+    Trung bình và ma trận hiệp phương sai của từng nhóm, ước lượng theo từng cặp
+    cột trên các học sinh có cả hai điểm (pairwise).
+
+    Mỗi tổng theo nhóm là một lần `np.bincount` trên toàn bộ bảng (k(k+1)/2 cặp
+    cột), không duyệt từng nhóm.
+
+    Args:
+        prior (tuple, optional): (tích chéo, bậc tự do) của các nhóm khác, được
+            gộp vào ma trận chung (khi chỉ tính lại một số nhóm).
+
+    Returns:
+        tuple: (means, covs, pooled, centered, sums): trung bình (số nhóm x k), hiệp
+        phương sai của từng nhóm (số nhóm x k x k; cặp cột có dưới 2 học sinh lấy
+        theo ma trận chung), hiệp phương sai chung trong nhóm (k x k), độ lệch
+        của từng ô so với trung bình nhóm (0 ở ô trống) và (tổng tích chéo, tổng
+        bậc tự do) dùng cho ma trận chung.
+    """
+    n_cols = values.shape[1]
+    filled = np.where(observed, values, 0.0)
+    counts = np.stack([np.bincount(codes, weights=observed[:, j], minlength=n_groups) for j in range(n_cols)], axis=1)
+    sums = np.stack([np.bincount(codes, weights=filled[:, j], minlength=n_groups) for j in range(n_cols)], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    centered = np.where(observed, values - means[codes], 0.0)
+
+    pair_counts = np.empty((n_groups, n_cols, n_cols))
+    cross = np.empty((n_groups, n_cols, n_cols))
+    for j in range(n_cols):
+        for l in range(j, n_cols):
+            both = observed[:, j] & observed[:, l]
+            pair_counts[:, j, l] = pair_counts[:, l, j] = np.bincount(codes, weights=both, minlength=n_groups)
+            cross[:, j, l] = cross[:, l, j] = np.bincount(
+                codes, weights=centered[:, j] * centered[:, l], minlength=n_groups
             )
 
-            anomalies.append({
-                "MaHS": df.loc[i].get("MaHS", "N/A"),
-                "lop": df.loc[i].get("lop", "N/A"),
-                "CotDiem": subject,
-                "DiemBatThuong": anomaly_score,
-                "LoaiBatThuong": anomaly_type,
-                "MucDo": assign_severity(z_score, z_thresh),
-                "GiaiThich": explanation
-            })
+    cross_total = cross.sum(axis=0)
+    dof_total = np.clip(pair_counts - 1, 0, None).sum(axis=0)
+    if prior is not None:
+        cross_total, dof_total = cross_total + prior[0], dof_total + prior[1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Hiệp phương sai chung trong nhóm của mọi nhóm: dùng cho nhóm nhỏ và cặp cột thiếu dữ liệu
+        pooled = cross_total / dof_total
+        covs = np.where(pair_counts >= 2, cross / (pair_counts - 1), np.nan)
+    pooled = np.where(np.isfinite(pooled), pooled, 0.0)
+    pooled_var = np.diag(pooled).copy()
+    pooled[np.diag_indices(n_cols)] = np.where(pooled_var > 0, pooled_var, 1.0)
+    covs = np.where(np.isnan(covs), pooled, covs)
+    return means, covs, pooled, centered, (cross_total, dof_total)
 
-    return anomalies
+def _positive_definite(covs):
+    """Chặn dưới các trị riêng (ước lượng theo từng cặp có thể không xác định dương)."""
+    eigvals, eigvecs = np.linalg.eigh(covs)
+    floor = MAHALANOBIS_EIGEN_FLOOR * np.abs(eigvals).mean(axis=1, keepdims=True)
+    return np.einsum('gij,gj,gkj->gik', eigvecs, np.maximum(eigvals, floor), eigvecs)
 
-def detect_missing_values(df, score_cols):
+def _leave_one_out_distances(quad, group_sizes, weights):
     """
-    Phát hiện các giá trị điểm bị thiếu (NaN).
+    Bình phương khoảng cách Mahalanobis khi bỏ chính học sinh đó ra khỏi trung
+    bình và hiệp phương sai của nhóm. Với lớp ~40 học sinh, khoảng cách tính
+    trong mẫu bị thu nhỏ đáng kể nên phải hiệu chỉnh thì ngưỡng khi bình phương
+    mới đúng.
+
+    Bỏ học sinh i (độ lệch e so với trung bình nhóm) thì trung bình dịch đi
+    e/(n-1) và hiệp phương sai đã co trở thành M - β e eᵀ, với
+    M = (1-w)(n-1)/(n-2) S + w T và β = (1-w) n / ((n-1)(n-2)). Theo công thức
+    Sherman-Morrison, với `quad` = eᵀ M⁻¹ e:
+    D² = (n/(n-1))² quad / (1 - β quad).
     """
-    anomalies = []
-    for col in score_cols:
-        missing_df = df[df[col].isnull()]
-        for i, row in missing_df.iterrows():
-            anomalies.append({
-                "MaHS": row.get("MaHS", "N/A"),
-                "lop": row.get("lop", "N/A"),
-                "CotDiem": col,
-                "DiemBatThuong": "Bị trống",
-                "LoaiBatThuong": "Thiếu dữ liệu",
-                "MucDo": "Cao",
-                "GiaiThich": f"Học sinh này bị thiếu điểm ở cột '{col}'."
-            })
-    return anomalies
-
-def run_component_analysis(df, z_thresh):
+    n = group_sizes.astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        beta = (1 - weights) * n / ((n - 1) * (n - 2))
+        return (n / (n - 1)) ** 2 * quad / np.maximum(1 - beta * quad, np.finfo(float).eps)
+
+def _distance_tail(distances, dof, sample_sizes):
     """
-    Hàm tổng hợp để chạy phân tích cho file điểm thành phần.
+    Xác suất đuôi của bình phương khoảng cách bỏ-một D² với `dof` điểm, khi
+    trung bình và hiệp phương sai được ước lượng từ `sample_sizes` học sinh
+    (hiệu dụng): m/(m+1) D² ~ p(m-1)/(m-p) F(p, m-p) (Hotelling). Khi m lớn,
+    phân phối này tiến về khi bình phương p bậc tự do.
     """
-    # Xác định các cột điểm thành phần
-    score_cols = ['TX1', 'TX2', 'TX3', 'GK', 'CK']
-    # Loại bỏ các cột không tồn tại trong DataFrame
-    score_cols = [col for col in score_cols if col in df.columns]
+    from scipy.stats import chi2, f
 
-    # Phát hiện bất thường so với lớp
-    inter_anomalies = detect_inter_student_anomalies(df, score_cols, z_thresh)
-    
-    # Phát hiện thiếu dữ liệu
-    missing_anomalies = detect_missing_values(df, score_cols)
+    p = np.maximum(dof, 1).astype(float)
+    m = sample_sizes.astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        statistic = distances * m / (m + 1) * (m - p) / (p * (m - 1))
+        tail = f.sf(statistic, p, m - p)
+    # Nhóm quá nhỏ so với số cột: dùng khi bình phương
+    return np.where(m > p + 1, tail, chi2.sf(distances, p))
 
-    # Tổng hợp kết quả
-    all_anomalies = inter_anomalies + missing_anomalies
-    
-    if not all_anomalies:
-        return pd.DataFrame()
-        
-    return pd.DataFrame(all_anomalies)
+@profiling.profiled()
+def compute_mahalanobis_scores(df, score_cols, group_col=MAHALANOBIS_GROUP_COL, prior=None, usable_cols=None):
+    """
+    Tính khoảng cách Mahalanobis của mọi học sinh tới trung bình nhóm của mình
+    (mặc định theo lớp), để phát hiện các dãy điểm mà từng điểm riêng lẻ không
+    bất thường nhưng tổ hợp thì bất thường (ví dụ TX cao nhưng GK, CK rất thấp).
 
-def run_summary_analysis(df, z_thresh):
+    - Trung bình và hiệp phương sai của mọi nhóm được tính cùng lúc (xem
+      `_grouped_covariances`), co về hiệp phương sai chung với trọng số giảm dần
+      theo số học sinh của nhóm.
+    - Học sinh đủ điểm: d² = xᵀ Σ⁻¹ x cho mọi hàng bằng một phép `einsum` trên
+      nghịch đảo của các ma trận nhóm.
+    - Học sinh thiếu điểm: chỉ dùng các cột có điểm (ma trận con của Σ), giải
+      theo lô bằng `np.linalg.solve`; số bậc tự do bằng số điểm có giá trị.
+    - Khoảng cách được tính khi bỏ chính học sinh đó ra khỏi nhóm (xem
+      `_leave_one_out_distances`) rồi so với phân phối Hotelling T² (F), tiến về
+      khi bình phương khi nhóm lớn (xem `_distance_tail`).
+
+    Args:
+        df (pd.DataFrame): DataFrame chứa dữ liệu điểm.
+        score_cols (list): Danh sách các cột điểm.
+        group_col (str, optional): Cột chia nhóm; None hoặc cột không có trong df
+            để so với toàn bộ tệp.
+        prior (tuple, optional): (pooled_cross, pooled_dof) của các nhóm không có
+            trong df, gộp vào ma trận chung khi chỉ tính lại một số nhóm của tệp.
+        usable_cols (np.ndarray, optional): Các cột được dùng (mảng bool); mặc
+            định là các cột có ít nhất 2 điểm trong df.
+
+    Returns:
+        MahalanobisScores: Z tương đương và thông tin tham chiếu của từng học sinh.
     """
-    Hàm tổng hợp để chạy phân tích cho file điểm tổng hợp.
+    from scipy.stats import norm
+
+    values = score_matrix(df, score_cols)
+    n_rows, n_cols = values.shape
+    # Cột có dưới 2 điểm trong toàn tệp không có phương sai: xem như trống
+    if usable_cols is None:
+        usable_cols = np.sum(~np.isnan(values), axis=0) >= 2
+    observed = ~np.isnan(values) & usable_cols
+    if group_col is not None and group_col in df.columns:
+        codes, group_values = pd.factorize(df[group_col], use_na_sentinel=False)
+        labels = np.array([f"{group_col}={value}" for value in group_values], dtype=object)
+    else:
+        codes, labels = np.zeros(n_rows, dtype=np.intp), np.array([GLOBAL_BASELINE], dtype=object)
+
+    means, sample_covs, pooled, centered, pooled_sums = _grouped_covariances(
+        values, observed, codes, len(labels), prior
+    )
+    dof = observed.sum(axis=1)
+    sizes = np.bincount(codes, minlength=len(labels))
+    valid = (dof >= MAHALANOBIS_MIN_SCORES) & (sizes[codes] >= MAHALANOBIS_MIN_GROUP_SIZE)
+
+    # Co hiệp phương sai của nhóm về ma trận chung; `covs` là ma trận M dùng cho
+    # khoảng cách bỏ-một (xem `_leave_one_out_distances`)
+    weights = MAHALANOBIS_PRIOR_WEIGHT / (sizes + MAHALANOBIS_PRIOR_WEIGHT)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scale = np.where(sizes > 2, (sizes - 1) / (sizes - 2), 1.0)
+    covs = _positive_definite(
+        ((1 - weights) * scale)[:, None, None] * sample_covs + weights[:, None, None] * pooled
+    )
+
+    # Đóng góp của từng cột vào eᵀ M⁻¹ e: e_j * (M⁻¹ e)_j
+    contributions = np.zeros((n_rows, n_cols))
+    complete = np.flatnonzero(valid & observed.all(axis=1))
+    precisions = np.linalg.inv(covs)
+    for start in range(0, len(complete), MAHALANOBIS_CHUNK_ROWS):
+        rows = complete[start:start + MAHALANOBIS_CHUNK_ROWS]
+        x = centered[rows]
+        contributions[rows] = x * np.einsum('nij,nj->ni', precisions[codes[rows]], x)
+    partial = np.flatnonzero(valid & ~observed.all(axis=1))
+    for start in range(0, len(partial), MAHALANOBIS_CHUNK_ROWS):
+        rows = partial[start:start + MAHALANOBIS_CHUNK_ROWS]
+        x, mask = centered[rows], observed[rows]
+        # Ma trận con của các cột có điểm; cột trống thay bằng đơn vị (x = 0 ở đó)
+        sub_covs = np.where(mask[:, :, None] & mask[:, None, :], covs[codes[rows]], 0.0)
+        sub_covs[:, np.arange(n_cols), np.arange(n_cols)] += ~mask
+        contributions[rows] = x * np.linalg.solve(sub_covs, x[:, :, None])[:, :, 0]
+
+    distances = _leave_one_out_distances(contributions.sum(axis=1), sizes[codes], weights[codes])
+    distances[~valid] = np.nan
+    # Số học sinh hiệu dụng: ma trận chung được ước lượng từ mọi nhóm nên mỗi
+    # đơn vị trọng số co đáng tin hơn một học sinh; hệ số 2 cho tỷ lệ phát hiện
+    # đúng mức ý nghĩa trên dữ liệu chuẩn mô phỏng (lớp 20-100 học sinh, 9 môn)
+    tail = _distance_tail(distances, dof, sizes[codes] - 1 + 2 * MAHALANOBIS_PRIOR_WEIGHT)
+    # Xác suất đuôi -> Z hai phía có cùng xác suất; chặn dưới để khoảng cách
+    # rất lớn cho Z hữu hạn (~37.5)
+    z_scores = norm.isf(np.maximum(tail, np.finfo(float).tiny) / 2)
+    z_scores[~valid] = np.nan
+
+    return MahalanobisScores(
+        z_scores, np.argmax(contributions, axis=1).astype(np.int8), means,
+        np.sqrt(np.diagonal(sample_covs, axis1=1, axis2=2)), codes.astype(np.int32), labels, *pooled_sums,
+    )
+
+@profiling.profiled()
+def detect_multivariate_anomalies(df, score_cols, z_thresh, group_col=MAHALANOBIS_GROUP_COL):
+    """
+    Phát hiện các học sinh có cả dãy điểm bất thường so với nhóm (khoảng cách
+    Mahalanobis, xem `compute_mahalanobis_scores`), với ngưỡng tính theo Z tương
+    đương như `detect_inter_student_anomalies`.
+
+    Returns:
+        pd.DataFrame: Một dòng cho mỗi học sinh bất thường; CotDiem là cột lệch nhiều nhất.
+    """
+    if not score_cols or df.empty:
+        return _empty_anomaly_frame(df, score_cols)
+    return compute_mahalanobis_scores(df, score_cols, group_col).anomalies(df, score_cols, z_thresh)
+
+@profiling.profiled()
+def detect_rule_violations(df, score_cols, rule_list=None):
+    """
+    Đánh giá các quy tắc kiểm tra chéo giữa các cột (xem `modules/rules.py`),
+    mỗi quy tắc một biểu thức trên toàn bộ bảng.
+
+    Args:
+        df (pd.DataFrame): DataFrame chứa dữ liệu điểm.
+        score_cols (list): Danh sách cột điểm, dùng làm danh mục của CotDiem.
+        rule_list (list, optional): Các `rules.Rule`; mặc định đọc từ tệp quy tắc mặc định.
+
+    Returns:
+        tuple: (bảng bất thường, bảng thời gian đánh giá từng quy tắc).
+    """
+    rule_list = rules.default_rules() if rule_list is None else rule_list
+    masks, timings = rules.evaluate_rules(df, rule_list, column_values=_column_values)
+
+    frames = []
+    for rule in rule_list:
+        mask = masks[rule.id]
+        if mask is None or not mask.any():
+            continue
+        row_idx = np.flatnonzero(mask)
+        n = len(row_idx)
+        if rule.column in score_cols:
+            col_idx = np.full(n, list(score_cols).index(rule.column))
+            values = _cell_values(df, score_cols, row_idx, col_idx)
+        else:
+            col_idx, values = np.full(n, -1), np.full(n, np.nan)
+        frames.append(_build_anomaly_frame(
+            df, row_idx, col_idx, score_cols, values, np.full(n, np.nan), np.full(n, np.nan),
+            np.full(n, ANOMALY_TYPES.index("Vi phạm quy tắc")), np.full(n, SEVERITY_LEVELS.index(rule.severity)),
+            baselines=np.full(n, rule.name, dtype=object),
+        ))
+    if not frames:
+        return _empty_anomaly_frame(df, score_cols), timings
+    return pd.concat(frames, ignore_index=True), timings
+
+@dataclass
+class PreparedAnalysis:
+    """
+    Phần tính toán không phụ thuộc ngưỡng của một lần phân tích: các ma trận
+    Z-score, danh sách ô thiếu dữ liệu và các nhóm dãy điểm trùng lặp. Đối tượng này được cache theo nội
+    dung tệp và nhóm so sánh; khi người dùng kéo thanh trượt ngưỡng, chỉ cần
+    gọi `detect` để lọc lại bằng mặt nạ.
+    """
+    df: pd.DataFrame
+    score_cols: list
+    zscores: list               # Danh sách ZScoreMatrix, theo thứ tự xuất kết quả
+    missing: pd.DataFrame       # Kết quả phát hiện thiếu dữ liệu
+    duplicates: pd.DataFrame = None  # Kết quả phát hiện dãy điểm trùng lặp (nếu có)
+    multivariate: MahalanobisScores = None  # Khoảng cách Mahalanobis (nếu có)
+    rule_violations: pd.DataFrame = None    # Kết quả các quy tắc kiểm tra (nếu có)
+    rule_timings: pd.DataFrame = None       # Thời gian đánh giá từng quy tắc (nếu có)
+    running_stats: object = None    # stats.RunningStats của Z-score Inter-student (khi phân tích lại tăng dần)
+    changes: object = None          # incremental.RosterDiff so với tệp trước (khi phân tích lại tăng dần)
+    methods: tuple = DEFAULT_DETECTION_METHODS  # Các phương pháp phát hiện của `zscores`
+
+    @profiling.profiled()
+    def detect(self, z_thresh):
+        """
+        Trả về bảng bất thường cho ngưỡng `z_thresh`.
+        """
+        frames = [_anomalies_from_zscores(self.df, self.score_cols, zm, z_thresh) for zm in self.zscores]
+        if self.multivariate is not None:
+            frames.append(self.multivariate.anomalies(self.df, self.score_cols, z_thresh))
+        # Các cột category dùng chung danh mục nên được giữ nguyên khi ghép
+        result = pd.concat(frames + self._fixed_frames(), ignore_index=True)
+        # Nhãn nhóm tham chiếu lặp lại trên mọi dòng: lưu dạng category
+        result["NhomThamChieu"] = result["NhomThamChieu"].astype("category")
+        return result
+
+    def _fixed_frames(self):
+        # Các kết quả không phụ thuộc ngưỡng, theo thứ tự xuất kết quả
+        frames = (self.missing, self.duplicates, self.rule_violations)
+        return [frame for frame in frames if frame is not None]
+
+    @property
+    def nbytes(self):
+        """Bộ nhớ của phần tính sẵn (không tính bảng điểm `df`)."""
+        matrices = self.zscores + [m for m in (self.multivariate, self.running_stats) if m is not None]
+        return sum(m.nbytes for m in matrices) + sum(
+            int(f.memory_usage(deep=True).sum()) for f in self._fixed_frames()
+        )
+
+@profiling.profiled()
+def prepare_component_analysis(df, group_col=None, rule_list=None, methods=DEFAULT_DETECTION_METHODS):
+    """
+    Tính trước các Z-score cho file điểm thành phần (xem `PreparedAnalysis`)
+    theo từng phương pháp trong `methods` và đánh giá các quy tắc kiểm tra
+    (`rule_list`, mặc định từ tệp quy tắc mặc định).
     """
-    # Xác định các cột môn học
-    subject_cols = ['Toan', 'Van', 'Ly', 'Hoa', 'Ngoaingu', 'Su', 'Tin', 'Sinh', 'Dia']
     # Loại bỏ các cột không tồn tại trong DataFrame
-    subject_cols = [col for col in subject_cols if col in df.columns]
+    score_cols = [col for col in COMPONENT_SCORE_COLS if col in df.columns]
+    methods = tuple(methods)
+    if not score_cols or df.empty:
+        return PreparedAnalysis(df, score_cols, [], _empty_anomaly_frame(df, score_cols), methods=methods)
+
+    rule_violations, rule_timings = detect_rule_violations(df, score_cols, rule_list)
+    return PreparedAnalysis(
+        df, score_cols,
+        # Bất thường so với lớp (hoặc với nhóm group_col), mỗi phương pháp một ma trận
+        compute_method_zscores(df, score_cols, group_col, methods=methods),
+        # Thiếu dữ liệu
+        detect_missing_values(df, score_cols),
+        # Dãy điểm trùng lặp trong cùng lớp
+        detect_duplicate_score_vectors(df, score_cols),
+        # Cả dãy điểm bất thường so với nhóm (mặc định theo lớp)
+        compute_mahalanobis_scores(df, score_cols, group_col or MAHALANOBIS_GROUP_COL),
+        # Quy tắc kiểm tra chéo giữa các cột
+        rule_violations, rule_timings, methods=methods,
+    )
+
+@profiling.profiled()
+def prepare_summary_analysis(df, group_col=None, methods=DEFAULT_DETECTION_METHODS):
+    """
+    Tính trước các Z-score cho file điểm tổng hợp (xem `PreparedAnalysis`) theo
+    từng phương pháp trong `methods`.
+    """
+    # Loại bỏ các cột không tồn tại trong DataFrame
+    subject_cols = [col for col in SUMMARY_SUBJECT_COLS if col in df.columns]
+    methods = tuple(methods)
+    if not subject_cols or df.empty:
+        return PreparedAnalysis(df, subject_cols, [], _empty_anomaly_frame(df, subject_cols), methods=methods)
+
+    return PreparedAnalysis(
+        df, subject_cols,
+        # Bất thường 1: So sánh điểm môn với cả lớp (hoặc với nhóm group_col);
+        # Bất thường 2: Một môn lệch so với năng lực chung của chính HS.
+        # Mỗi kiểu so sánh tính thống kê một lần, dùng chung cho mọi phương pháp
+        compute_method_zscores(df, subject_cols, group_col, personal=True, methods=methods),
+        # Phát hiện thiếu dữ liệu
+        detect_missing_values(df, subject_cols),
+        # Phát hiện dãy điểm trùng lặp trong cùng lớp
+        detect_duplicate_score_vectors(df, subject_cols),
+        # Bất thường 3: Cả dãy điểm không phù hợp với tương quan điểm của nhóm
+        compute_mahalanobis_scores(df, subject_cols, group_col or MAHALANOBIS_GROUP_COL),
+        methods=methods,
+    )
+
+@dataclass
+class ScoreDistribution:
+    """
+    Phân bố điểm của một cột đã gom sẵn: số học sinh trong từng khoảng của
+    histogram và các tứ phân vị của biểu đồ hộp, cho cả tệp và cho từng nhóm.
+    Kích thước chỉ phụ thuộc số khoảng và số nhóm, không phụ thuộc số học sinh.
+    """
+    column: str
+    edges: np.ndarray           # Biên các khoảng (DISTRIBUTION_BINS + 1), dùng chung cho mọi nhóm
+    labels: np.ndarray          # Nhãn của từng dòng: GLOBAL_BASELINE rồi các nhóm
+    counts: np.ndarray          # Số học sinh trong từng khoảng (số dòng x số khoảng)
+    stats: pd.DataFrame         # Mỗi dòng một nhãn: Nhom, SoHocSinh, TrungBinh, NhoNhat, Q1, TrungVi, Q3,
+                                # LonNhat, RaoDuoi, RaoTren (đầu râu), SoNgoaiLai
+
+    def rows(self, groups=None):
+        """Vị trí các dòng của `groups` (mặc định chỉ dòng của cả tệp), theo thứ tự đã cho."""
+        if groups is None:
+            return np.array([0])
+        position = {label: i for i, label in enumerate(self.labels.tolist())}
+        return np.array([position[g] for g in groups if g in position], dtype=np.intp)
+
+    @property
+    def nbytes(self):
+        return self.edges.nbytes + self.labels.nbytes + self.counts.nbytes + int(self.stats.memory_usage().sum())
+
+def _sorted_group_stats(values, codes, n_groups):
+    """
+    Tứ phân vị (nội suy tuyến tính như np.percentile), đầu râu và số điểm ngoại
+    lai của từng nhóm, từ một lần sắp xếp theo (nhóm, điểm).
+    """
+    order = np.lexsort((values, codes))
+    sorted_values, sorted_codes = values[order], codes[order]
+    sizes = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    nonempty = sizes > 0
+    last = starts + np.maximum(sizes, 1) - 1
+
+    def quantile(q):
+        position = q * (np.maximum(sizes, 1) - 1)
+        low = np.floor(position).astype(np.int64)
+        frac = position - low
+        lo = sorted_values[np.minimum(starts + low, len(values) - 1)]
+        hi = sorted_values[np.minimum(starts + np.minimum(low + 1, np.maximum(sizes, 1) - 1), len(values) - 1)]
+        return np.where(nonempty, lo + frac * (hi - lo), np.nan)
+
+    q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    iqr = q3 - q1
+    # Khóa tăng dần trên toàn mảng đã sắp xếp (nhóm * span + điểm) để tìm đầu râu bằng searchsorted
+    low_value = sorted_values[0] if len(values) else 0.0
+    span = (sorted_values[-1] - low_value + 1.0) if len(values) else 1.0
+    keys = sorted_codes * span + (sorted_values - low_value)
+    group_base = np.arange(n_groups) * span - low_value
+    with np.errstate(invalid="ignore"):
+        lower_idx = np.searchsorted(keys, group_base + (q1 - DISTRIBUTION_WHISKER_IQR * iqr), side="left")
+        upper_idx = np.searchsorted(keys, group_base + (q3 + DISTRIBUTION_WHISKER_IQR * iqr), side="right") - 1
+    lower_idx = np.clip(lower_idx, starts, last)
+    upper_idx = np.clip(upper_idx, starts, last)
+    safe = lambda idx: sorted_values[np.minimum(idx, max(len(values) - 1, 0))] if len(values) else np.full(n_groups, np.nan)
+    return {
+        "SoHocSinh": sizes,
+        "NhoNhat": np.where(nonempty, safe(starts), np.nan),
+        "Q1": q1, "TrungVi": median, "Q3": q3,
+        "LonNhat": np.where(nonempty, safe(last), np.nan),
+        "RaoDuoi": np.where(nonempty, safe(lower_idx), np.nan),
+        "RaoTren": np.where(nonempty, safe(upper_idx), np.nan),
+        "SoNgoaiLai": np.where(nonempty, (lower_idx - starts) + (last - upper_idx), 0),
+    }
 
-    # Bất thường 1: So sánh điểm môn với cả lớp
-    inter_anomalies = detect_inter_student_anomalies(df, subject_cols, z_thresh)
+@profiling.profiled()
+def score_distribution(df, column, group_col=None, n_bins=DISTRIBUTION_BINS):
+    """
+    Gom phân bố điểm của một cột cho biểu đồ (histogram + biểu đồ hộp) ngay
+    trên máy chủ, cho cả tệp và (nếu có `group_col`) cho mọi nhóm trong cùng
+    một lượt: số học sinh trong từng khoảng được đếm bằng một `np.bincount` trên
+    (nhóm, khoảng), các tứ phân vị lấy từ một lần sắp xếp theo (nhóm, điểm).
+
+    Args:
+        df (pd.DataFrame): Bảng điểm.
+        column (str): Cột điểm.
+        group_col (str, optional): Cột chia nhóm (ví dụ 'lop').
+        n_bins (int): Số khoảng của histogram; các khoảng chia đều đoạn từ phần
+            nguyên của điểm thấp nhất đến phần nguyên trên của điểm cao nhất.
+
+    Returns:
+        ScoreDistribution: Phân bố đã gom (ô trống không được tính).
+    """
+    values = _column_values(df[column])
+    observed = ~np.isnan(values)
+    if group_col is not None:
+        codes, group_values = pd.factorize(df[group_col], use_na_sentinel=False)
+        labels = np.array([GLOBAL_BASELINE] + [str(v) if not pd.isna(v) else "N/A" for v in group_values],
+                          dtype=object)
+        codes = codes[observed].astype(np.int64) + 1
+    else:
+        labels = np.array([GLOBAL_BASELINE], dtype=object)
+        codes = np.zeros(int(observed.sum()), dtype=np.int64)
+    values = values[observed]
+    n_rows = len(labels)
 
-    # Bất thường 2: Một môn lệch so với năng lực chung của chính HS
-    intra_anomalies = detect_intra_student_subject_deviation(df, subject_cols, z_thresh)
+    if len(values):
+        low, high = np.floor(values.min()), np.ceil(values.max())
+    else:
+        low, high = 0.0, 1.0
+    edges = np.linspace(low, max(high, low + 1), n_bins + 1)
+    bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, n_bins - 1)
+    counts = np.bincount(codes * n_bins + bins, minlength=n_rows * n_bins).reshape(n_rows, n_bins)
+    # Dòng của cả tệp là tổng các nhóm
+    counts[0] = counts.sum(axis=0)
+    sums = np.bincount(codes, weights=values, minlength=n_rows)
+    sums[0] = values.sum()
 
-    # Phát hiện thiếu dữ liệu
-    missing_anomalies = detect_missing_values(df, subject_cols)
+    stats = _sorted_group_stats(values, codes, n_rows)
+    if group_col is not None:
+        overall = _sorted_group_stats(values, np.zeros(len(values), dtype=np.int64), 1)
+        for key, column_stats in stats.items():
+            column_stats[0] = overall[key][0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / stats["SoHocSinh"]
+    stats = pd.DataFrame({"Nhom": labels, **stats, "TrungBinh": means})
+    columns = ["Nhom", "SoHocSinh", "TrungBinh", "NhoNhat", "Q1", "TrungVi", "Q3", "LonNhat", "RaoDuoi",
+               "RaoTren", "SoNgoaiLai"]
+    return ScoreDistribution(column, edges, labels, counts, stats[columns])
 
-    # Tổng hợp kết quả
-    all_anomalies = inter_anomalies + intra_anomalies + missing_anomalies
+# Các cột của bảng bất thường có bộ lọc trên giao diện (xem `AnomalyIndex`)
+ANOMALY_FILTER_COLUMNS = ("lop", "LoaiBatThuong", "MucDo")
 
-    if not all_anomalies:
-        return pd.DataFrame()
+@dataclass
+class AnomalyIndex:
+    """
+    Chỉ mục lọc của một bảng bất thường: mỗi cột lọc được mã hóa một lần thành
+    mã danh mục (int32) cùng danh sách giá trị theo thứ tự hiển thị. Một lần lọc
+    chỉ dựng bảng bit các giá trị được chọn của từng cột rồi tra theo mã
+    (`allowed[codes]`), không so sánh chuỗi như `isin`.
 
-    return pd.DataFrame(all_anomalies)
\ No newline at end of file
+    ViTriDong được sắp xếp sẵn để lấy bất thường của một học sinh bằng tìm kiếm
+    nhị phân (`rows_of`).
+    """
+    n_rows: int
+    options: dict                   # Cột -> mảng các giá trị (theo thứ tự hiển thị)
+    codes: dict                     # Cột -> mã của từng dòng (vị trí trong options[cột])
+    missing: dict                   # Cột -> True nếu có dòng thiếu giá trị
+    source_rows: np.ndarray = None  # ViTriDong đã sắp xếp (None nếu bảng không có cột này)
+    source_order: np.ndarray = None # Vị trí trong bảng bất thường của từng phần tử trong source_rows
+
+    def mask(self, selections):
+        """
+        Mảng bool các dòng thỏa mọi bộ lọc, hoặc None nếu không cột nào bị lọc
+        (mọi giá trị đều được chọn).
+
+        Args:
+            selections (dict): Cột -> các giá trị được chọn; cột không có trong
+                dict thì không lọc.
+        """
+        mask = None
+        for column, selected in selections.items():
+            options = self.options[column]
+            selected = set(selected)
+            allowed = np.fromiter((value in selected for value in options), dtype=bool, count=len(options))
+            if allowed.all() and not self.missing[column]:
+                continue
+            allowed = np.append(allowed, False)
+            column_mask = allowed[self.codes[column]]
+            mask = column_mask if mask is None else mask & column_mask
+        return mask
+
+    def select(self, df_anomalies, selections):
+        """Các dòng của `df_anomalies` (bảng đã dựng chỉ mục) thỏa `selections`."""
+        mask = self.mask(selections)
+        if mask is None:
+            return df_anomalies
+        return df_anomalies.take(np.flatnonzero(mask))
+
+    def rows_of(self, positions):
+        """
+        Vị trí trong bảng bất thường của các bất thường thuộc các dòng `positions`
+        của bảng điểm (theo thứ tự trong bảng bất thường).
+        """
+        if self.source_rows is None:
+            return np.array([], dtype=np.intp)
+        positions = np.asarray(positions)
+        lo = np.searchsorted(self.source_rows, positions, side="left")
+        hi = np.searchsorted(self.source_rows, positions, side="right")
+        found = [self.source_order[a:b] for a, b in zip(lo, hi)]
+        return np.sort(np.concatenate(found)) if found else np.array([], dtype=np.intp)
+
+    @property
+    def nbytes(self):
+        arrays = (self.source_rows, self.source_order)
+        return sum(codes.nbytes for codes in self.codes.values()) + sum(a.nbytes for a in arrays if a is not None)
+
+@profiling.profiled()
+def build_anomaly_index(df_anomalies, columns=ANOMALY_FILTER_COLUMNS):
+    """
+    Dựng `AnomalyIndex` cho các cột lọc có trong bảng bất thường. Cột dạng
+    category dùng lại mã sẵn có (chỉ giữ các giá trị có xuất hiện); cột khác
+    được mã hóa bằng `pd.factorize`. Giá trị được xếp tăng dần, riêng MucDo theo
+    SEVERITY_LEVELS.
+    """
+    options, codes, missing = {}, {}, {}
+    for column in columns:
+        if column not in df_anomalies.columns:
+            continue
+        series = df_anomalies[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            raw_codes, categories = series.cat.codes.to_numpy(), series.cat.categories.to_numpy()
+            # Chỉ giữ các giá trị có xuất hiện trong bảng
+            source = np.flatnonzero(np.bincount(raw_codes[raw_codes >= 0], minlength=len(categories)))
+            values = categories[source]
+        else:
+            raw_codes, values = pd.factorize(series)
+            values, source = np.asarray(values, dtype=object), np.arange(len(values))
+        if column == "MucDo":
+            rank = [SEVERITY_LEVELS.index(v) if v in SEVERITY_LEVELS else len(SEVERITY_LEVELS) for v in values]
+            order = np.argsort(rank, kind="stable")
+        else:
+            order = np.argsort(values.astype(str), kind="stable")
+        # Mã mới theo thứ tự hiển thị; dòng thiếu giá trị (mã -1) nhận mã len(values),
+        # ô cuối của bảng bit luôn là False nên dòng đó bị loại khi cột có lọc
+        remap = np.full(int(raw_codes.max(initial=-1)) + 2, len(values), dtype=np.int32)
+        remap[source[order]] = np.arange(len(values), dtype=np.int32)
+        options[column] = np.asarray(values[order], dtype=object)
+        codes[column] = remap[raw_codes]
+        missing[column] = bool((raw_codes < 0).any())
+    index = AnomalyIndex(len(df_anomalies), options, codes, missing)
+    if "ViTriDong" in df_anomalies.columns:
+        source_rows = df_anomalies["ViTriDong"].to_numpy(dtype=np.int64)
+        index.source_order = np.argsort(source_rows, kind="stable")
+        index.source_rows = source_rows[index.source_order]
+    return index
+
+def memory_report(df, prepared=None, df_anomalies=None):
+    """
+    Bộ nhớ đang dùng của một phiên phân tích: bảng điểm, phần Z-score tính sẵn
+    và bảng bất thường.
+
+    Returns:
+        pd.DataFrame: Các cột ThanhPhan, SoDong, BoNho_MB (có dòng Tổng).
+    """
+    parts = [("Bảng điểm", len(df), int(df.memory_usage(deep=True).sum()))]
+    if prepared is not None:
+        parts.append(("Z-score tính sẵn", len(prepared.df), prepared.nbytes))
+    if df_anomalies is not None:
+        parts.append(("Bảng bất thường", len(df_anomalies), int(df_anomalies.memory_usage(deep=True).sum())))
+    report = pd.DataFrame(parts, columns=["ThanhPhan", "SoDong", "BoNho_MB"])
+    report["BoNho_MB"] = report["BoNho_MB"] / 2**20
+    total = pd.DataFrame([{"ThanhPhan": "Tổng", "SoDong": None, "BoNho_MB": report["BoNho_MB"].sum()}])
+    return pd.concat([report, total], ignore_index=True).round({"BoNho_MB": 2})
+
+def detect_analysis_type(columns):
+    """
+    Đoán loại tệp từ tên cột: 'component' (điểm thành phần TX/GK/CK) hoặc
+    'summary' (điểm tổng hợp các môn). Trả về None nếu không nhận ra cột điểm nào.
+    """
+    columns = set(columns)
+    n_component = sum(col in columns for col in COMPONENT_SCORE_COLS)
+    n_summary = sum(col in columns for col in SUMMARY_SUBJECT_COLS)
+    if n_component == 0 and n_summary == 0:
+        return None
+    return 'component' if n_component >= n_summary else 'summary'
+
+def run_component_analysis(df, z_thresh, group_col=None, rule_list=None, methods=DEFAULT_DETECTION_METHODS):
+    """
+    Hàm tổng hợp để chạy phân tích cho file điểm thành phần.
+
+    `group_col` (ví dụ 'lop') chọn nhóm so sánh cho phát hiện Inter-student;
+    `rule_list` thay cho các quy tắc kiểm tra trong tệp quy tắc mặc định;
+    `methods` là các phương pháp phát hiện (khóa của DETECTION_METHODS).
+    """
+    return prepare_component_analysis(df, group_col, rule_list, methods).detect(z_thresh)
+
+def run_summary_analysis(df, z_thresh, group_col=None, methods=DEFAULT_DETECTION_METHODS):
+    """
+    Hàm tổng hợp để chạy phân tích cho file điểm tổng hợp.
+
+    `group_col` (ví dụ 'lop') chọn nhóm so sánh cho phát hiện Inter-student;
+    `methods` là các phương pháp phát hiện (khóa của DETECTION_METHODS).
+    """
+    return prepare_summary_analysis(df, group_col, methods).detect(z_thresh)
@@ -0,0 +1,281 @@
+# modules/benchmark.py
+
+"""
+Bộ đo hiệu năng cho toàn bộ quy trình: đọc tệp, các hàm phát hiện bất thường
+trong `modules/analysis.py`, các hàm vẽ biểu đồ trong `modules/visualization.py`
+và các hàm xuất báo cáo trong `modules/utils.py`, trên dữ liệu giả lập
+(`modules/synthetic.py`) ở nhiều quy mô.
+
+Mỗi phép đo ghi thời gian chạy (giây) và bộ nhớ cấp phát đỉnh (MB, đo bằng
+`tracemalloc` ở một lần chạy riêng để không làm sai lệch thời gian). Kết quả
+được lưu thành JSON kèm mã commit để so sánh giữa các phiên bản.
+
+Ví dụ:
+    python -m modules.benchmark --sizes 1000 10000 100000 --output ket_qua.json
+    python -m modules.benchmark --sizes 100000 --compare ket_qua_cu.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from modules import analysis, cache, history, ingest, students, synthetic, utils, visualization
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+# Ghi/đọc Excel chậm hơn CSV hàng chục lần; bỏ qua trên các bảng lớn hơn ngưỡng này
+DEFAULT_MAX_EXCEL_ROWS = 20_000
+DEFAULT_THRESHOLD = 2.5
+TYPE_LABELS = {'component': "Điểm thành phần", 'summary': "Điểm tổng hợp"}
+
+def measure(fn, memory=True):
+    """
+    Chạy `fn` một lần để đo thời gian, và (nếu `memory`) thêm một lần dưới
+    `tracemalloc` để đo bộ nhớ cấp phát đỉnh.
+
+    Returns:
+        tuple: (kết quả của fn, thời gian tính bằng giây, bộ nhớ đỉnh MB hoặc None).
+    """
+    start = time.perf_counter()
+    result = fn()
+    wall = time.perf_counter() - start
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return result, wall, peak_mb
+
+def _output_size(result):
+    # Số dòng của bảng kết quả, số ô Z-score, hoặc số byte của tệp xuất
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, analysis.ZScoreMatrix):
+        return int(result.z_scores.size)
+    if isinstance(result, analysis.MahalanobisScores):
+        return int(result.z_scores.size)
+    if isinstance(result, analysis.PreparedAnalysis):
+        return len(result.df)
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    return None
+
+def benchmark_cases(df, analysis_type, max_excel_rows=DEFAULT_MAX_EXCEL_ROWS, z_thresh=DEFAULT_THRESHOLD):
+    """
+    Danh sách các phép đo cho một bảng điểm.
+
+    Returns:
+        list: Các bộ (tên, hàm không đối số, lý do bỏ qua hoặc None).
+    """
+    label = TYPE_LABELS[analysis_type]
+    if analysis_type == 'component':
+        score_cols = analysis.COMPONENT_SCORE_COLS
+        prepare = analysis.prepare_component_analysis
+        run = analysis.run_component_analysis
+    else:
+        score_cols = analysis.SUMMARY_SUBJECT_COLS
+        prepare = analysis.prepare_summary_analysis
+        run = analysis.run_summary_analysis
+    excel_skip = f"> {max_excel_rows} dòng" if len(df) > max_excel_rows else None
+
+    csv_bytes = df.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
+    excel_bytes = utils.prepare_excel_download({"Sheet1": df}) if excel_skip is None else None
+    prepared = prepare(df)
+    anomalies = prepared.detect(z_thresh)
+    # Cache trên đĩa trong thư mục tạm, không đụng tới cache của ứng dụng
+    disk_cache = cache.DiskCache(tempfile.mkdtemp(prefix="benchmark_cache_"))
+    disk_cache.put_frame("data", df)
+    # Kho lịch sử trong thư mục tạm, đã có sẵn một kỳ để đo các truy vấn
+    store = history.HistoryStore(tempfile.mkdtemp(prefix="benchmark_history_"))
+    store.save_run(df, anomalies, analysis_type, "2023-2024", "HK1", z_thresh)
+    first_class = str(df['lop'].iloc[0]) if 'lop' in df.columns else "N/A"
+    # Bộ lọc như khi bỏ chọn một nửa số lớp và mức độ Thấp trên giao diện
+    anomaly_index = analysis.build_anomaly_index(anomalies)
+    filter_selections = {
+        "lop": anomaly_index.options.get("lop", [])[::2],
+        "MucDo": [level for level in anomaly_index.options.get("MucDo", []) if level != "Thấp"],
+    }
+    student_index = students.build_student_index(df)
+    student_id = str(df['MaHS'].iloc[len(df) // 2])
+    report = {"Bất thường đã lọc": anomalies, "Tất cả bất thường": anomalies, "Dữ liệu gốc": df}
+    formatters = {"Bất thường đã lọc": analysis.format_anomalies, "Tất cả bất thường": analysis.format_anomalies}
+
+    cases = [
+        # Phần việc của utils.load_data khi chưa có cache, và khi đọc lại từ cache trên đĩa
+        ("load_data[csv]", lambda: ingest.read_table(BytesIO(csv_bytes), "data.csv"), None),
+        ("load_data[xlsx]", lambda: ingest.read_table(BytesIO(excel_bytes), "data.xlsx"), excel_skip),
+        ("load_data[cache]", lambda: disk_cache.get_frame("data"), None),
+        ("read_tables[xlsx x4]",
+         lambda: ingest.read_tables([(f"data{i}.xlsx", excel_bytes) for i in range(4)]), excel_skip),
+        ("compute_inter_student_zscores", lambda: analysis.compute_inter_student_zscores(df, score_cols), None),
+        ("compute_inter_student_zscores[lop]",
+         lambda: analysis.compute_inter_student_zscores(df, score_cols, 'lop'), None),
+        ("detect_inter_student_anomalies",
+         lambda: analysis.detect_inter_student_anomalies(df, score_cols, z_thresh), None),
+        ("detect_missing_values", lambda: analysis.detect_missing_values(df, score_cols), None),
+        ("detect_duplicate_score_vectors", lambda: analysis.detect_duplicate_score_vectors(df, score_cols), None),
+        ("compute_mahalanobis_scores", lambda: analysis.compute_mahalanobis_scores(df, score_cols), None),
+        ("compute_score_statistics[lop]",
+         lambda: analysis.compute_score_statistics(df, score_cols, 'lop', robust=False), None),
+        ("compute_score_statistics[lop, robust]",
+         lambda: analysis.compute_score_statistics(df, score_cols, 'lop'), None),
+        ("compute_method_zscores[lop, mad]",
+         lambda: analysis.compute_method_zscores(df, score_cols, 'lop', analysis_type == 'summary', ("mad",)), None),
+        ("compute_method_zscores[lop, zscore+mad+iqr]",
+         lambda: analysis.compute_method_zscores(df, score_cols, 'lop', analysis_type == 'summary',
+                                                 tuple(analysis.DETECTION_METHODS)), None),
+    ]
+    if analysis_type == 'component':
+        cases.append(("detect_rule_violations",
+                      lambda: analysis.detect_rule_violations(df, score_cols)[0], None))
+    if analysis_type == 'summary':
+        cases += [
+            ("compute_intra_student_zscores", lambda: analysis.compute_intra_student_zscores(df, score_cols), None),
+            ("detect_intra_student_subject_deviation",
+             lambda: analysis.detect_intra_student_subject_deviation(df, score_cols, z_thresh), None),
+        ]
+    cases += [
+        (prepare.__name__, lambda: prepare(df), None),
+        ("PreparedAnalysis.detect", lambda: prepared.detect(z_thresh), None),
+        (run.__name__, lambda: run(df, z_thresh), None),
+        ("format_anomalies", lambda: analysis.format_anomalies(anomalies), None),
+        ("build_anomaly_index", lambda: analysis.build_anomaly_index(anomalies), None),
+        ("AnomalyIndex.select", lambda: anomaly_index.select(anomalies, filter_selections), None),
+        ("build_student_index", lambda: students.build_student_index(df), None),
+        ("StudentIndex.search", lambda: student_index.search(student_id[:3]), None),
+        ("student_profile",
+         lambda: students.student_profile(df, score_cols, int(student_index.lookup(student_id)[0]), student_index),
+         None),
+        ("AnomalyIndex.rows_of", lambda: anomaly_index.rows_of(student_index.lookup(student_id)), None),
+        ("HistoryStore.save_run",
+         lambda: store.save_run(df, anomalies, analysis_type, "2024-2025", "HK1", z_thresh), None),
+        ("HistoryStore.student_history",
+         lambda: store.student_history(df['MaHS'].iloc[len(df) // 2], analysis_type)[0], None),
+        ("HistoryStore.anomaly_counts", lambda: store.anomaly_counts(analysis_type), None),
+        ("HistoryStore.score_trend[lop]",
+         lambda: store.score_trend(analysis_type, filters={"lop": first_class}), None),
+        ("score_distribution[lop]", lambda: analysis.score_distribution(df, score_cols[0], "lop"), None),
+        ("plot_score_distribution", lambda: visualization.plot_score_distribution(df, score_cols[0]), None),
+        ("plot_anomalies_by_class", lambda: visualization.plot_anomalies_by_class(anomalies), None),
+        ("plot_anomaly_types", lambda: visualization.plot_anomaly_types(anomalies), None),
+        ("plot_anomalies_heatmap", lambda: visualization.plot_anomalies_heatmap(df, anomalies, score_cols), None),
+        ("plot_anomalies_heatmap[sort]",
+         lambda: visualization.plot_anomalies_heatmap(df, anomalies, score_cols, sort_by_anomalies=True), None),
+    ]
+    for export_fn, _, _ in utils.REPORT_FORMATS.values():
+        skip = excel_skip if export_fn is utils.prepare_excel_download else None
+        cases.append((export_fn.__name__,
+                      lambda export_fn=export_fn: export_fn(report, formatters), skip))
+    return [(f"{label} · {name}", fn, skip) for name, fn, skip in cases]
+
+def run_benchmarks(sizes=DEFAULT_SIZES, analysis_types=('component', 'summary'), memory=True,
+                   max_excel_rows=DEFAULT_MAX_EXCEL_ROWS, seed=0, log=print):
+    """
+    Sinh dữ liệu cho từng (quy mô, loại dữ liệu) và chạy mọi phép đo.
+
+    Returns:
+        list: Mỗi phần tử là dict gồm case, analysis_type, n_students, wall_s,
+        peak_mb, output_size (số dòng, số ô Z-score hoặc số byte), skipped.
+    """
+    results = []
+    for n_students in sizes:
+        for analysis_type in analysis_types:
+            df = synthetic.generate_scores(n_students, analysis_type, seed=seed)
+            for name, fn, skip in benchmark_cases(df, analysis_type, max_excel_rows):
+                record = {"case": name, "analysis_type": analysis_type, "n_students": n_students,
+                          "wall_s": None, "peak_mb": None, "output_size": None, "skipped": skip}
+                if skip is None:
+                    result, wall, peak_mb = measure(fn, memory)
+                    record.update(wall_s=round(wall, 4), output_size=_output_size(result),
+                                  peak_mb=None if peak_mb is None else round(peak_mb, 2))
+                results.append(record)
+                log(_format_record(record))
+    return results
+
+def _format_record(record):
+    if record["skipped"]:
+        return f"{record['n_students']:>9} {record['case']:<70} bỏ qua ({record['skipped']})"
+    peak = "" if record["peak_mb"] is None else f"{record['peak_mb']:>10.1f} MB"
+    return f"{record['n_students']:>9} {record['case']:<70} {record['wall_s']:>9.3f} s {peak}"
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment_info():
+    """Thông tin môi trường đi kèm kết quả (commit, phiên bản thư viện, máy)."""
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def compare_results(current, baseline):
+    """
+    So sánh thời gian với một tệp kết quả cũ theo (case, n_students).
+
+    Returns:
+        pd.DataFrame: Thời gian cũ, mới và tỷ lệ mới/cũ (> 1 là chậm đi).
+    """
+    key = ["case", "n_students"]
+    old = pd.DataFrame(baseline["results"])[key + ["wall_s"]]
+    new = pd.DataFrame(current["results"])[key + ["wall_s"]]
+    merged = new.merge(old, on=key, suffixes=("_new", "_old")).dropna()
+    merged["ratio"] = merged["wall_s_new"] / merged["wall_s_old"]
+    return merged
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng phân tích, vẽ biểu đồ và xuất báo cáo trên dữ liệu giả lập.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Các quy mô (số học sinh) cần đo")
+    parser.add_argument("--type", choices=["component", "summary", "all"], default="all", help="Loại dữ liệu")
+    parser.add_argument("--output", default=None, help="Tệp JSON kết quả (mặc định benchmark_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Tệp JSON kết quả cũ để so sánh")
+    parser.add_argument("--no-memory", action="store_true", help="Không đo bộ nhớ (nhanh hơn)")
+    parser.add_argument("--max-excel-rows", type=int, default=DEFAULT_MAX_EXCEL_ROWS,
+                        help="Bỏ qua đọc/ghi Excel khi bảng lớn hơn số dòng này")
+    parser.add_argument("--seed", type=int, default=0, help="Hạt giống ngẫu nhiên của dữ liệu giả lập")
+    args = parser.parse_args(argv)
+
+    analysis_types = ('component', 'summary') if args.type == "all" else (args.type,)
+    env = environment_info()
+    results = run_benchmarks(args.sizes, analysis_types, not args.no_memory, args.max_excel_rows, args.seed)
+    report = {"environment": env, "params": {"sizes": args.sizes, "types": list(analysis_types),
+                                             "threshold": DEFAULT_THRESHOLD, "seed": args.seed},
+              "results": results}
+
+    output = args.output or f"benchmark_{env['commit'] or 'local'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Đã lưu kết quả vào '{output}'.")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        comparison = compare_results(report, baseline)
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(comparison.sort_values("ratio", ascending=False).to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+# modules/cache.py
+
+"""
+Bộ nhớ đệm trên đĩa, đánh địa chỉ theo nội dung, cho dữ liệu đã đọc và kết
+quả phân tích.
+
+Khóa cache là mã băm SHA-256 của nội dung tệp cùng các tùy chọn liên quan
+(cách đọc tệp, loại dữ liệu, nhóm so sánh, ngưỡng...). DataFrame được lưu
+dạng Parquet nên đọc lại nhanh hơn nhiều so với phân tích lại tệp Excel, và
+cache vẫn còn sau khi khởi động lại hoặc triển khai lại ứng dụng.
+
+Dung lượng được giới hạn bằng cơ chế loại bỏ theo thứ tự ít dùng gần đây nhất
+(LRU, dựa trên thời điểm truy cập ghi vào mtime của tệp).
+
+Xóa cache từ dòng lệnh:
+    python -m modules.cache --clear
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import threading
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Tăng số này khi thay đổi cách đọc tệp hoặc cấu trúc bảng kết quả,
+# để các mục cache cũ không còn được dùng.
+CACHE_VERSION = 4
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ANOMALY_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+)
+DEFAULT_MAX_BYTES = int(float(os.environ.get("ANOMALY_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+_SUFFIX = ".parquet"
+
+def make_key(*parts):
+    """
+    Tạo khóa cache từ các thành phần (mã băm tệp, tùy chọn...). Các thành phần
+    được chuyển thành chuỗi bằng repr nên phải có biểu diễn ổn định.
+    """
+    h = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    for part in parts:
+        h.update(b"\x00")
+        h.update(repr(part).encode())
+    return h.hexdigest()
+
+class DiskCache:
+    """
+    Cache DataFrame trên đĩa với giới hạn dung lượng và bộ đếm hit/miss.
+
+    Mỗi mục là một tệp Parquet `<khóa>.parquet` trong `directory`. Việc ghi
+    dùng tệp tạm rồi đổi tên, nên nhiều tiến trình có thể dùng chung thư mục.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get_frame(self, key):
+        """
+        Đọc DataFrame theo khóa; trả về None nếu chưa có (hoặc tệp hỏng).
+        """
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning("Bỏ qua mục cache hỏng %s: %s", path, e)
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Đánh dấu vừa được dùng (cho LRU)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def put_frame(self, key, df):
+        """
+        Lưu DataFrame theo khóa rồi loại bỏ các mục cũ nếu vượt giới hạn dung lượng.
+
+        Returns:
+            bool: False nếu DataFrame không lưu được dạng Parquet (ví dụ cột
+            chứa lẫn số và chuỗi); khi đó cache đơn giản là bị bỏ qua.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.info("Không lưu được mục cache %s: %s", key, e)
+            self._remove(tmp_path)
+            return False
+
+        self._evict()
+        return True
+
+    def get_or_compute(self, key, compute):
+        """
+        Trả về DataFrame trong cache, hoặc gọi `compute()` rồi lưu kết quả.
+        """
+        df = self.get_frame(key)
+        if df is None:
+            df = compute()
+            if df is not None:
+                self.put_frame(key, df)
+        return df
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Xóa các mục ít được dùng gần đây nhất cho đến khi dưới giới hạn dung lượng."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def invalidate(self, key=None):
+        """
+        Xóa một mục theo khóa, hoặc toàn bộ cache nếu `key` là None.
+        """
+        if key is not None:
+            self._remove(self._path(key))
+            return
+        for _, _, path in self._entries():
+            self._remove(path)
+
+    def stats(self):
+        """
+        Thống kê cache: số lần hit/miss của tiến trình hiện tại, số mục và dung lượng.
+        """
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "size_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+_default_cache = None
+
+def default_cache():
+    """Cache dùng chung của tiến trình (thư mục và dung lượng lấy từ biến môi trường)."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = DiskCache()
+    return _default_cache
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quản lý bộ nhớ đệm trên đĩa của ứng dụng.")
+    parser.add_argument("--clear", action="store_true", help="Xóa toàn bộ cache")
+    args = parser.parse_args(argv)
+
+    cache = default_cache()
+    if args.clear:
+        cache.invalidate()
+        print(f"Đã xóa cache tại '{cache.directory}'.")
+    stats = cache.stats()
+    print(f"Cache '{cache.directory}': {stats['entries']} mục, "
+          f"{stats['size_bytes'] / 1024 / 1024:.1f}/{stats['max_bytes'] / 1024 / 1024:.0f} MB.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# modules/cli.py
+
+"""
+Chạy phân tích điểm bất thường hàng loạt từ dòng lệnh, không cần giao diện.
+
+Mỗi tệp (CSV/XLSX) được đọc và phân tích trong một tiến trình riêng của
+`ProcessPoolExecutor`; loại dữ liệu (điểm thành phần hay điểm tổng hợp) được
+tự nhận diện từ tên cột. Kết quả gồm một bảng bất thường gộp (thêm cột
+TepNguon) và một bảng tóm tắt thời gian/số dòng của từng tệp. Thứ tự đầu ra
+luôn theo thứ tự đường dẫn tệp đã sắp xếp, không phụ thuộc tiến trình nào
+xong trước.
+
+Ví dụ:
+    python -m modules.cli "du_lieu/*.xlsx" du_lieu_hk2/ --workers 32 --group lop \\
+        --output bat_thuong.csv --summary tom_tat.csv
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from modules import analysis, ingest
+
+ANALYSIS_RUNNERS = {
+    'component': analysis.run_component_analysis,
+    'summary': analysis.run_summary_analysis,
+}
+
+def collect_files(patterns):
+    """
+    Mở rộng danh sách thư mục / mẫu glob / đường dẫn thành danh sách tệp được
+    hỗ trợ, đã loại trùng và sắp xếp để thứ tự xử lý luôn cố định.
+    """
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = glob.glob(os.path.join(pattern, '**', '*'), recursive=True)
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        for path in candidates:
+            if os.path.isfile(path) and path.rsplit('.', 1)[-1].lower() in ingest.SUPPORTED_EXTENSIONS:
+                files.add(os.path.normpath(path))
+    return sorted(files)
+
+def analyze_file(path, z_thresh, group_col=None, file_name=None, methods=analysis.DEFAULT_DETECTION_METHODS):
+    """
+    Đọc và phân tích một tệp. Hàm chạy trong tiến trình con nên không được
+    ném lỗi ra ngoài: lỗi được ghi vào bảng tóm tắt.
+
+    Args:
+        path: Đường dẫn tệp, hoặc đối tượng tệp (BytesIO...) kèm `file_name`.
+        z_thresh (float): Ngưỡng Z-score.
+        group_col (str, optional): Cột chia nhóm so sánh.
+        file_name (str, optional): Tên tệp để xác định định dạng và ghi vào
+            cột TepNguon; mặc định là `path`.
+        methods (tuple): Các phương pháp phát hiện (khóa của analysis.DETECTION_METHODS).
+
+    Returns:
+        tuple: (bảng bất thường đã định dạng, dict tóm tắt của tệp).
+    """
+    source_name = file_name or path
+    summary = {"TepNguon": source_name, "LoaiDuLieu": None, "SoDong": 0, "SoBatThuong": 0,
+               "ThoiGianDoc_s": 0.0, "ThoiGianPhanTich_s": 0.0, "Loi": None}
+    try:
+        start = time.perf_counter()
+        # Chỉ đọc các cột cần cho phân tích (mã, lớp, cột điểm, cột nhóm)
+        df = ingest.read_table(path, file_name, columns=ingest.analysis_columns(group_col))
+        summary["ThoiGianDoc_s"] = time.perf_counter() - start
+        summary["SoDong"] = len(df)
+
+        analysis_type = analysis.detect_analysis_type(df.columns)
+        if analysis_type is None:
+            raise ValueError("Không tìm thấy cột điểm nào được hỗ trợ.")
+        summary["LoaiDuLieu"] = analysis_type
+        if group_col is not None and group_col not in df.columns:
+            raise ValueError(f"Không có cột nhóm '{group_col}'.")
+
+        start = time.perf_counter()
+        df_anomalies = analysis.format_anomalies(
+            ANALYSIS_RUNNERS[analysis_type](df, z_thresh, group_col, methods=methods)
+        )
+        summary["ThoiGianPhanTich_s"] = time.perf_counter() - start
+        summary["SoBatThuong"] = len(df_anomalies)
+    except Exception as e:
+        summary["Loi"] = f"{type(e).__name__}: {e}"
+        return pd.DataFrame(), summary
+
+    df_anomalies.insert(0, "TepNguon", source_name)
+    return df_anomalies, summary
+
+def run_batch(files, z_thresh, group_col=None, workers=None, methods=analysis.DEFAULT_DETECTION_METHODS):
+    """
+    Phân tích nhiều tệp song song.
+
+    Args:
+        files (list): Danh sách đường dẫn tệp (xem `collect_files`).
+        z_thresh (float): Ngưỡng Z-score.
+        group_col (str, optional): Cột chia nhóm so sánh.
+        workers (int, optional): Số tiến trình; mặc định bằng số CPU.
+        methods (tuple): Các phương pháp phát hiện (khóa của analysis.DETECTION_METHODS).
+
+    Returns:
+        tuple: (bảng bất thường gộp, bảng tóm tắt từng tệp), theo thứ tự `files`.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(files) <= 1:
+        results = [analyze_file(path, z_thresh, group_col, methods=methods) for path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+            # executor.map trả kết quả theo đúng thứ tự đầu vào
+            results = list(executor.map(
+                analyze_file, files, [z_thresh] * len(files), [group_col] * len(files), [None] * len(files),
+                [methods] * len(files), chunksize=1
+            ))
+
+    frames = [frame for frame, _ in results if not frame.empty]
+    merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    summary = pd.DataFrame([file_summary for _, file_summary in results])
+    return merged, summary
+
+def write_table(df, path):
+    """Ghi bảng ra CSV, Parquet hoặc Excel theo phần mở rộng của `path`."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.parquet', '.pq'):
+        # Cột DiemBatThuong chứa cả số và "Bị trống"
+        df.astype({col: "string" for col in df.columns if df[col].dtype == object}).to_parquet(path, index=False)
+    elif extension in ('.xlsx', '.xls'):
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+
+def threshold_arg(text):
+    """Kiểu tham số --threshold cho argparse (xem `analysis.parse_threshold`)."""
+    try:
+        return analysis.parse_threshold(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Phân tích điểm bất thường hàng loạt cho nhiều tệp CSV/XLSX.")
+    parser.add_argument("inputs", nargs="+", help="Thư mục, mẫu glob hoặc đường dẫn tệp")
+    parser.add_argument("--output", default="bat_thuong.csv", help="Bảng bất thường gộp (.csv/.parquet/.xlsx)")
+    parser.add_argument("--summary", default="tom_tat.csv", help="Bảng tóm tắt từng tệp (.csv/.parquet/.xlsx)")
+    parser.add_argument("--threshold", type=threshold_arg, default=2.5, help="Ngưỡng Z-score (mặc định 2.5)")
+    parser.add_argument("--group", default=None, help="Cột chia nhóm so sánh, ví dụ 'lop'")
+    parser.add_argument("--workers", type=int, default=None, help="Số tiến trình song song (mặc định: số CPU)")
+    parser.add_argument("--methods", nargs="+", choices=list(analysis.DETECTION_METHODS),
+                        default=list(analysis.DEFAULT_DETECTION_METHODS),
+                        help="Phương pháp phát hiện: zscore (trung bình/độ lệch chuẩn), mad (trung vị/MAD), "
+                             "iqr (hàng rào tứ phân vị); mặc định zscore")
+    args = parser.parse_args(argv)
+
+    files = collect_files(args.inputs)
+    if not files:
+        print("Không tìm thấy tệp CSV/XLSX nào.", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    methods = tuple(method for method in analysis.DETECTION_METHODS if method in args.methods)
+    merged, summary = run_batch(files, args.threshold, args.group, args.workers, methods)
+    elapsed = time.perf_counter() - start
+
+    write_table(merged, args.output)
+    write_table(summary, args.summary)
+
+    n_failed = summary["Loi"].notna().sum()
+    print(f"Đã phân tích {len(files)} tệp ({summary['SoDong'].sum()} dòng) trong {elapsed:.2f}s: "
+          f"{len(merged)} bất thường, {n_failed} tệp lỗi.")
+    print(f"Kết quả: '{args.output}'; tóm tắt: '{args.summary}'.")
+    return 1 if n_failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
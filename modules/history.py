@@ -0,0 +1,505 @@
+# modules/history.py
+
+"""
+Kho lịch sử các lần phân tích, để theo dõi học sinh và lớp qua nhiều học kỳ,
+năm học mà không cần tải lại các tệp cũ.
+
+Mỗi lần lưu ghi các bảng Parquet vào thư mục lịch sử (mặc định `.history/`,
+đổi bằng biến môi trường ANOMALY_HISTORY_DIR), tách riêng cho điểm thành phần
+và điểm tổng hợp:
+
+- diem: điểm đã chuẩn hóa dạng dài (lop, MaHS, CotDiem, Diem), mỗi ô điểm một dòng;
+- batthuong: các bất thường phát hiện được (kèm ngưỡng Z-score đã dùng);
+- hocsinh: chỉ mục MaHS -> lop của từng kỳ, sắp xếp theo MaHS;
+- lanchay: một dòng tóm tắt cho mỗi lần lưu (tệp nguồn, số học sinh, số bất thường...).
+
+Các bảng được chia thư mục theo năm học và học kỳ
+(`NamHoc=2024-2025/HocKy=HK1/<mã lần lưu>.parquet`). Trong mỗi tệp, các dòng
+được sắp xếp theo lớp rồi MaHS và mỗi row group chứa trọn một số lớp, nên lớp
+là khóa phân vùng thứ ba ở mức row group: điều kiện trên lớp chỉ đọc các row
+group của lớp đó theo thống kê min/max. (Mỗi lớp một thư mục sẽ sinh hàng chục
+nghìn tệp nhỏ mỗi kỳ với dữ liệu cấp tỉnh, làm việc ghi và mọi truy vấn quét
+nhiều tệp chậm đi hàng chục lần.)
+
+Khi truy vấn, điều kiện trên NamHoc/HocKy loại bỏ cả thư mục, điều kiện trên
+lop/MaHS loại bỏ các row group, và chỉ các cột được yêu cầu được đọc. Tra cứu
+một học sinh dùng chỉ mục hocsinh để biết lớp của học sinh trong từng kỳ. Các
+phép tổng hợp (số bất thường, điểm trung bình theo kỳ) được tính dần theo từng
+lô dòng, nên dữ liệu nhiều năm của cả tỉnh không cần nằm trọn trong bộ nhớ.
+
+Lưu lại cùng năm học và học kỳ sẽ thay thế dữ liệu của các lớp có trong tệp
+mới; dữ liệu của các lớp khác (ví dụ từ tệp của trường khác) được giữ nguyên.
+
+Ví dụ:
+    python -m modules.history save diem_hk1.csv --year 2024-2025 --term HK1 --group lop
+    python -m modules.history student 51000003
+    python -m modules.history counts --type component --output so_bat_thuong.csv
+"""
+
+import argparse
+import glob
+import os
+import re
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from modules import analysis, profiling
+
+DEFAULT_HISTORY_DIR = os.environ.get(
+    "ANOMALY_HISTORY_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".history")
+)
+
+# Học kỳ theo thứ tự thời gian trong một năm học (CN: cả năm)
+TERMS = ("HK1", "HK2", "CN")
+SCHOOL_YEAR_PATTERN = re.compile(r"^(\d{4})-(\d{4})$")
+
+PARTITION_COLUMNS = ("NamHoc", "HocKy")
+PARTITIONING = ds.partitioning(pa.schema([(col, pa.string()) for col in PARTITION_COLUMNS]), flavor="hive")
+
+# Cấu trúc cố định của từng bảng (không kể các cột chia thư mục)
+TABLE_SCHEMAS = {
+    "diem": pa.schema([("lop", pa.string()), ("MaHS", pa.string()), ("CotDiem", pa.string()),
+                       ("Diem", pa.float64())]),
+    "batthuong": pa.schema([
+        ("lop", pa.string()), ("MaHS", pa.string()), ("CotDiem", pa.string()), ("DiemBatThuong", pa.float64()),
+        ("LoaiBatThuong", pa.string()), ("MucDo", pa.string()), ("ZScore", pa.float64()),
+        ("TrungBinhThamChieu", pa.float64()), ("DoLechChuanThamChieu", pa.float64()),
+        ("NhomThamChieu", pa.string()), ("NguongZ", pa.float64()),
+    ]),
+    "hocsinh": pa.schema([("MaHS", pa.string()), ("lop", pa.string())]),
+    "lanchay": pa.schema([
+        ("MaLanChay", pa.string()), ("TepNguon", pa.string()), ("ThoiGianLuu", pa.string()),
+        ("NhomSoSanh", pa.string()), ("NguongZ", pa.float64()), ("SoHocSinh", pa.int64()),
+        ("SoLop", pa.int64()), ("SoBatThuong", pa.int64()),
+    ]),
+}
+
+# Số dòng tối đa của mỗi row group (một lớp lớn hơn vẫn nằm trọn trong một row group)
+ROW_GROUP_ROWS = 64 * 1024
+
+class HistoryError(ValueError):
+    """Năm học, học kỳ hoặc dữ liệu cần lưu không hợp lệ."""
+
+def check_period(school_year, term):
+    """
+    Kiểm tra năm học (dạng "2024-2025", hai năm liên tiếp) và học kỳ (một trong TERMS).
+
+    Raises:
+        HistoryError: Nếu không hợp lệ.
+    """
+    match = SCHOOL_YEAR_PATTERN.match(str(school_year).strip())
+    if match is None or int(match.group(2)) != int(match.group(1)) + 1:
+        raise HistoryError(f"Năm học '{school_year}' không hợp lệ (dạng 2024-2025).")
+    if term not in TERMS:
+        raise HistoryError(f"Học kỳ '{term}' không hợp lệ (dùng {', '.join(TERMS)}).")
+    return match.group(0), term
+
+def sort_periods(df):
+    """Sắp xếp bảng có cột NamHoc, HocKy theo thứ tự thời gian; thêm cột Ky ("2024-2025 HK1")."""
+    if df.empty:
+        return df.assign(Ky=pd.Series(dtype=str))
+    order = df["HocKy"].map({term: i for i, term in enumerate(TERMS)})
+    df = df.assign(Ky=df["NamHoc"] + " " + df["HocKy"], _order=order)
+    keys = ["NamHoc", "_order"] + [col for col in ("lop", "CotDiem") if col in df.columns]
+    return df.sort_values(keys, kind="stable").drop(columns="_order").reset_index(drop=True)
+
+def _filter_expression(filters):
+    """Biểu thức lọc của pyarrow từ dict cột -> giá trị (hoặc danh sách giá trị)."""
+    expression = None
+    for col, value in (filters or {}).items():
+        if value is None:
+            continue
+        text = col in ("lop", "MaHS") + PARTITION_COLUMNS
+        if isinstance(value, (list, tuple, set, frozenset)):
+            condition = ds.field(col).isin([str(v) for v in value] if text else list(value))
+        else:
+            condition = ds.field(col) == (str(value) if text else value)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def _class_labels(frame):
+    """Cột lớp dạng chuỗi ("N/A" nếu thiếu)."""
+    if "lop" not in frame.columns:
+        return pd.Series("N/A", index=frame.index, dtype=str)
+    return frame["lop"].astype(str).fillna("N/A")
+
+def _key_arrays(df):
+    """Cột lop và MaHS dạng mảng chuỗi của pyarrow, cùng thứ tự sắp xếp theo lớp rồi MaHS."""
+    classes = pa.array(_class_labels(df), pa.string())
+    ids = pa.array(df["MaHS"].astype(str), pa.string())
+    order = pc.sort_indices(pa.table({"lop": classes, "MaHS": ids}),
+                            sort_keys=[("lop", "ascending"), ("MaHS", "ascending")])
+    return classes, ids, order.to_numpy()
+
+def _score_table(df, score_cols):
+    """Bảng điểm dạng dài (lop, MaHS, CotDiem, Diem), sắp xếp theo lớp rồi MaHS."""
+    classes, ids, order = _key_arrays(df)
+    values = analysis.score_matrix(df, score_cols)
+    rows = np.repeat(order, len(score_cols))
+    return pa.table({
+        "lop": classes.take(rows),
+        "MaHS": ids.take(rows),
+        "CotDiem": pa.array(score_cols, pa.string()).take(np.tile(np.arange(len(score_cols)), len(df))),
+        # Ô trống ghi thành null để các phép tổng hợp của pyarrow bỏ qua
+        "Diem": pa.array(values[order].reshape(-1), pa.float64(), from_pandas=True),
+    }, schema=TABLE_SCHEMAS["diem"])
+
+def _anomaly_table(df_anomalies, z_thresh):
+    """Bảng bất thường (kết quả chưa định dạng của các hàm phân tích), sắp xếp theo lớp rồi MaHS."""
+    schema = TABLE_SCHEMAS["batthuong"]
+    out = pd.DataFrame({
+        col: (df_anomalies[col].astype(str) if field.type == pa.string() else df_anomalies[col].astype(float))
+        for col, field in zip(schema.names, schema) if col in df_anomalies.columns and col != "lop"
+    }).assign(NguongZ=float(z_thresh), lop=_class_labels(df_anomalies).to_numpy())
+    out = out.sort_values(["lop", "MaHS"], kind="stable")[schema.names]
+    return pa.Table.from_pandas(out, schema=schema, preserve_index=False)
+
+def _student_index(df):
+    """Chỉ mục MaHS -> lop của một kỳ, sắp xếp theo MaHS."""
+    classes = pa.array(_class_labels(df), pa.string())
+    ids = pa.array(df["MaHS"].astype(str), pa.string())
+    order = pc.sort_indices(ids)
+    return pa.table({"MaHS": ids.take(order), "lop": classes.take(order)}, schema=TABLE_SCHEMAS["hocsinh"])
+
+def _write_file(table, path, clustered=True):
+    """
+    Ghi bảng ra tệp Parquet (qua tệp tạm rồi đổi tên). Với `clustered`, mỗi row
+    group gồm trọn một số lớp liên tiếp (bảng đã sắp xếp theo lớp).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with pq.ParquetWriter(tmp_path, table.schema, compression="zstd") as writer:
+        if not clustered or table.num_rows == 0:
+            writer.write_table(table, row_group_size=ROW_GROUP_ROWS)
+        else:
+            # Vị trí bắt đầu của từng lớp, rồi gom các lớp liên tiếp đến khoảng ROW_GROUP_ROWS dòng
+            classes = table["lop"].to_numpy(zero_copy_only=False)
+            starts = np.flatnonzero(np.r_[True, classes[1:] != classes[:-1]])
+            bounds = [0]
+            for start in starts[1:]:
+                if start - bounds[-1] >= ROW_GROUP_ROWS:
+                    bounds.append(int(start))
+            bounds.append(table.num_rows)
+            for begin, end in zip(bounds[:-1], bounds[1:]):
+                writer.write_table(table.slice(begin, end - begin), row_group_size=end - begin)
+    os.replace(tmp_path, path)
+
+class HistoryStore:
+    """
+    Kho lịch sử dạng Parquet chia thư mục theo kỳ (xem mô tả module).
+
+    Mỗi loại dữ liệu ('component', 'summary') có thư mục riêng trong
+    `directory`, gồm các bảng diem/, batthuong/, hocsinh/ và lanchay/.
+    """
+
+    def __init__(self, directory=DEFAULT_HISTORY_DIR):
+        self.directory = directory
+
+    def _path(self, analysis_type, table, school_year=None, term=None):
+        path = os.path.join(self.directory, analysis_type, table)
+        if school_year is not None:
+            path = os.path.join(path, f"NamHoc={school_year}", f"HocKy={term}")
+        return path
+
+    @profiling.profiled("history.save_run")
+    def save_run(self, df, df_anomalies, analysis_type, school_year, term, z_thresh,
+                 group_col=None, source=None):
+        """
+        Lưu điểm và bất thường của một lần phân tích vào kho.
+
+        Args:
+            df (pd.DataFrame): Bảng điểm đã phân tích (cần có cột MaHS).
+            df_anomalies (pd.DataFrame): Kết quả chưa định dạng của các hàm phân tích.
+            analysis_type (str): 'component' hoặc 'summary'.
+            school_year (str): Năm học, ví dụ "2024-2025".
+            term (str): Học kỳ, một trong TERMS.
+            z_thresh (float): Ngưỡng Z-score đã dùng.
+            group_col (str, optional): Cột nhóm so sánh đã dùng.
+            source (str, optional): Tên tệp nguồn.
+
+        Returns:
+            dict: Dòng tóm tắt đã ghi vào bảng lanchay.
+
+        Raises:
+            HistoryError: Nếu năm học/học kỳ không hợp lệ hoặc bảng điểm không có MaHS.
+        """
+        school_year, term = check_period(school_year, term)
+        if "MaHS" not in df.columns or df["MaHS"].isna().any():
+            raise HistoryError("Bảng điểm cần có cột MaHS (không để trống) để lưu vào lịch sử.")
+        known = analysis.COMPONENT_SCORE_COLS if analysis_type == "component" else analysis.SUMMARY_SUBJECT_COLS
+        score_cols = [col for col in known if col in df.columns]
+        run_id = uuid.uuid4().hex[:12]
+        tables = {
+            "diem": _score_table(df, score_cols),
+            "batthuong": _anomaly_table(df_anomalies, z_thresh),
+            "hocsinh": _student_index(df),
+        }
+        classes = pc.unique(tables["hocsinh"]["lop"])
+
+        # Bỏ dữ liệu đã lưu của các lớp có trong tệp mới, rồi ghi dữ liệu mới
+        for table, data in tables.items():
+            self._drop_classes(analysis_type, table, school_year, term, classes)
+            _write_file(data, os.path.join(self._path(analysis_type, table, school_year, term),
+                                           f"{run_id}.parquet"), clustered=table != "hocsinh")
+
+        run = {
+            "MaLanChay": run_id, "TepNguon": source, "ThoiGianLuu": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "NhomSoSanh": group_col or analysis.GLOBAL_BASELINE, "NguongZ": float(z_thresh),
+            "SoHocSinh": len(df), "SoLop": len(classes), "SoBatThuong": len(df_anomalies),
+        }
+        _write_file(pa.Table.from_pylist([run], schema=TABLE_SCHEMAS["lanchay"]),
+                    os.path.join(self._path(analysis_type, "lanchay", school_year, term), f"{run_id}.parquet"),
+                    clustered=False)
+        return {"NamHoc": school_year, "HocKy": term, **run}
+
+    def _drop_classes(self, analysis_type, table, school_year, term, classes):
+        """Bỏ các dòng thuộc `classes` khỏi các tệp đã lưu của một kỳ (tệp rỗng thì xóa)."""
+        for path in glob.glob(os.path.join(self._path(analysis_type, table, school_year, term), "*.parquet")):
+            # Chỉ đọc cột lop để biết tệp có chứa các lớp này không
+            overlap = pc.is_in(pq.read_table(path, columns=["lop"])["lop"], value_set=classes)
+            if not pc.any(overlap).as_py():
+                continue
+            kept = pq.read_table(path, schema=TABLE_SCHEMAS[table]).filter(pc.invert(overlap))
+            if kept.num_rows:
+                _write_file(kept, path, clustered=table != "hocsinh")
+            else:
+                os.remove(path)
+
+    def dataset(self, analysis_type, table):
+        """
+        Bảng `table` ('diem', 'batthuong', 'hocsinh', 'lanchay') dạng
+        pyarrow.dataset, chưa đọc dữ liệu; None nếu kho chưa có dữ liệu.
+        """
+        files = glob.glob(os.path.join(self._path(analysis_type, table), "NamHoc=*", "HocKy=*", "*.parquet"))
+        if not files:
+            return None
+        schema = TABLE_SCHEMAS[table]
+        for col in PARTITION_COLUMNS:
+            schema = schema.append(pa.field(col, pa.string()))
+        return ds.dataset(files, format="parquet", schema=schema, partitioning=PARTITIONING,
+                          partition_base_dir=self._path(analysis_type, table))
+
+    @profiling.profiled("history.query")
+    def query(self, analysis_type, table, columns=None, filters=None):
+        """
+        Đọc một phần của bảng: chỉ các cột `columns` và các dòng thỏa `filters`.
+
+        Args:
+            analysis_type (str): 'component' hoặc 'summary'.
+            table (str): 'diem', 'batthuong', 'hocsinh' hoặc 'lanchay'.
+            columns (list, optional): Các cột cần đọc; mặc định mọi cột.
+            filters (dict, optional): Cột -> giá trị hoặc danh sách giá trị, ví dụ
+                {"NamHoc": "2024-2025", "lop": ["10A1", "10A2"], "MaHS": "51000003"}.
+
+        Returns:
+            pd.DataFrame: Các dòng thỏa điều kiện.
+        """
+        dataset = self.dataset(analysis_type, table)
+        if dataset is None:
+            return pd.DataFrame(columns=columns or TABLE_SCHEMAS[table].names + list(PARTITION_COLUMNS))
+        return dataset.to_table(columns=columns, filter=_filter_expression(filters)).to_pandas()
+
+    def _aggregate(self, analysis_type, table, keys, aggregations, filters=None):
+        """
+        Tổng hợp theo nhóm `keys`, đọc dần từng lô dòng (chỉ các cột cần thiết).
+
+        `aggregations` là danh sách (cột, 'sum' | 'count'); kết quả của mỗi lô
+        được cộng dồn, nên bộ nhớ chỉ phụ thuộc kích thước lô và số nhóm.
+        """
+        keys = list(keys)
+        names = [f"{col}_{fn}" for col, fn in aggregations]
+        dataset = self.dataset(analysis_type, table)
+        if dataset is None:
+            return pd.DataFrame(columns=keys + names)
+        columns = list(dict.fromkeys(keys + [col for col, _ in aggregations]))
+        partials = [
+            pa.Table.from_batches([batch]).group_by(keys).aggregate(aggregations)
+            for batch in dataset.to_batches(columns=columns, filter=_filter_expression(filters))
+            if batch.num_rows
+        ]
+        if not partials:
+            return pd.DataFrame(columns=keys + names)
+        total = pa.concat_tables(partials).group_by(keys).aggregate([(name, "sum") for name in names])
+        return total.to_pandas().rename(columns={f"{name}_sum": name for name in names})
+
+    def periods(self, analysis_type):
+        """Các kỳ (NamHoc, HocKy) đã lưu, theo thứ tự thời gian; chỉ đọc tên thư mục."""
+        rows = set()
+        for path in glob.glob(os.path.join(self._path(analysis_type, "lanchay"), "NamHoc=*", "HocKy=*")):
+            year_dir, term_dir = path.split(os.sep)[-2:]
+            rows.add((year_dir.split("=", 1)[1], term_dir.split("=", 1)[1]))
+        return sort_periods(pd.DataFrame(sorted(rows), columns=list(PARTITION_COLUMNS)))
+
+    def runs(self, analysis_type, filters=None):
+        """Các lần lưu (bảng lanchay), theo thứ tự thời gian."""
+        return sort_periods(self.query(analysis_type, "lanchay", filters=filters))
+
+    def classes(self, analysis_type, filters=None):
+        """Tên các lớp đã lưu (chỉ đọc cột lop của chỉ mục hocsinh)."""
+        dataset = self.dataset(analysis_type, "hocsinh")
+        if dataset is None:
+            return []
+        classes = set()
+        for batch in dataset.to_batches(columns=["lop"], filter=_filter_expression(filters)):
+            classes.update(pc.unique(batch["lop"]).to_pylist())
+        return sorted(classes)
+
+    @profiling.profiled("history.student_history")
+    def student_history(self, student_id, analysis_type):
+        """
+        Lịch sử của một học sinh qua các kỳ.
+
+        Lớp của học sinh trong từng kỳ được tra trong chỉ mục hocsinh (sắp xếp
+        theo MaHS nên chỉ đọc vài row group), rồi bảng điểm và bất thường chỉ
+        được đọc ở các kỳ và lớp đó.
+
+        Returns:
+            tuple: (điểm dạng bảng rộng: Ky, NamHoc, HocKy, lop và mỗi cột điểm
+            một cột; các bất thường đã lưu của học sinh), theo thứ tự thời gian.
+        """
+        student_id = str(student_id)
+        known = analysis.COMPONENT_SCORE_COLS if analysis_type == "component" else analysis.SUMMARY_SUBJECT_COLS
+        placements = self.query(analysis_type, "hocsinh", filters={"MaHS": student_id})
+        score_frames, anomaly_frames = [], []
+        for (school_year, term), rows in placements.groupby(list(PARTITION_COLUMNS), sort=False):
+            filters = {"NamHoc": school_year, "HocKy": term, "lop": rows["lop"].tolist(), "MaHS": student_id}
+            score_frames.append(self.query(analysis_type, "diem", filters=filters))
+            anomaly_frames.append(self.query(analysis_type, "batthuong", filters=filters))
+        if not score_frames:
+            empty = pd.DataFrame(columns=TABLE_SCHEMAS["batthuong"].names + list(PARTITION_COLUMNS))
+            return pd.DataFrame(columns=["Ky", "NamHoc", "HocKy", "lop"]), sort_periods(empty)
+
+        anomalies = sort_periods(pd.concat(anomaly_frames, ignore_index=True))
+        scores = pd.concat(score_frames, ignore_index=True)
+        wide = scores.pivot(index=["NamHoc", "HocKy", "lop"], columns="CotDiem", values="Diem").reset_index()
+        wide.columns.name = None
+        score_cols = [col for col in known if col in wide.columns]
+        return sort_periods(wide)[["Ky", "NamHoc", "HocKy", "lop"] + score_cols], anomalies
+
+    @profiling.profiled("history.anomaly_counts")
+    def anomaly_counts(self, analysis_type, by=("NamHoc", "HocKy", "lop"), filters=None):
+        """
+        Số bất thường theo nhóm `by` (mặc định theo kỳ và lớp), kèm số học sinh
+        của nhóm (đếm trong chỉ mục hocsinh) khi `by` chỉ gồm NamHoc, HocKy, lop.
+
+        Returns:
+            pd.DataFrame: Các cột `by`, (SoHocSinh), SoBatThuong, theo thứ tự thời gian.
+        """
+        by = list(by)
+        counts = self._aggregate(analysis_type, "batthuong", by, [("MaHS", "count")], filters)
+        counts = counts.rename(columns={"MaHS_count": "SoBatThuong"})
+        if set(by) <= {"NamHoc", "HocKy", "lop"}:
+            # Nhóm không có bất thường nào vẫn được liệt kê (SoBatThuong = 0)
+            students = self._aggregate(analysis_type, "hocsinh", by, [("MaHS", "count")], filters)
+            counts = students.rename(columns={"MaHS_count": "SoHocSinh"}).merge(counts, on=by, how="left")
+            counts["SoBatThuong"] = counts["SoBatThuong"].fillna(0).astype(int)
+        return sort_periods(counts) if set(PARTITION_COLUMNS) <= set(by) else counts
+
+    @profiling.profiled("history.score_trend")
+    def score_trend(self, analysis_type, by=("NamHoc", "HocKy", "lop", "CotDiem"), filters=None):
+        """
+        Điểm trung bình theo nhóm `by` (mặc định theo kỳ, lớp và cột điểm).
+
+        Returns:
+            pd.DataFrame: Các cột `by`, DiemTrungBinh và SoDiem (số ô có điểm),
+            theo thứ tự thời gian.
+        """
+        by = list(by)
+        sums = self._aggregate(analysis_type, "diem", by, [("Diem", "sum"), ("Diem", "count")], filters)
+        sums = sums.rename(columns={"Diem_count": "SoDiem"})
+        sums["DiemTrungBinh"] = sums["Diem_sum"] / sums["SoDiem"].where(sums["SoDiem"] > 0)
+        out = sums[by + ["DiemTrungBinh", "SoDiem"]]
+        return sort_periods(out) if set(PARTITION_COLUMNS) <= set(by) else out
+
+    def clear(self, analysis_type=None):
+        """Xóa toàn bộ kho (hoặc chỉ một loại dữ liệu)."""
+        shutil.rmtree(self.directory if analysis_type is None else os.path.join(self.directory, analysis_type),
+                      ignore_errors=True)
+
+_default_store = None
+
+def default_store():
+    """Kho lịch sử dùng chung của tiến trình (thư mục lấy từ biến môi trường)."""
+    global _default_store
+    if _default_store is None:
+        _default_store = HistoryStore()
+    return _default_store
+
+def _print_or_write(df, output):
+    if output:
+        from modules import cli
+        cli.write_table(df, output)
+        print(f"Đã ghi {len(df)} dòng vào '{output}'.")
+    else:
+        print(df.to_string(index=False) if not df.empty else "Không có dữ liệu.")
+
+def main(argv=None):
+    from modules import cli, ingest
+
+    parser = argparse.ArgumentParser(description="Lưu và truy vấn lịch sử phân tích điểm bất thường theo kỳ.")
+    parser.add_argument("--dir", default=DEFAULT_HISTORY_DIR, help="Thư mục lịch sử")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    save = commands.add_parser("save", help="Phân tích một tệp và lưu vào lịch sử")
+    save.add_argument("path", help="Tệp CSV/XLSX")
+    save.add_argument("--year", required=True, help="Năm học, ví dụ 2024-2025")
+    save.add_argument("--term", required=True, choices=TERMS, help="Học kỳ")
+    save.add_argument("--group", default=None, help="Cột chia nhóm so sánh (ví dụ lop)")
+    save.add_argument("--threshold", type=cli.threshold_arg, default=2.5, help="Ngưỡng Z-score (mặc định 2.5)")
+
+    for name, help_text in (("student", "Lịch sử điểm và bất thường của một học sinh"),
+                            ("counts", "Số bất thường theo kỳ và lớp"),
+                            ("trend", "Điểm trung bình theo kỳ, lớp và cột điểm"),
+                            ("runs", "Các lần đã lưu")):
+        command = commands.add_parser(name, help=help_text)
+        if name == "student":
+            command.add_argument("student_id", help="Mã học sinh (MaHS)")
+        command.add_argument("--type", choices=("component", "summary"), default="component",
+                             help="Loại dữ liệu (mặc định component)")
+        if name in ("counts", "trend"):
+            command.add_argument("--year", default=None, help="Chỉ lấy năm học này")
+            command.add_argument("--class", dest="class_name", nargs="+", default=None, help="Chỉ lấy các lớp này")
+        command.add_argument("--output", default=None, help="Ghi kết quả ra tệp (.csv/.parquet/.xlsx)")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.dir)
+    if args.command == "save":
+        df = ingest.read_table(args.path, columns=ingest.analysis_columns(args.group))
+        analysis_type = analysis.detect_analysis_type(df.columns)
+        if analysis_type is None:
+            parser.error(f"'{args.path}': không tìm thấy cột điểm nào được hỗ trợ.")
+        prepare = analysis.prepare_component_analysis if analysis_type == "component" \
+            else analysis.prepare_summary_analysis
+        df_anomalies = prepare(df, args.group).detect(args.threshold)
+        try:
+            run = store.save_run(df, df_anomalies, analysis_type, args.year, args.term, args.threshold,
+                                 args.group, os.path.basename(args.path))
+        except HistoryError as e:
+            parser.error(str(e))
+        print(f"Đã lưu {run['SoHocSinh']} học sinh, {run['SoLop']} lớp, {run['SoBatThuong']} bất thường "
+              f"({analysis_type}, {run['NamHoc']} {run['HocKy']}) vào '{store.directory}'.")
+    elif args.command == "student":
+        scores, anomalies = store.student_history(args.student_id, args.type)
+        _print_or_write(scores, args.output)
+        if not args.output and not anomalies.empty:
+            print()
+            print(analysis.format_anomalies(anomalies).to_string(index=False))
+    elif args.command == "runs":
+        _print_or_write(store.runs(args.type), args.output)
+    else:
+        filters = {"NamHoc": args.year, "lop": args.class_name}
+        if args.command == "counts":
+            _print_or_write(store.anomaly_counts(args.type, filters=filters), args.output)
+        else:
+            _print_or_write(store.score_trend(args.type, filters=filters), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+# modules/incremental.py
+
+"""
+Phân tích lại tăng dần khi giáo viên tải lên bản sửa của cùng một danh sách.
+
+Bảng mới được so với bảng trước theo MaHS và theo từng cột (`diff_rosters`),
+rồi chỉ những phần bị ảnh hưởng được tính lại (`update_analysis`):
+
+- Z-score Inter-student: thống kê tích lũy (count, mean, M2) của từng (nhóm,
+  cột) được cập nhật bằng phép bỏ hàng cũ/thêm hàng mới (`RunningStats.remove`
+  và `update`); chỉ các hàng thay đổi và các (nhóm, cột) có thống kê thay đổi
+  được tính lại Z-score, các ô còn lại dùng lại kết quả cũ.
+- Z-score cá nhân, thiếu dữ liệu, quy tắc kiểm tra: chỉ phụ thuộc từng hàng nên
+  chỉ tính cho các hàng thêm mới/thay đổi.
+- Dãy điểm trùng lặp và khoảng cách Mahalanobis: chỉ tính lại các lớp có học
+  sinh thay đổi. Ma trận hiệp phương sai chung của các lớp được cập nhật từ tổng
+  của các lớp; khoảng cách của các lớp không đổi được dùng lại khi ma trận này
+  dịch chuyển không quá INCREMENTAL_PRIOR_TOLERANCE (tương đối), ngược lại mọi
+  lớp được tính lại.
+
+Kết quả giống phân tích toàn bộ tệp, trừ sai khác ở mức làm tròn dấu phẩy động
+của thống kê tích lũy và Z tương đương Mahalanobis của các lớp không đổi (lệch
+tương đối cỡ độ dịch chuyển của ma trận chung, nên chỉ các học sinh sát ngưỡng
+mới có thể đổi kết luận). Khi không so được (thiếu hoặc trùng MaHS, khác cột
+điểm), thay đổi quá nhiều hàng hoặc có phương pháp phát hiện bền vững (trung vị,
+tứ phân vị không cập nhật tăng dần được), tệp được phân tích lại toàn bộ.
+"""
+
+import dataclasses
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from modules import analysis, profiling, rules
+from modules.stats import RunningStats
+
+KEY_COLUMN = 'MaHS'
+# Tỷ lệ hàng thay đổi tối đa để cập nhật tăng dần (lớn hơn thì tính lại toàn bộ)
+INCREMENTAL_MAX_CHANGED_FRACTION = 0.25
+# Độ dịch chuyển tương đối tối đa của hiệp phương sai chung để dùng lại khoảng
+# cách Mahalanobis của các lớp không thay đổi
+INCREMENTAL_PRIOR_TOLERANCE = 1e-3
+
+@dataclass
+class RosterDiff:
+    """Khác biệt giữa bảng điểm trước và bảng mới, ghép theo MaHS."""
+    old_rows: np.ndarray        # Vị trí trong bảng cũ của từng hàng bảng mới (-1 nếu học sinh mới)
+    removed: np.ndarray         # Vị trí (bảng cũ) của các học sinh không còn trong bảng mới
+    changed: np.ndarray         # Vị trí (bảng mới) của các học sinh có ô thay đổi
+    changed_cells: np.ndarray   # Mặt nạ ô thay đổi (số hàng `changed` x số cột `columns`)
+    columns: list               # Các cột được so sánh
+    mode: str = None            # "tăng dần" hoặc "toàn bộ"
+    elapsed_ms: float = None    # Thời gian phân tích lại
+
+    @property
+    def added(self):
+        """Vị trí (bảng mới) của các học sinh mới."""
+        return np.flatnonzero(self.old_rows < 0)
+
+    @property
+    def fresh(self):
+        """Vị trí (bảng mới) của các hàng cần tính lại: học sinh mới hoặc có thay đổi."""
+        mask = self.old_rows < 0
+        mask[self.changed] = True
+        return np.flatnonzero(mask)
+
+    @property
+    def stale(self):
+        """Vị trí (bảng cũ) của các hàng không còn dùng được: bị bỏ hoặc có thay đổi."""
+        return np.sort(np.concatenate([self.removed, self.old_rows[self.changed]]))
+
+    def kept_mapping(self, n_old):
+        """Vị trí mới của từng hàng bảng cũ được giữ nguyên (-1 nếu bị bỏ hoặc thay đổi)."""
+        mapping = np.full(n_old, -1, dtype=np.int64)
+        kept = np.flatnonzero(self.old_rows >= 0)
+        mapping[self.old_rows[kept]] = kept
+        mapping[self.old_rows[self.changed]] = -1
+        return mapping
+
+    @property
+    def is_empty(self):
+        return not (len(self.removed) or len(self.changed) or (self.old_rows < 0).any())
+
+    def summary(self):
+        """Câu tóm tắt các thay đổi."""
+        parts = [
+            f"{len(self.added)} học sinh mới",
+            f"{len(self.removed)} học sinh bị bỏ",
+            f"{len(self.changed)} học sinh có thay đổi ({int(self.changed_cells.sum())} ô)",
+        ]
+        return ", ".join(parts)
+
+    def cells(self, old_df, new_df):
+        """
+        Bảng các ô thay đổi: MaHS, lop, CotDiem, GiaTriCu, GiaTriMoi.
+        """
+        frames = []
+        for j, col in enumerate(self.columns):
+            new_pos = self.changed[self.changed_cells[:, j]]
+            old_pos = self.old_rows[new_pos]
+            frames.append(pd.DataFrame({
+                "MaHS": new_df[KEY_COLUMN].to_numpy(dtype=object)[new_pos],
+                "lop": new_df["lop"].to_numpy(dtype=object)[new_pos] if "lop" in new_df.columns else "N/A",
+                "CotDiem": col,
+                "GiaTriCu": old_df[col].to_numpy(dtype=object)[old_pos],
+                "GiaTriMoi": new_df[col].to_numpy(dtype=object)[new_pos],
+            }))
+        columns = ["MaHS", "lop", "CotDiem", "GiaTriCu", "GiaTriMoi"]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+def _row_keys(df):
+    """Mã học sinh dạng chuỗi; None nếu thiếu cột MaHS, có mã trống hoặc trùng mã."""
+    if KEY_COLUMN not in df.columns or df[KEY_COLUMN].isna().any():
+        return None
+    keys = df[KEY_COLUMN]
+    keys = pd.Index(keys if pd.api.types.is_string_dtype(keys.dtype) else keys.astype(str))
+    return keys if keys.is_unique else None
+
+def _same_order(old_keys, new_keys):
+    """Hai cột mã có cùng các giá trị theo đúng thứ tự (không có mã trống)."""
+    if len(old_keys) != len(new_keys) or old_keys.isna().any() or new_keys.isna().any():
+        return False
+    try:
+        return bool((old_keys.reset_index(drop=True) == new_keys.reset_index(drop=True)).all())
+    except TypeError:
+        return False
+
+def _cells_differ(old_col, new_col, score):
+    # Hai ô cùng trống được xem là giống nhau
+    if score:
+        old_values = analysis.score_matrix(old_col.to_frame(), [old_col.name])[:, 0]
+        new_values = analysis.score_matrix(new_col.to_frame(), [new_col.name])[:, 0]
+        return ~((old_values == new_values) | (np.isnan(old_values) & np.isnan(new_values)))
+    old_values, new_values = old_col.reset_index(drop=True), new_col.reset_index(drop=True)
+    try:
+        # So sánh trực tiếp khi cùng kiểu (chuỗi, số), không chuyển sang object
+        same = (old_values == new_values).fillna(False).to_numpy(dtype=bool)
+    except TypeError:
+        # Ví dụ hai cột category có danh mục khác nhau
+        same = old_values.to_numpy(dtype=object) == new_values.to_numpy(dtype=object)
+    return ~(same | (old_values.isna() & new_values.isna()).to_numpy())
+
+@profiling.profiled()
+def diff_rosters(old_df, new_df, columns, score_cols=()):
+    """
+    So sánh hai bảng điểm theo MaHS trên các cột `columns`.
+
+    Args:
+        old_df, new_df (pd.DataFrame): Bảng trước và bảng mới.
+        columns (list): Các cột được so sánh (cột không có ở một trong hai bảng bị bỏ qua).
+        score_cols (list): Các cột trong `columns` được so sánh như cột điểm
+            (theo giá trị số, kể cả khi cột được lưu dạng float32).
+
+    Returns:
+        RosterDiff: Khác biệt giữa hai bảng; None nếu không ghép được theo MaHS.
+    """
+    if KEY_COLUMN not in old_df.columns or KEY_COLUMN not in new_df.columns:
+        return None
+    columns = [col for col in columns if col in old_df.columns and col in new_df.columns]
+
+    if _same_order(old_df[KEY_COLUMN], new_df[KEY_COLUMN]):
+        # Bản sửa thường giữ nguyên thứ tự dòng: ghép theo vị trí, không cần băm mã học sinh
+        old_rows = np.arange(len(new_df))
+    else:
+        old_keys, new_keys = _row_keys(old_df), _row_keys(new_df)
+        if old_keys is None or new_keys is None:
+            return None
+        old_rows = old_keys.get_indexer(new_keys)
+    present = np.zeros(len(old_df), dtype=bool)
+    present[old_rows[old_rows >= 0]] = True
+    matched = np.flatnonzero(old_rows >= 0)
+
+    differs = np.zeros((len(matched), len(columns)), dtype=bool)
+    for j, col in enumerate(columns):
+        differs[:, j] = _cells_differ(
+            old_df[col].iloc[old_rows[matched]], new_df[col].iloc[matched], col in score_cols
+        )
+    changed = differs.any(axis=1)
+    return RosterDiff(old_rows.astype(np.int64), np.flatnonzero(~present), matched[changed], differs[changed], columns)
+
+def _group_keys(df, group_col):
+    """Giá trị cột nhóm của từng hàng (một nhóm chung nếu không chia nhóm)."""
+    if group_col is None or group_col not in df.columns:
+        return np.zeros(len(df), dtype=np.int8)
+    return df[group_col]
+
+def _baseline_stats(zm, df, score_cols, group_col):
+    """
+    Thống kê tích lũy tương ứng với Z-score Inter-student đã tính của `df`,
+    dựng lại từ trung bình, độ lệch chuẩn và số điểm của từng nhóm (không cần
+    một lượt groupby trên cả bảng).
+    """
+    stats = RunningStats(score_cols)
+    codes = stats.group_codes(_group_keys(df, group_col))
+    observed = ~np.isnan(analysis.score_matrix(df, score_cols))
+    n_groups = len(stats.groups)
+    counts = np.stack([np.bincount(codes, weights=observed[:, j], minlength=n_groups)
+                       for j in range(len(score_cols))], axis=1)
+    # Độ lệch chuẩn NaN với nhóm có từ 2 điểm là độ lệch chuẩn bằng 0
+    stds = np.nan_to_num(zm.stds)
+    stats.count = counts
+    stats.mean = np.where(counts > 0, np.nan_to_num(zm.means), 0.0)
+    stats.m2 = np.where(counts >= 2, stds ** 2 * (counts - 1), 0.0)
+    stats.n_rows = len(df)
+    return stats
+
+def _update_inter_zscores(previous, stats, old_df, new_df, diff, score_cols, group_col):
+    """Z-score Inter-student của bảng mới từ kết quả cũ và thống kê tích lũy."""
+    zm = previous.zscores[0]
+    stats = stats.copy()
+    stale, fresh = diff.stale, diff.fresh
+    old_means, old_stds = stats.means_stds()
+
+    old_keys = _group_keys(old_df, group_col)
+    new_keys = _group_keys(new_df, group_col)
+    stats.remove(analysis.score_matrix(old_df.iloc[stale], score_cols),
+                 stats.group_codes(np.asarray(old_keys)[stale]))
+    stats.update(analysis.score_matrix(new_df.iloc[fresh], score_cols),
+                 stats.group_codes(np.asarray(new_keys)[fresh]))
+    codes = stats.group_codes(new_keys)
+    means, stds = stats.means_stds()
+    stds = np.where(stds == 0, np.nan, stds)
+
+    # (nhóm, cột) có thống kê thay đổi, kể cả nhóm mới
+    n_old = len(old_means)
+    moved = np.ones(means.shape, dtype=bool)
+    old_stds = np.where(old_stds == 0, np.nan, old_stds)
+    moved[:n_old] = ~(
+        ((means[:n_old] == old_means) | (np.isnan(means[:n_old]) & np.isnan(old_means)))
+        & ((stds[:n_old] == old_stds) | (np.isnan(stds[:n_old]) & np.isnan(old_stds)))
+    )
+
+    z_scores = np.empty((len(new_df), len(score_cols)), dtype=analysis.Z_DTYPE)
+    mapping = diff.kept_mapping(len(old_df))
+    kept = np.flatnonzero(mapping >= 0)
+    z_scores[mapping[kept]] = zm.z_scores[kept]
+    # Tính lại theo từng cột: các hàng mới/thay đổi và các hàng thuộc nhóm có thống kê thay đổi
+    rescore = np.zeros(len(new_df), dtype=bool)
+    for j, col in enumerate(score_cols):
+        rescore[:] = moved[codes, j] if moved[:, j].any() else False
+        rescore[fresh] = True
+        rows = slice(None) if rescore.all() else np.flatnonzero(rescore)
+        values = analysis.score_matrix(new_df[[col]].iloc[rows], [col])[:, 0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z_scores[rows, j] = (values - means[codes[rows], j]) / stds[codes[rows], j]
+
+    if group_col is None:
+        group_codes, labels = None, np.array([analysis.GLOBAL_BASELINE], dtype=object)
+    else:
+        group_codes = codes.astype(np.int32)
+        labels = np.array([f"{group_col}={value}" for value in stats.groups], dtype=object)
+    updated = analysis.ZScoreMatrix(
+        z_scores, means, stds, group_codes, labels,
+        high_type=zm.high_type, low_type=zm.low_type, column_major=zm.column_major,
+    )
+    return updated, stats
+
+def _update_rowwise_zscores(zm, new_df, diff, n_old, score_cols):
+    """Z-score cá nhân: giữ các hàng không đổi, tính lại các hàng mới/thay đổi."""
+    mapping = diff.kept_mapping(n_old)
+    kept = np.flatnonzero(mapping >= 0)
+    fresh = diff.fresh
+    part = analysis.compute_intra_student_zscores(new_df.iloc[fresh], score_cols)
+
+    n = len(new_df)
+    z_scores = np.empty((n, len(score_cols)), dtype=analysis.Z_DTYPE)
+    means, stds = np.empty((n, 1)), np.empty((n, 1))
+    for target, source in ((z_scores, zm.z_scores), (means, zm.means), (stds, zm.stds)):
+        target[mapping[kept]] = source[kept]
+    z_scores[fresh], means[fresh], stds[fresh] = part.z_scores, part.means, part.stds
+    return analysis.ZScoreMatrix(
+        z_scores, means, stds, None, zm.baseline_labels,
+        high_type=zm.high_type, low_type=zm.low_type, column_major=zm.column_major,
+    )
+
+def _splice_frame(old_frame, mapping, new_frame, new_rows, order):
+    """
+    Ghép các dòng kết quả cũ còn dùng được (`mapping` >= 0 tại ViTriDong cũ) với
+    kết quả tính trên các hàng `new_rows` của bảng mới, rồi sắp xếp lại theo
+    `order(frame)` (các khóa sắp xếp, khóa sau cùng được ưu tiên nhất như `np.lexsort`).
+    """
+    positions = mapping[old_frame["ViTriDong"].to_numpy()]
+    reused = old_frame[positions >= 0].copy()
+    reused["ViTriDong"] = positions[positions >= 0].astype(np.int32)
+    new_frame = new_frame.copy()
+    new_frame["ViTriDong"] = new_rows[new_frame["ViTriDong"].to_numpy()].astype(np.int32)
+    frame = pd.concat([reused, new_frame], ignore_index=True)
+    return frame.take(np.lexsort(order(frame))).reset_index(drop=True)
+
+def _by_column(frame):
+    # Thứ tự của detect_missing_values: theo cột rồi theo hàng
+    return frame["ViTriDong"].to_numpy(), frame["CotDiem"].cat.codes.to_numpy()
+
+def _by_duplicate_group(frame):
+    # Thứ tự của detect_duplicate_score_vectors: nhóm theo học sinh đầu tiên, rồi theo hàng
+    rows = frame["ViTriDong"].to_numpy()
+    first = frame.groupby("NhomThamChieu", sort=False, observed=True)["ViTriDong"].transform("min").to_numpy()
+    return rows, first
+
+def _reordered_groups(new_df, diff, col):
+    """Các nhóm `col` có các hàng giữ lại bị đổi thứ tự so với bảng cũ."""
+    kept = np.flatnonzero(diff.old_rows >= 0)
+    codes, values = pd.factorize(new_df[col].iloc[kept], use_na_sentinel=False)
+    order = np.argsort(codes, kind="stable")
+    codes, old_rows = codes[order], diff.old_rows[kept][order]
+    backwards = (np.diff(old_rows) < 0) & (codes[1:] == codes[:-1])
+    return np.asarray(values, dtype=object)[np.unique(codes[1:][backwards])]
+
+def _affected_rows(old_df, new_df, diff, col, reordered=False):
+    """
+    Các hàng của bảng cũ và bảng mới thuộc những nhóm `col` có học sinh thay đổi
+    (nhóm cũ và nhóm mới của các hàng bị bỏ, thêm mới hoặc thay đổi), kèm các
+    nhóm bị đổi thứ tự dòng nếu `reordered`.
+    """
+    parts = [old_df[col].iloc[diff.stale].to_numpy(dtype=object), new_df[col].iloc[diff.fresh].to_numpy(dtype=object)]
+    if reordered:
+        parts.append(_reordered_groups(new_df, diff, col))
+    groups = pd.unique(np.concatenate(parts))
+    return old_df[col].isin(groups).to_numpy(), new_df[col].isin(groups).to_numpy()
+
+def _update_duplicates(previous, old_df, new_df, diff, score_cols, scope_col='lop'):
+    """Dãy điểm trùng lặp: giữ kết quả của các lớp không đổi, tính lại các lớp có thay đổi."""
+    if scope_col not in old_df.columns or scope_col not in new_df.columns:
+        return analysis.detect_duplicate_score_vectors(new_df, score_cols, scope_col)
+    # Nhóm trùng liệt kê học sinh theo thứ tự dòng: nhóm bị đổi thứ tự cũng được tính lại
+    old_affected, new_affected = _affected_rows(old_df, new_df, diff, scope_col, reordered=True)
+    mapping = diff.kept_mapping(len(old_df))
+    mapping[old_affected] = -1
+    rows = np.flatnonzero(new_affected)
+    part = analysis.detect_duplicate_score_vectors(new_df.iloc[rows], score_cols, scope_col)
+    return _splice_frame(previous.duplicates, mapping, part, rows, _by_duplicate_group)
+
+def _update_rule_violations(previous, new_df, diff, score_cols, rule_list):
+    """Quy tắc kiểm tra: chỉ đánh giá các hàng mới/thay đổi; số vi phạm là tổng của cả bảng."""
+    fresh = diff.fresh
+    part, timings = analysis.detect_rule_violations(new_df.iloc[fresh], score_cols, rule_list)
+    rule_order = {}
+    for rule in rule_list:
+        rule_order.setdefault(rule.name, len(rule_order))
+
+    def by_rule(frame):
+        return frame["ViTriDong"].to_numpy(), frame["NhomThamChieu"].map(rule_order).to_numpy()
+
+    mapping = diff.kept_mapping(len(previous.df))
+    frame = _splice_frame(previous.rule_violations, mapping, part, fresh, by_rule)
+    counts = frame["NhomThamChieu"].value_counts()
+    timings = timings.copy()
+    ok = timings["TrangThai"] == "OK"
+    timings.loc[ok, "SoViPham"] = timings.loc[ok, "TenQuyTac"].map(counts).fillna(0).astype(int)
+    return frame, timings
+
+def _update_mahalanobis(previous, old_df, new_df, diff, score_cols, group_col, usable_old, usable_new):
+    """
+    Khoảng cách Mahalanobis: tính lại các nhóm có học sinh thay đổi, với ma trận
+    chung cập nhật từ tổng của các nhóm khác; dùng lại kết quả của các nhóm còn
+    lại nếu ma trận chung gần như không đổi.
+    """
+    old = previous.multivariate
+    full = analysis.compute_mahalanobis_scores
+    if group_col not in old_df.columns or group_col not in new_df.columns or old.pooled_cross is None:
+        return full(new_df, score_cols, group_col)
+
+    old_affected, new_affected = _affected_rows(old_df, new_df, diff, group_col)
+    removed = full(old_df.iloc[np.flatnonzero(old_affected)], score_cols, group_col, usable_cols=usable_old)
+    others = (old.pooled_cross - removed.pooled_cross, old.pooled_dof - removed.pooled_dof)
+    rows = np.flatnonzero(new_affected)
+    part = full(new_df.iloc[rows], score_cols, group_col, prior=others, usable_cols=usable_new)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        old_pooled = np.nan_to_num(old.pooled_cross / old.pooled_dof)
+        new_pooled = np.nan_to_num(part.pooled_cross / part.pooled_dof)
+    drift = np.linalg.norm(new_pooled - old_pooled) / max(np.linalg.norm(old_pooled), np.finfo(float).tiny)
+    if drift > INCREMENTAL_PRIOR_TOLERANCE or not np.array_equal(usable_old, usable_new):
+        return full(new_df, score_cols, group_col)
+
+    codes, group_values = pd.factorize(new_df[group_col], use_na_sentinel=False)
+    labels = np.array([f"{group_col}={value}" for value in group_values], dtype=object)
+    from_part = pd.Index(part.baseline_labels).get_indexer(labels)
+    from_old = pd.Index(old.baseline_labels).get_indexer(labels)
+    # Nhóm có học sinh thay đổi lấy từ kết quả tính lại, nhóm còn lại từ kết quả cũ
+    recomputed = from_part >= 0
+    means, stds = old.means[from_old], old.stds[from_old]
+    means[recomputed], stds[recomputed] = part.means[from_part[recomputed]], part.stds[from_part[recomputed]]
+
+    mapping = diff.kept_mapping(len(old_df))
+    mapping[old_affected] = -1
+    kept = np.flatnonzero(mapping >= 0)
+    z_scores = np.empty(len(new_df))
+    worst_cols = np.empty(len(new_df), dtype=np.int8)
+    z_scores[mapping[kept]], worst_cols[mapping[kept]] = old.z_scores[kept], old.worst_cols[kept]
+    z_scores[rows], worst_cols[rows] = part.z_scores, part.worst_cols
+    return analysis.MahalanobisScores(
+        z_scores, worst_cols, means, stds, codes.astype(np.int32), labels, part.pooled_cross, part.pooled_dof,
+    )
+
+def _update_prepared(previous, new_df, diff, analysis_type, group_col, rule_list):
+    old_df, score_cols = previous.df, previous.score_cols
+    stats = previous.running_stats
+    if stats is None:
+        stats = _baseline_stats(previous.zscores[0], old_df, score_cols, group_col)
+    usable_old = stats.count.sum(axis=0) >= 2
+    inter, stats = _update_inter_zscores(previous, stats, old_df, new_df, diff, score_cols, group_col)
+    zscores = [inter]
+    if analysis_type == 'summary':
+        zscores.append(_update_rowwise_zscores(previous.zscores[1], new_df, diff, len(old_df), score_cols))
+
+    fresh = diff.fresh
+    mapping = diff.kept_mapping(len(old_df))
+    missing = _splice_frame(previous.missing, mapping, analysis.detect_missing_values(new_df.iloc[fresh], score_cols),
+                            fresh, _by_column)
+    rule_violations = rule_timings = None
+    if previous.rule_violations is not None:
+        rule_violations, rule_timings = _update_rule_violations(previous, new_df, diff, score_cols, rule_list)
+
+    return analysis.PreparedAnalysis(
+        new_df, score_cols, zscores, missing,
+        _update_duplicates(previous, old_df, new_df, diff, score_cols),
+        _update_mahalanobis(previous, old_df, new_df, diff, score_cols, group_col or analysis.MAHALANOBIS_GROUP_COL,
+                            usable_old, stats.count.sum(axis=0) >= 2),
+        rule_violations, rule_timings, running_stats=stats,
+    )
+
+@profiling.profiled()
+def update_analysis(previous, df, analysis_type, group_col=None, rule_list=None,
+                    methods=analysis.DEFAULT_DETECTION_METHODS):
+    """
+    Phân tích bảng điểm `df` (bản sửa của bảng đã phân tích trong `previous`),
+    chỉ tính lại phần bị ảnh hưởng bởi các thay đổi (xem mô tả module).
+
+    `previous` phải được tính với cùng loại dữ liệu, nhóm so sánh và quy tắc
+    kiểm tra; đối tượng này không bị sửa đổi.
+
+    Args:
+        previous (analysis.PreparedAnalysis): Kết quả của bảng trước.
+        df (pd.DataFrame): Bảng điểm mới.
+        analysis_type (str): 'component' hoặc 'summary'.
+        group_col (str, optional): Cột chia nhóm so sánh (như khi tính `previous`).
+        rule_list (list, optional): Quy tắc kiểm tra (điểm thành phần); mặc định
+            đọc từ tệp quy tắc mặc định.
+        methods (tuple): Các phương pháp phát hiện (như khi tính `previous`).
+            Trung vị và tứ phân vị không cập nhật tăng dần được, nên khi có
+            phương pháp bền vững, bảng có thay đổi được phân tích lại toàn bộ.
+
+    Returns:
+        analysis.PreparedAnalysis: Kết quả của bảng mới; thuộc tính `changes`
+        là RosterDiff (kèm cách tính và thời gian), None nếu không ghép được theo MaHS.
+    """
+    start = time.perf_counter()
+    known = analysis.COMPONENT_SCORE_COLS if analysis_type == 'component' else analysis.SUMMARY_SUBJECT_COLS
+    score_cols = [col for col in known if col in df.columns]
+    if analysis_type == 'component':
+        rule_list = rules.default_rules() if rule_list is None else rule_list
+        rule_cols = [col for rule in rule_list for col in rule.columns]
+    else:
+        rule_cols = []
+    group_cols = ['lop', group_col, analysis.MAHALANOBIS_GROUP_COL]
+    columns = list(dict.fromkeys(score_cols + [col for col in group_cols + rule_cols if col is not None]))
+
+    diff = diff_rosters(previous.df, df, columns, score_cols)
+    methods = tuple(methods)
+    # Cùng nội dung và cùng thứ tự dòng (ví dụ tệp được lưu lại); nếu chỉ đổi
+    # thứ tự dòng thì vị trí trong các bảng kết quả phải được ánh xạ lại
+    unchanged = diff is not None and diff.is_empty and np.array_equal(diff.old_rows, np.arange(len(df)))
+    incremental = (
+        diff is not None and score_cols == list(previous.score_cols) and bool(previous.zscores) and not df.empty
+        and len(diff.fresh) + len(diff.removed) <= INCREMENTAL_MAX_CHANGED_FRACTION * len(df)
+        and (unchanged or methods == analysis.DEFAULT_DETECTION_METHODS)
+    )
+    if incremental and unchanged:
+        # Dùng lại toàn bộ kết quả
+        prepared = dataclasses.replace(previous, df=df)
+    elif incremental:
+        prepared = _update_prepared(previous, df, diff, analysis_type, group_col, rule_list)
+    elif analysis_type == 'component':
+        prepared = analysis.prepare_component_analysis(df, group_col, rule_list, methods)
+    else:
+        prepared = analysis.prepare_summary_analysis(df, group_col, methods)
+    if diff is not None:
+        diff.mode = "tăng dần" if incremental else "toàn bộ"
+        diff.elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    prepared.changes = diff
+    return prepared
@@ -0,0 +1,378 @@
+# modules/ingest.py
+
+"""
+Đọc nhanh bảng điểm CSV/Excel (và JSON, cho dịch vụ HTTP).
+
+- Bảng mã được xác định một lần từ một đoạn byte đầu tệp (BOM UTF-8/UTF-16,
+  UTF-8 hợp lệ, nếu không thì Windows-1258 cho tiếng Việt), thay vì đọc thử cả
+  tệp bằng UTF-8 rồi đọc lại bằng latin1.
+- Kiểu dữ liệu được khai báo trước khi đọc: mã học sinh/STT là chuỗi (giữ
+  nguyên số 0 ở đầu), cột điểm là số thực, cột lớp là category.
+- CSV được đọc bằng `pyarrow.csv` (đa luồng) nếu có; Excel dùng engine
+  calamine nếu đã cài `python-calamine`, ngược lại dùng openpyxl.
+
+Nếu cách đọc nhanh thất bại (ví dụ cột điểm chứa chữ), tệp được đọc lại theo
+cách cũ: `pd.read_csv` mặc định, rồi latin1 nếu không phải UTF-8.
+"""
+
+import codecs
+import csv
+import importlib.util
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from modules import analysis, profiling
+
+# Phần mở rộng của các tệp bảng điểm đọc được từ giao diện và dòng lệnh
+SUPPORTED_EXTENSIONS = ('csv', 'xlsx', 'xls')
+
+# Số byte đầu tệp dùng để xác định bảng mã và đọc dòng tiêu đề
+SNIFF_BYTES = 64 * 1024
+
+ID_COLUMNS = ('MaHS', 'STT')
+CATEGORY_COLUMNS = ('lop',)
+SCORE_COLUMNS = tuple(analysis.COMPONENT_SCORE_COLS) + tuple(analysis.SUMMARY_SUBJECT_COLS)
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+HAS_CALAMINE = importlib.util.find_spec("python_calamine") is not None
+
+def analysis_columns(group_col=None):
+    """Các cột cần cho phân tích (mã, lớp, mọi cột điểm và cột nhóm so sánh)."""
+    columns = list(ID_COLUMNS + CATEGORY_COLUMNS + SCORE_COLUMNS)
+    if group_col is not None and group_col not in columns:
+        columns.append(group_col)
+    return columns
+
+def detect_encoding(sample: bytes):
+    """
+    Xác định bảng mã từ đoạn byte đầu tệp.
+
+    Args:
+        sample (bytes): Các byte đầu tiên của tệp (xem `SNIFF_BYTES`).
+
+    Returns:
+        str: 'utf-8-sig', 'utf-16', 'utf-8', 'cp1258' hoặc 'latin1'.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # final=False: bỏ qua ký tự nhiều byte bị cắt ở cuối đoạn mẫu
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode('cp1258')
+        return 'cp1258'
+    except UnicodeDecodeError:
+        return 'latin1'
+
+def read_header(data: bytes, encoding):
+    """Tên các cột ở dòng đầu của tệp CSV."""
+    text = data[:SNIFF_BYTES].decode(encoding, errors='ignore')
+    first_line = text.splitlines()[0] if text else ''
+    return next(csv.reader([first_line]), [])
+
+def declared_dtypes(columns):
+    """
+    Kiểu dữ liệu khai báo trước cho các cột đã biết có trong `columns`.
+
+    Cột điểm giữ float64 để kết quả Z-score không đổi so với cách đọc cũ.
+    """
+    dtypes = {}
+    for col in columns:
+        if col in ID_COLUMNS:
+            dtypes[col] = str
+        elif col in CATEGORY_COLUMNS:
+            dtypes[col] = 'category'
+        elif col in SCORE_COLUMNS:
+            dtypes[col] = 'float64'
+    return dtypes
+
+def _select_columns(header, columns):
+    if columns is None:
+        return None
+    return [col for col in header if col in set(columns)]
+
+def read_csv_bytes(data: bytes, columns=None):
+    """
+    Đọc CSV từ bytes theo đường nhanh, hoặc theo cách cũ nếu thất bại.
+
+    Args:
+        data (bytes): Nội dung tệp.
+        columns (list, optional): Chỉ đọc các cột này (nếu có trong tệp).
+
+    Returns:
+        pd.DataFrame: Dữ liệu đã đọc.
+    """
+    encoding = detect_encoding(data[:SNIFF_BYTES])
+    header = read_header(data, encoding)
+    usecols = _select_columns(header, columns)
+    dtypes = declared_dtypes(usecols if usecols is not None else header)
+    # Tên cột trùng nhau: để pandas tự đổi tên (Toan, Toan.1...) như cách cũ
+    if HAS_PYARROW and len(set(header)) == len(header):
+        try:
+            return _read_csv_arrow(data, encoding, usecols, dtypes)
+        except Exception:
+            pass
+    try:
+        # Cột điểm có giá trị không phải số: để pandas tự suy kiểu cho cột điểm
+        text_dtypes = {col: dtype for col, dtype in dtypes.items() if col not in SCORE_COLUMNS}
+        return pd.read_csv(io.BytesIO(data), encoding=encoding, dtype=text_dtypes, usecols=usecols,
+                           low_memory=False)
+    except Exception:
+        return _read_csv_fallback(data, usecols)
+
+def _read_csv_arrow(data, encoding, usecols, dtypes):
+    # Đọc trực tiếp bằng pyarrow.csv (đa luồng) với kiểu cột khai báo sẵn; đọc
+    # qua pd.read_csv(engine='pyarrow', dtype=...) chậm hơn vì pandas ép kiểu sau khi đọc
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    arrow_types = {str: pa.string(), 'category': pa.dictionary(pa.int32(), pa.string()), 'float64': pa.float64()}
+    table = pa_csv.read_csv(
+        io.BytesIO(data),
+        read_options=pa_csv.ReadOptions(encoding=encoding),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={col: arrow_types[dtype] for col, dtype in dtypes.items()},
+            include_columns=usecols,
+            strings_can_be_null=True,
+        ),
+    )
+    df = table.to_pandas()
+    for col in dtypes:
+        if dtypes[col] == 'category' and col in df.columns:
+            # Sắp xếp nhóm theo thứ tự chữ cái như khi pandas đọc cột category
+            df[col] = df[col].cat.set_categories(df[col].cat.categories.sort_values())
+    return df
+
+def _read_csv_fallback(data, usecols=None):
+    # Cách đọc cũ: để pandas tự suy kiểu, thử utf-8 rồi latin1
+    try:
+        return pd.read_csv(io.BytesIO(data), usecols=usecols)
+    except UnicodeDecodeError:
+        return pd.read_csv(io.BytesIO(data), usecols=usecols, encoding='latin1')
+
+def read_excel_bytes(data: bytes, columns=None):
+    """
+    Đọc tệp Excel từ bytes (calamine nếu có, không thì openpyxl).
+
+    Mọi sheet có ít nhất một cột điểm đã biết được đọc và nối lại (ví dụ mỗi
+    sheet là một lớp); nếu có nhiều sheet như vậy, sheet không có cột 'lop' lấy
+    tên sheet làm lớp. Tệp không có sheet nào như vậy được đọc từ sheet đầu tiên.
+
+    Args:
+        data (bytes): Nội dung tệp.
+        columns (list, optional): Chỉ đọc các cột này (nếu có trong tệp).
+
+    Returns:
+        pd.DataFrame: Dữ liệu đã đọc.
+    """
+    engine = 'calamine' if HAS_CALAMINE else 'openpyxl'
+    usecols = None if columns is None else (lambda col: col in set(columns))
+    # Tiêu đề chưa biết trước khi mở tệp: khai báo kiểu cho mọi cột đã biết,
+    # pandas bỏ qua các cột không có trong tệp
+    dtypes = declared_dtypes(ID_COLUMNS + CATEGORY_COLUMNS)
+    try:
+        sheets = pd.read_excel(io.BytesIO(data), engine=engine, dtype=dtypes, usecols=usecols, sheet_name=None)
+    except Exception:
+        sheets = pd.read_excel(io.BytesIO(data), engine='openpyxl', usecols=usecols, sheet_name=None)
+
+    score_sheets = {name: df for name, df in sheets.items() if any(col in SCORE_COLUMNS for col in df.columns)}
+    if len(score_sheets) <= 1:
+        return next(iter(score_sheets.values() or sheets.values()))
+    frames = [
+        df if 'lop' in df.columns else df.assign(lop=str(name))
+        for name, df in score_sheets.items()
+    ]
+    merged = pd.concat(frames, ignore_index=True)
+    if 'lop' in merged.columns:
+        merged['lop'] = merged['lop'].astype('category')
+    return merged
+
+def read_json_bytes(data: bytes, columns=None):
+    """
+    Đọc bảng điểm JSON từ bytes: một danh sách bản ghi
+    (`[{"MaHS": "...", "lop": "...", "Toan": 8.5, ...}, ...]`), một dict dạng
+    `{"columns": [...], "data": [[...], ...]}` (như `DataFrame.to_json(orient="split")`)
+    hoặc một dict có khóa "records" là danh sách bản ghi.
+
+    Args:
+        data (bytes): Nội dung tệp.
+        columns (list, optional): Chỉ giữ các cột này (nếu có trong tệp).
+
+    Returns:
+        pd.DataFrame: Dữ liệu đã đọc.
+
+    Raises:
+        ValueError: Nếu nội dung không phải JSON hoặc không đúng các dạng trên.
+    """
+    table = json.loads(data.decode(detect_encoding(data[:SNIFF_BYTES])))
+    if isinstance(table, dict) and "columns" in table and "data" in table:
+        df = pd.DataFrame(table["data"], columns=table["columns"])
+    elif isinstance(table, dict) and isinstance(table.get("records"), list):
+        df = pd.DataFrame.from_records(table["records"])
+    elif isinstance(table, list):
+        df = pd.DataFrame.from_records(table)
+    else:
+        raise ValueError("Bảng JSON phải là danh sách bản ghi, dict có 'columns'/'data' hoặc dict có 'records'.")
+    usecols = _select_columns(list(df.columns), columns)
+    if usecols is not None:
+        df = df[usecols]
+    # Mã học sinh/STT được chuyển thành chuỗi sau khi đọc (xem `normalize_id_columns`)
+    for col, dtype in declared_dtypes(df.columns).items():
+        if dtype is str:
+            continue
+        try:
+            df[col] = df[col].astype(dtype)
+        except (TypeError, ValueError):
+            # Cột điểm có giá trị không phải số: giữ nguyên như đường đọc CSV dự phòng
+            pass
+    return df
+
+def source_bytes(source):
+    """Nội dung của một đường dẫn tệp hoặc đối tượng tệp (UploadedFile, BytesIO...)."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+class UnsupportedFileTypeError(ValueError):
+    """Tệp có phần mở rộng không thuộc SUPPORTED_EXTENSIONS (hoặc 'json', xem `read_table`)."""
+
+@profiling.profiled()
+def read_table(source, file_name=None, columns=None):
+    """
+    Đọc một bảng điểm từ tệp CSV, Excel hoặc JSON, không phụ thuộc vào giao diện
+    Streamlit (dùng được cho dòng lệnh và các tiến trình xử lý nền).
+
+    Bảng mã được xác định từ các byte đầu tệp và kiểu của các cột đã biết được
+    khai báo trước khi đọc (xem mô tả module).
+
+    Args:
+        source: Đường dẫn tệp hoặc đối tượng tệp (có thể đọc được).
+        file_name (str, optional): Tên tệp để xác định định dạng; mặc định lấy
+            từ `source`.
+        columns (list, optional): Chỉ đọc các cột này; mặc định đọc mọi cột.
+
+    Returns:
+        pd.DataFrame: Dữ liệu đã đọc, các cột MaHS/STT ở dạng chuỗi, các cột
+        điểm ở dạng float32 nếu không mất giá trị.
+
+    Raises:
+        UnsupportedFileTypeError: Nếu định dạng tệp không được hỗ trợ.
+    """
+    if file_name is None:
+        file_name = source if isinstance(source, str) else getattr(source, 'name', '')
+    # Lấy phần mở rộng của tên tệp để xác định loại tệp
+    file_extension = str(file_name).split('.')[-1].lower()
+
+    if file_extension == 'csv':
+        df = read_csv_bytes(source_bytes(source), columns)
+    elif file_extension in ['xlsx', 'xls']:
+        df = read_excel_bytes(source_bytes(source), columns)
+    elif file_extension == 'json':
+        df = read_json_bytes(source_bytes(source), columns)
+    else:
+        raise UnsupportedFileTypeError(
+            f"Định dạng tệp '{file_extension}' không được hỗ trợ. Vui lòng sử dụng tệp CSV, Excel hoặc JSON."
+        )
+
+    # Cột điểm lưu dạng float32 khi không mất giá trị (xem analysis.compact_scores)
+    return analysis.compact_scores(normalize_id_columns(df))
+
+def normalize_id_columns(df):
+    """
+    Xử lý các cột STT, MaHS có thể bị đọc thành số thực: chuyển về dạng chuỗi.
+    """
+    if 'MaHS' in df.columns:
+        df['MaHS'] = df['MaHS'].astype(str)
+    if 'STT' in df.columns:
+        df['STT'] = df['STT'].astype(str)
+    return df
+
+def _read_named_table(data, file_name):
+    # Chạy trong tiến trình con của `read_tables`
+    return read_table(io.BytesIO(data), file_name)
+
+def read_tables(sources, progress=None, workers=None):
+    """
+    Đọc nhiều tệp song song, mỗi tệp trong một tiến trình riêng của
+    `ProcessPoolExecutor` (đọc Excel chiếm GIL nên luồng không giúp được), nên
+    thời gian xấp xỉ thời gian của tệp chậm nhất thay vì tổng các tệp.
+
+    Args:
+        sources (list): Các cặp (tên tệp, nội dung bytes).
+        progress (callable, optional): Được gọi với (số tệp đã đọc, tổng số tệp,
+            tên tệp vừa đọc xong) mỗi khi một tệp đọc xong.
+        workers (int, optional): Số tiến trình; mặc định bằng số CPU.
+
+    Returns:
+        list: Các DataFrame theo đúng thứ tự `sources`.
+
+    Raises:
+        ValueError: Nếu một tệp không đọc được (thông báo có tên tệp).
+    """
+    workers = min(workers or os.cpu_count() or 1, len(sources))
+    frames = [None] * len(sources)
+
+    def done(i, df):
+        frames[i] = df
+        if progress is not None:
+            progress(sum(frame is not None for frame in frames), len(sources), sources[i][0])
+
+    if workers <= 1:
+        for i, (file_name, data) in enumerate(sources):
+            try:
+                done(i, _read_named_table(data, file_name))
+            except Exception as e:
+                raise ValueError(f"{file_name}: {e}") from e
+        return frames
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_read_named_table, data, file_name): i
+                   for i, (file_name, data) in enumerate(sources)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                done(i, future.result())
+            except Exception as e:
+                raise ValueError(f"{sources[i][0]}: {e}") from e
+    return frames
+
+def merge_tables(frames, names):
+    """
+    Gộp bảng điểm của nhiều tệp thành một bảng để phân tích chung (ví dụ cả
+    khối thay vì từng lớp): các cột được ghép theo tên, cột điểm thiếu ở một
+    tệp là ô trống, và cột TepNguon ghi tên tệp của từng học sinh.
+
+    Args:
+        frames (list): Các DataFrame (xem `read_tables`).
+        names (list): Tên tệp tương ứng (không trùng nhau).
+
+    Returns:
+        pd.DataFrame: Bảng đã gộp.
+    """
+    # Các cột theo thứ tự xuất hiện qua các tệp; cột trùng tên được ghép với nhau
+    columns = list(dict.fromkeys(col for df in frames for col in df.columns if col != analysis.SOURCE_COLUMN))
+    merged = pd.concat([df.reindex(columns=columns) for df in frames], ignore_index=True)
+    merged.insert(0, analysis.SOURCE_COLUMN, pd.Categorical.from_codes(
+        np.repeat(np.arange(len(names)), [len(df) for df in frames]), categories=list(names)
+    ))
+    if 'lop' in merged.columns:
+        merged['lop'] = merged['lop'].astype('category')
+    return analysis.compact_scores(merged)
@@ -0,0 +1,163 @@
+# modules/loadtest.py
+
+"""
+Đo thông lượng và độ trễ của dịch vụ HTTP (`modules/service.py`).
+
+Mỗi luồng trong `--concurrency` luồng lặp lại: gửi tệp lên POST /jobs, rồi hỏi
+GET /jobs/<id>/result cho tới khi có kết quả (hoặc gửi kèm wait=1 với
+`--wait`). Độ trễ của một yêu cầu tính từ lúc gửi tới lúc nhận được kết quả;
+khi dịch vụ từ chối (503, hàng đợi đầy), luồng chờ theo Retry-After rồi gửi
+lại và lần từ chối được đếm riêng.
+
+Ví dụ:
+    python -m modules.service --workers 4 &
+    python -m modules.loadtest --requests 200 --concurrency 16
+    python -m modules.loadtest --rows 20000 --type component --requests 50 --output tai.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import numpy as np
+
+from modules import service, synthetic
+
+def load_payload(path=None, rows=None, analysis_type="summary", seed=0):
+    """Nội dung tệp gửi lên và tên tệp: tệp có sẵn, hoặc dữ liệu giả lập `rows` học sinh (CSV)."""
+    if path is not None:
+        with open(path, "rb") as f:
+            return f.read(), os.path.basename(path)
+    df = synthetic.generate_scores(rows, analysis_type, seed=seed)
+    return df.to_csv(index=False).encode("utf-8"), f"synthetic_{analysis_type}_{rows}.csv"
+
+def _request(method, url, body=None, timeout=300):
+    """Gửi một yêu cầu; trả về (mã HTTP, header, nội dung bytes) kể cả khi mã là lỗi."""
+    request = urllib.request.Request(url, data=body, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+def run_one(base_url, payload, file_name, params, wait=False, poll_interval=0.05):
+    """
+    Gửi một tệp và chờ kết quả.
+
+    Returns:
+        dict: latency_s, rejected (số lần bị 503), status ('done', 'failed' hoặc 'error'),
+        n_anomalies.
+    """
+    query = urlencode({"name": file_name, **params, **({"wait": 1} if wait else {})})
+    rejected = 0
+    start = time.perf_counter()
+    while True:
+        status, headers, body = _request("POST", f"{base_url}/jobs?{query}", payload)
+        if status != 503:
+            break
+        rejected += 1
+        time.sleep(float(headers.get("Retry-After", 1)))
+    if status not in (200, 202):
+        return {"latency_s": time.perf_counter() - start, "rejected": rejected, "status": "error",
+                "n_anomalies": 0, "error": body.decode("utf-8", "replace")}
+    if status == 202:
+        job_id = json.loads(body)["job_id"]
+        while status == 202:
+            time.sleep(poll_interval)
+            status, _, body = _request("GET", f"{base_url}/jobs/{job_id}/result")
+    latency = time.perf_counter() - start
+    result = json.loads(body)
+    return {"latency_s": latency, "rejected": rejected, "status": result.get("status", "error"),
+            "n_anomalies": len(result.get("anomalies", [])), "error": result.get("error")}
+
+def run_load(base_url, payload, file_name, n_requests, concurrency, params=None, wait=False):
+    """
+    Chạy `n_requests` yêu cầu với `concurrency` luồng song song.
+
+    Returns:
+        tuple: (dict tổng hợp, danh sách kết quả từng yêu cầu).
+    """
+    params = params or {}
+    counter = iter(range(n_requests))
+    lock = threading.Lock()
+    results = []
+
+    def worker():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            record = run_one(base_url, payload, file_name, params, wait)
+            with lock:
+                results.append(record)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([r["latency_s"] for r in results])
+    ok = sum(r["status"] == "done" for r in results)
+    summary = {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "payload_bytes": len(payload),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 3) if elapsed else None,
+        "ok": ok,
+        "failed": len(results) - ok,
+        "rejected_503": sum(r["rejected"] for r in results),
+        **{f"latency_{name}_s": round(float(np.percentile(latencies, q)), 4) if len(latencies) else None
+           for name, q in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))},
+    }
+    return summary, results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo thông lượng và độ trễ p95 của dịch vụ phân tích HTTP.")
+    parser.add_argument("--url", default=f"http://{service.DEFAULT_HOST}:{service.DEFAULT_PORT}",
+                        help="Địa chỉ dịch vụ")
+    parser.add_argument("--file", default=None, help="Tệp gửi lên (mặc định: dữ liệu giả lập)")
+    parser.add_argument("--rows", type=int, default=1000, help="Số học sinh của dữ liệu giả lập (mặc định 1000)")
+    parser.add_argument("--type", choices=["component", "summary"], default="summary",
+                        help="Loại dữ liệu giả lập")
+    parser.add_argument("--requests", type=int, default=100, help="Tổng số yêu cầu (mặc định 100)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Số yêu cầu song song (mặc định 8)")
+    parser.add_argument("--threshold", type=float, default=service.DEFAULT_THRESHOLD, help="Ngưỡng Z-score")
+    parser.add_argument("--group", default=None, help="Cột chia nhóm so sánh, ví dụ 'lop'")
+    parser.add_argument("--wait", action="store_true", help="Chờ kết quả trong cùng yêu cầu (wait=1) thay vì hỏi lại")
+    parser.add_argument("--output", default=None, help="Ghi kết quả tổng hợp ra tệp JSON")
+    args = parser.parse_args(argv)
+
+    payload, file_name = load_payload(args.file, args.rows, args.type)
+    params = {"threshold": args.threshold, **({"group": args.group} if args.group else {})}
+    base_url = args.url.rstrip("/")
+    try:
+        _request("GET", f"{base_url}/health", timeout=5)
+    except OSError as e:
+        print(f"Không kết nối được tới dịch vụ tại {base_url}: {e}", file=sys.stderr)
+        return 1
+
+    summary, results = run_load(base_url, payload, file_name, args.requests, args.concurrency, params, args.wait)
+    print(f"{summary['requests']} yêu cầu ({len(payload) / 2**10:,.0f} KB mỗi tệp), {args.concurrency} song song, "
+          f"trong {summary['elapsed_s']:.2f}s: {summary['throughput_rps']:.2f} yêu cầu/s.")
+    print(f"Độ trễ p50 {summary['latency_p50_s']:.3f}s, p95 {summary['latency_p95_s']:.3f}s, "
+          f"p99 {summary['latency_p99_s']:.3f}s, lớn nhất {summary['latency_max_s']:.3f}s.")
+    print(f"Thành công {summary['ok']}, lỗi {summary['failed']}, bị từ chối (503) {summary['rejected_503']} lần.")
+    errors = {r["error"] for r in results if r.get("error")}
+    for error in sorted(errors)[:5]:
+        print(f"  Lỗi: {error}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
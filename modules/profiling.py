@@ -0,0 +1,207 @@
+# modules/profiling.py
+
+"""
+Đo thời gian và bộ nhớ cho từng bước của quy trình (đọc tệp, phát hiện bất
+thường, vẽ biểu đồ, xuất báo cáo).
+
+Mỗi bước được bọc bằng `stage(...)` (context manager) hoặc `@profiled(...)`
+(decorator) và tạo ra một bản ghi gồm: tên bước, thời gian (ms), số dòng/cột
+đầu vào, số bất thường đầu ra, RSS hiện tại của tiến trình khi kết thúc bước
+và mức thay đổi RSS trong bước. Bản ghi được:
+- ghi ra log dưới dạng một dòng JSON (logger "anomaly.profiling"),
+- thu vào danh sách của `collect()` / `start_collection()` đang mở (ứng dụng
+  dùng để hiển thị).
+
+Lớp đo chỉ hoạt động khi đặt biến môi trường ANOMALY_PROFILING=1 hoặc đang ở
+trong một lượt thu bản ghi; khi tắt, mỗi lần gọi chỉ tốn một lần kiểm tra cờ.
+
+RSS được lấy mẫu (đọc /proc/self/statm) ở đầu và cuối bước, không dùng RSS đỉnh
+của tiến trình (`ru_maxrss` chỉ tăng, nên sau lần đạt đỉnh đầu tiên mọi bước đều
+có mức tăng 0) và không dùng `tracemalloc` (làm chậm đáng kể nên sai lệch thời
+gian; `modules.benchmark` đo bộ nhớ cấp phát đỉnh ở một lần chạy riêng). Mức thay
+đổi RSS không tính phần bộ nhớ tạm đã được giải phóng trước khi bước kết thúc.
+Trên hệ thống không có /proc (macOS, Windows) hai trường bộ nhớ được bỏ trống.
+"""
+
+import functools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+logger = logging.getLogger("anomaly.profiling")
+
+_ENABLED = os.environ.get("ANOMALY_PROFILING", "").lower() in ("1", "true", "yes")
+# Danh sách bản ghi của lượt chạy hiện tại (mỗi luồng/lượt chạy Streamlit có context riêng)
+_collector = ContextVar("profiling_collector", default=None)
+_depth = ContextVar("profiling_depth", default=0)
+
+def set_enabled(enabled):
+    """Bật/tắt ghi log JSON cho toàn tiến trình (ngoài các `collect()` đang mở)."""
+    global _ENABLED
+    _ENABLED = bool(enabled)
+
+def is_active():
+    """Lớp đo có đang hoạt động trong context hiện tại không."""
+    return _ENABLED or _collector.get() is not None
+
+_STATM = "/proc/self/statm"
+_PAGE_MB = os.sysconf("SC_PAGE_SIZE") / 2**20 if hasattr(os, "sysconf") else None
+
+def _current_rss_mb():
+    """RSS hiện tại của tiến trình (MB); None nếu hệ thống không có /proc."""
+    if _PAGE_MB is None:
+        return None
+    try:
+        with open(_STATM, "rb") as f:
+            # Trường thứ hai: số trang đang nằm trong bộ nhớ
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, IndexError, ValueError):
+        return None
+
+def _ensure_handler():
+    # Ghi mỗi bản ghi thành một dòng JSON ra stderr nếu ứng dụng chưa cấu hình log
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+class _NullRecord(dict):
+    """Bản ghi rỗng khi lớp đo đang tắt: mọi cập nhật đều bị bỏ qua."""
+
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+_NULL_RECORD = _NullRecord()
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Đo một bước của quy trình.
+
+    Bản ghi trả về là một dict; có thể bổ sung thông tin trong khối `with`,
+    ví dụ `record.update(rows=len(df), cols=df.shape[1], anomalies=len(result))`.
+
+    Args:
+        name (str): Tên bước, ví dụ "analysis.detect".
+        **fields: Thông tin thêm ghi vào bản ghi.
+    """
+    if not is_active():
+        yield _NULL_RECORD
+        return
+
+    record = {"stage": name, "depth": _depth.get(), **fields}
+    collected = _collector.get()
+    if collected is not None:
+        # Thêm ngay khi bắt đầu để danh sách theo thứ tự bắt đầu (bước cha trước bước con)
+        collected.append(record)
+    depth_token = _depth.set(record["depth"] + 1)
+    rss_before = _current_rss_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["wall_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        rss_after = _current_rss_mb()
+        if rss_after is not None and rss_before is not None:
+            record["rss_mb"] = round(rss_after, 1)
+            record["rss_delta_mb"] = round(rss_after - rss_before, 1)
+        _depth.reset(depth_token)
+        _emit(record)
+
+def _emit(record):
+    if _ENABLED:
+        _ensure_handler()
+        logger.info(json.dumps({"event": "stage", **record}, ensure_ascii=False, default=str))
+
+def describe_inputs(record, args):
+    """Ghi số dòng/cột của DataFrame đầu tiên trong `args` vào bản ghi."""
+    for arg in args:
+        if isinstance(arg, pd.DataFrame):
+            record["rows"], record["cols"] = arg.shape
+            return
+
+def describe_result(record, result):
+    """
+    Ghi số bất thường nếu kết quả là bảng bất thường; với bảng khác (ví dụ dữ
+    liệu vừa đọc) thì ghi kích thước nếu chưa có kích thước đầu vào.
+    """
+    if not isinstance(result, pd.DataFrame):
+        return
+    if "LoaiBatThuong" in result.columns:
+        record["anomalies"] = len(result)
+    elif "rows" not in record:
+        record["rows"], record["cols"] = result.shape
+
+def profiled(name=None):
+    """
+    Decorator đo một hàm như một bước; tự ghi kích thước DataFrame đầu vào đầu
+    tiên và số bất thường của kết quả (nếu kết quả là bảng bất thường).
+    """
+    def decorator(fn):
+        stage_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not is_active():
+                return fn(*args, **kwargs)
+            with stage(stage_name) as record:
+                describe_inputs(record, args)
+                result = fn(*args, **kwargs)
+                describe_result(record, result)
+                return result
+        return wrapper
+    return decorator
+
+def start_collection():
+    """
+    Bắt đầu thu bản ghi trong context hiện tại (thay danh sách cũ nếu có), kể cả
+    khi biến môi trường ANOMALY_PROFILING không được đặt. Dùng trong `app.py`,
+    nơi mỗi lượt chạy lại script cần một danh sách mới.
+
+    Returns:
+        list: Danh sách bản ghi, được bổ sung dần khi các bước bắt đầu.
+    """
+    records = []
+    _collector.set(records)
+    return records
+
+def stop_collection():
+    """Dừng thu bản ghi trong context hiện tại."""
+    _collector.set(None)
+
+@contextmanager
+def collect():
+    """
+    Như `start_collection`, nhưng chỉ trong phạm vi khối `with`.
+
+    Yields:
+        list: Danh sách bản ghi.
+    """
+    records = []
+    token = _collector.set(records)
+    try:
+        yield records
+    finally:
+        _collector.reset(token)
+
+def records_frame(records):
+    """Bảng tóm tắt các bản ghi để hiển thị (tên bước thụt lề theo cấp lồng nhau)."""
+    columns = ["stage", "wall_ms", "rows", "cols", "anomalies", "rss_mb", "rss_delta_mb"]
+    if not records:
+        return pd.DataFrame(columns=columns)
+    frame = pd.DataFrame(records).reindex(columns=columns + ["depth"])
+    frame["stage"] = ["  " * int(d) + s for s, d in zip(frame["stage"], frame["depth"])]
+    return frame[columns]
@@ -0,0 +1,241 @@
+# modules/rules.py
+
+"""
+Quy tắc kiểm tra chéo giữa các cột điểm, khai báo trong tệp JSON hoặc YAML.
+
+Mỗi quy tắc là một biểu thức trên tên cột, ví dụ:
+
+    {"id": "ck_giam_manh", "name": "CK thấp hơn trung bình TX từ 4 điểm",
+     "expression": "CK <= mean(TX1, TX2, TX3) - 4", "column": "CK", "severity": "Cao"}
+
+Biểu thức chỉ được dùng tên cột, số, các phép toán + - * / < <= > >= == !=,
+& (và), | (hoặc), ~ (phủ định) và các hàm trong FUNCTIONS. Mỗi biểu thức được
+phân tích cú pháp và kiểm tra một lần, rồi được đánh giá một lần trên toàn bộ
+bảng (mỗi tên cột là một mảng NumPy), không duyệt từng học sinh.
+
+Các trường của một quy tắc:
+- id: mã quy tắc (không trùng nhau).
+- name: mô tả ngắn, được ghi vào cột NhomThamChieu và câu giải thích.
+- expression: biểu thức cho ra True ở các học sinh vi phạm.
+- column (tùy chọn): cột điểm ghi vào CotDiem/DiemBatThuong.
+- severity (tùy chọn): "Thấp", "Trung bình" (mặc định) hoặc "Cao".
+
+Tệp quy tắc mặc định là `assets/quytac_diemthanhphan.json`, có thể thay bằng
+biến môi trường ANOMALY_RULES_FILE.
+"""
+
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import time
+import warnings
+from dataclasses import dataclass, field
+from types import CodeType
+
+import numpy as np
+import pandas as pd
+
+from modules import profiling
+
+DEFAULT_RULES_PATH = os.environ.get(
+    "ANOMALY_RULES_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "quytac_diemthanhphan.json"),
+)
+
+HAS_YAML = importlib.util.find_spec("yaml") is not None
+
+SEVERITIES = ("Thấp", "Trung bình", "Cao")
+
+class RuleError(ValueError):
+    """Tệp quy tắc hoặc biểu thức của một quy tắc không hợp lệ."""
+
+def _stack(*arrays):
+    return np.column_stack(np.broadcast_arrays(*arrays))
+
+def _nan_reduce(fn):
+    # Hàng toàn NaN cho kết quả NaN, không cảnh báo
+    def reduce(*arrays):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return fn(_stack(*arrays), axis=1)
+    return reduce
+
+# Các hàm được dùng trong biểu thức; hàm nhiều cột tính theo từng học sinh (bỏ qua ô trống)
+FUNCTIONS = {
+    "mean": _nan_reduce(np.nanmean),
+    "min": _nan_reduce(np.nanmin),
+    "max": _nan_reduce(np.nanmax),
+    "std": _nan_reduce(lambda values, axis: np.nanstd(values, axis=axis, ddof=1)),
+    "count": lambda *arrays: np.sum(~np.isnan(_stack(*arrays)), axis=1),
+    "isna": np.isnan,
+    "notna": lambda values: ~np.isnan(values),
+    "abs": np.abs,
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.BitAnd, ast.BitOr, ast.Invert, ast.USub, ast.UAdd,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+
+@dataclass
+class Rule:
+    """Một quy tắc đã được biên dịch (xem `compile_rule`)."""
+    id: str
+    name: str
+    expression: str
+    column: str = None
+    severity: str = "Trung bình"
+    columns: tuple = ()             # Các cột được dùng trong biểu thức
+    code: CodeType = field(default=None, repr=False)
+
+def _check_expression(tree, rule_id):
+    """Kiểm tra cây cú pháp chỉ gồm các phần tử được phép; trả về các tên cột được dùng."""
+    columns = []
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            hint = " (dùng &, |, ~ thay cho and, or, not)" if isinstance(node, (ast.BoolOp, ast.Not)) else ""
+            raise RuleError(f"Quy tắc '{rule_id}': không hỗ trợ '{type(node).__name__}' trong biểu thức{hint}.")
+        if isinstance(node, ast.Compare) and len(node.ops) > 1:
+            raise RuleError(f"Quy tắc '{rule_id}': tách phép so sánh liên tiếp, ví dụ (a < b) & (b < c).")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise RuleError(f"Quy tắc '{rule_id}': chỉ dùng hằng số dạng số.")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                raise RuleError(f"Quy tắc '{rule_id}': chỉ được gọi các hàm {', '.join(FUNCTIONS)}.")
+        elif isinstance(node, ast.Name) and node.id not in FUNCTIONS and node.id not in columns:
+            columns.append(node.id)
+    return tuple(columns)
+
+def compile_rule(spec):
+    """
+    Kiểm tra và biên dịch một quy tắc từ dict (một phần tử của tệp quy tắc).
+
+    Raises:
+        RuleError: Nếu thiếu trường bắt buộc hoặc biểu thức không hợp lệ.
+    """
+    if not isinstance(spec, dict) or not spec.get("id") or not spec.get("expression"):
+        raise RuleError(f"Mỗi quy tắc cần có 'id' và 'expression': {spec!r}")
+    rule_id = str(spec["id"])
+    severity = spec.get("severity", "Trung bình")
+    if severity not in SEVERITIES:
+        raise RuleError(f"Quy tắc '{rule_id}': mức độ '{severity}' không hợp lệ (dùng {', '.join(SEVERITIES)}).")
+    expression = str(spec["expression"])
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise RuleError(f"Quy tắc '{rule_id}': biểu thức sai cú pháp ({e.msg}).") from e
+    columns = _check_expression(tree, rule_id)
+    return Rule(
+        id=rule_id, name=str(spec.get("name", rule_id)), expression=expression, column=spec.get("column"),
+        severity=severity, columns=columns, code=compile(tree, f"<quy tắc {rule_id}>", "eval"),
+    )
+
+def parse_rules(text, file_name=".json"):
+    """
+    Đọc danh sách quy tắc từ nội dung tệp JSON hoặc YAML (theo phần mở rộng
+    của `file_name`). Tệp có thể là một danh sách quy tắc hoặc một dict có khóa "rules".
+    """
+    if file_name.lower().endswith((".yaml", ".yml")):
+        if not HAS_YAML:
+            raise RuleError("Cần cài đặt PyYAML để đọc tệp quy tắc YAML (pip install pyyaml).")
+        import yaml
+        data = yaml.safe_load(text)
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise RuleError(f"Tệp quy tắc JSON không hợp lệ: {e}") from e
+    specs = data.get("rules", []) if isinstance(data, dict) else data
+    if not isinstance(specs, list):
+        raise RuleError("Tệp quy tắc phải là một danh sách hoặc có khóa 'rules' là một danh sách.")
+    rules = [compile_rule(spec) for spec in specs]
+    ids = [rule.id for rule in rules]
+    duplicated = sorted({rule_id for rule_id in ids if ids.count(rule_id) > 1})
+    if duplicated:
+        raise RuleError(f"Mã quy tắc bị trùng: {', '.join(duplicated)}.")
+    return rules
+
+def load_rules(path=None):
+    """
+    Đọc tệp quy tắc (mặc định DEFAULT_RULES_PATH). Tệp mặc định không tồn tại
+    thì trả về danh sách rỗng.
+    """
+    if path is None:
+        path = DEFAULT_RULES_PATH
+        if not os.path.exists(path):
+            return []
+    with open(path, encoding="utf-8") as f:
+        return parse_rules(f.read(), path)
+
+_default_rules = {}
+
+def default_rules():
+    """Quy tắc trong tệp mặc định, chỉ đọc lại khi tệp thay đổi."""
+    mtime = os.path.getmtime(DEFAULT_RULES_PATH) if os.path.exists(DEFAULT_RULES_PATH) else None
+    if _default_rules.get("mtime", -1) != mtime:
+        _default_rules.update(mtime=mtime, rules=load_rules())
+    return _default_rules["rules"]
+
+def rules_fingerprint(rules):
+    """Mã băm của một danh sách quy tắc, dùng trong khóa cache của kết quả."""
+    h = hashlib.sha256()
+    for rule in rules:
+        h.update(json.dumps([rule.id, rule.name, rule.expression, rule.column, rule.severity],
+                            ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def _numeric_values(series):
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+def evaluate_rules(df, rules, column_values=_numeric_values):
+    """
+    Đánh giá các quy tắc trên toàn bộ bảng.
+
+    Mỗi cột được dùng trong các quy tắc được chuyển thành mảng số một lần trước
+    khi đánh giá (ô không phải số thành NaN) và dùng chung cho mọi quy tắc. Thời gian đánh giá
+    của từng quy tắc được đo riêng (và ghi thành một bước "rules.<id>" khi lớp
+    đo trong `modules/profiling.py` đang bật).
+
+    Args:
+        df (pd.DataFrame): Bảng điểm.
+        rules (list): Các `Rule` đã biên dịch.
+        column_values (callable): Hàm chuyển một cột (Series) thành mảng float64.
+
+    Returns:
+        tuple: (masks, timings): `masks` là dict id -> mảng bool (None nếu quy
+        tắc bị bỏ qua); `timings` là DataFrame gồm MaQuyTac, TenQuyTac, SoViPham,
+        ThoiGian_ms, TrangThai.
+    """
+    n_rows = len(df)
+    # Chuyển trước các cột được dùng, để thời gian của mỗi quy tắc chỉ gồm phần đánh giá biểu thức
+    used = {col for rule in rules for col in rule.columns if col in df.columns}
+    values = {col: column_values(df[col]) for col in used}
+    masks, timings = {}, []
+    for rule in rules:
+        missing = [col for col in rule.columns if col not in df.columns]
+        record = {"MaQuyTac": rule.id, "TenQuyTac": rule.name, "SoViPham": 0, "ThoiGian_ms": 0.0,
+                  "TrangThai": "OK"}
+        if missing:
+            masks[rule.id] = None
+            record["TrangThai"] = f"Bỏ qua: thiếu cột {', '.join(missing)}"
+            timings.append(record)
+            continue
+        with profiling.stage(f"rules.{rule.id}", rows=n_rows) as stage_record:
+            start = time.perf_counter()
+            try:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    result = eval(rule.code, {"__builtins__": {}}, {**FUNCTIONS, **values})
+                mask = np.broadcast_to(np.asarray(result, dtype=bool), (n_rows,))
+            except Exception as e:
+                mask = None
+                record["TrangThai"] = f"Lỗi: {type(e).__name__}: {e}"
+            record["ThoiGian_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            if mask is not None:
+                record["SoViPham"] = int(mask.sum())
+                stage_record["anomalies"] = record["SoViPham"]
+        masks[rule.id] = mask
+        timings.append(record)
+    return masks, pd.DataFrame(timings, columns=["MaQuyTac", "TenQuyTac", "SoViPham", "ThoiGian_ms", "TrangThai"])
@@ -0,0 +1,394 @@
+# modules/service.py
+
+"""
+Dịch vụ HTTP cục bộ để các hệ thống khác (ví dụ hệ thống quản lý học sinh) gửi
+bảng điểm và nhận lại các điểm bất thường, không cần giao diện Streamlit.
+
+Máy chủ chạy trên `asyncio` của thư viện chuẩn (không cần cài thêm gói). Việc
+đọc và phân tích tệp (nặng CPU) được đẩy sang một `ProcessPoolExecutor`:
+
+- Tối đa `workers` việc chạy cùng lúc; các việc khác chờ trong hàng đợi.
+- Hàng đợi có giới hạn (`max_pending` việc đang chờ hoặc đang chạy); khi đầy,
+  yêu cầu mới bị từ chối ngay với 503 và header Retry-After thay vì xếp hàng
+  vô hạn.
+- Số kết nối đồng thời và kích thước nội dung gửi lên cũng có giới hạn.
+
+Các endpoint (kết quả đều là JSON):
+
+    POST   /jobs?name=diem.csv&threshold=2.5&group=lop[&wait=1]
+           Nội dung là tệp CSV, XLSX hoặc bảng JSON (xem `ingest.read_json_bytes`).
+           Định dạng lấy từ phần mở rộng của `name`, nếu không có thì từ
+           Content-Type. Trả về 202 kèm job_id; với wait=1 thì chờ xong và trả
+           luôn kết quả như GET /jobs/<id>/result.
+    GET    /jobs/<id>          Trạng thái: queued, running, done hoặc failed.
+    GET    /jobs/<id>/result   Tóm tắt và danh sách bất thường (202 nếu chưa xong).
+    DELETE /jobs/<id>          Xóa kết quả đã xong.
+    GET    /health             Số việc đang chờ/chạy và các giới hạn.
+
+Kết quả được giữ trong bộ nhớ `result_ttl` giây sau khi xong. Đo thông lượng
+và độ trễ bằng `python -m modules.loadtest`.
+
+Ví dụ:
+    python -m modules.service --port 8765 --workers 4
+    curl -X POST --data-binary @assets/diemtonghop_mau.csv \\
+        "http://127.0.0.1:8765/jobs?name=diemtonghop_mau.csv&group=lop&wait=1"
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from modules import analysis, cli, ingest
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_THRESHOLD = 2.5
+
+# Giới hạn mặc định: số việc chờ hoặc chạy tối đa cho mỗi tiến trình, kích thước
+# nội dung gửi lên, số kết nối đồng thời và thời gian giữ kết quả đã xong
+PENDING_PER_WORKER = 4
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_CONNECTIONS = 256
+RESULT_TTL_S = 3600
+# Thời gian tối đa để đọc xong một yêu cầu (dòng đầu, header và nội dung)
+REQUEST_TIMEOUT_S = 60
+
+# Định dạng nhận qua dịch vụ: như giao diện và dòng lệnh, thêm bảng JSON
+ACCEPTED_EXTENSIONS = ingest.SUPPORTED_EXTENSIONS + ("json",)
+
+# Content-Type -> phần mở rộng, khi yêu cầu không có tham số name
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/json": "json",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "application/vnd.ms-excel": "xls",
+}
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+class ServiceError(Exception):
+    """Lỗi trả về cho bên gọi kèm mã HTTP."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+def run_job(payload, file_name, z_thresh, group_col=None):
+    """
+    Phân tích một tệp gửi lên; chạy trong tiến trình con của dịch vụ.
+
+    Bảng bất thường được chuyển sang JSON ngay trong tiến trình con để vòng
+    lặp sự kiện của máy chủ không phải làm việc nặng.
+
+    Returns:
+        tuple: (dict tóm tắt như `cli.analyze_file`, bytes JSON của danh sách bất thường).
+    """
+    df_anomalies, summary = cli.analyze_file(BytesIO(payload), z_thresh, group_col, file_name)
+    if df_anomalies.empty:
+        return summary, b"[]"
+    return summary, df_anomalies.to_json(orient="records", force_ascii=False).encode("utf-8")
+
+@dataclass
+class Job:
+    """Một việc phân tích và kết quả của nó."""
+    id: str
+    file_name: str
+    threshold: float
+    group_col: str = None
+    status: str = "queued"          # queued, running, done, failed
+    created: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    summary: dict = None
+    anomalies: bytes = None         # Danh sách bất thường dạng JSON (xem `run_job`)
+    error: str = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def info(self):
+        """Trạng thái của việc (không gồm danh sách bất thường)."""
+        info = {"job_id": self.id, "status": self.status, "file_name": self.file_name,
+                "threshold": self.threshold, "group": self.group_col,
+                "queued_s": round((self.started or time.time()) - self.created, 3)}
+        if self.started is not None:
+            info["running_s"] = round((self.finished or time.time()) - self.started, 3)
+        if self.summary is not None:
+            info["summary"] = self.summary
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+    def result_body(self):
+        """Nội dung JSON của kết quả, ghép từ phần đã tuần tự hóa sẵn trong tiến trình con."""
+        head = json.dumps(self.info(), ensure_ascii=False)
+        return head[:-1].encode("utf-8") + b', "anomalies": ' + (self.anomalies or b"[]") + b"}"
+
+class AnalysisService:
+    """
+    Hàng đợi việc phân tích trên một `ProcessPoolExecutor`, với giới hạn số việc
+    chạy đồng thời, số việc chờ, số kết nối và kích thước nội dung.
+    """
+
+    def __init__(self, workers=None, max_pending=None, max_body_bytes=MAX_BODY_BYTES,
+                 max_connections=MAX_CONNECTIONS, result_ttl=RESULT_TTL_S):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * PENDING_PER_WORKER
+        self.max_body_bytes = max_body_bytes
+        self.max_connections = max_connections
+        self.result_ttl = result_ttl
+        self.executor = None
+        self.jobs = {}
+        self.pending = 0                # Số việc đang chờ hoặc đang chạy
+        self.connections = 0
+        self.counters = {"accepted": 0, "rejected": 0, "done": 0, "failed": 0}
+        self._slots = None
+        self._tasks = set()
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._slots = asyncio.Semaphore(self.workers)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def health(self):
+        running = sum(job.status == "running" for job in self.jobs.values())
+        return {"status": "ok", "workers": self.workers, "running": running, "queued": self.pending - running,
+                "max_pending": self.max_pending, "connections": self.connections,
+                "max_connections": self.max_connections, "max_body_bytes": self.max_body_bytes,
+                "jobs_kept": len(self.jobs), **self.counters}
+
+    def _retry_after(self):
+        # Ước lượng thô: số lượt xử lý cần để hàng đợi hiện tại chạy hết, mỗi lượt ~1 giây
+        return str(max(1, math.ceil(self.pending / self.workers)))
+
+    def _prune(self):
+        """Bỏ các kết quả đã xong quá `result_ttl` giây."""
+        expired = time.time() - self.result_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished is not None and job.finished < expired]:
+            del self.jobs[job_id]
+
+    def submit(self, payload, file_name, threshold, group_col=None):
+        """
+        Đưa một việc vào hàng đợi.
+
+        Raises:
+            ServiceError: 503 (kèm Retry-After) nếu hàng đợi đã đầy.
+        """
+        self._prune()
+        if self.pending >= self.max_pending:
+            self.counters["rejected"] += 1
+            raise ServiceError(503, f"Hàng đợi đã đầy ({self.max_pending} việc), vui lòng thử lại sau.",
+                               {"Retry-After": self._retry_after()})
+        job = Job(uuid.uuid4().hex, file_name, threshold, group_col)
+        self.jobs[job.id] = job
+        self.pending += 1
+        self.counters["accepted"] += 1
+        task = asyncio.get_running_loop().create_task(self._run(job, payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job, payload):
+        try:
+            async with self._slots:
+                job.status, job.started = "running", time.time()
+                job.summary, job.anomalies = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, run_job, payload, job.file_name, job.threshold, job.group_col
+                )
+            job.status = "failed" if job.summary.get("Loi") else "done"
+            job.error = job.summary.get("Loi")
+        except Exception as e:
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            job.started = job.started or time.time()
+            job.finished = time.time()
+            self.pending -= 1
+            self.counters[job.status] += 1
+            job.done.set()
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ServiceError(404, f"Không tìm thấy việc '{job_id}'.")
+        return job
+
+    # --- HTTP ---
+
+    async def route(self, method, target, headers, body):
+        """
+        Xử lý một yêu cầu đã đọc xong.
+
+        Returns:
+            tuple: (mã HTTP, nội dung bytes hoặc dict, header thêm).
+        """
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts == ["health"] and method == "GET":
+            return 200, self.health(), {}
+        if parts == ["jobs"]:
+            if method != "POST":
+                raise ServiceError(405, f"Không hỗ trợ {method} cho {url.path}.")
+            return await self._post_job(query, headers, body)
+        if len(parts) in (2, 3) and parts[0] == "jobs" and (len(parts) == 2 or parts[2] == "result"):
+            job = self.get(parts[1])
+            if len(parts) == 3 and method == "GET":
+                if job.status in ("queued", "running"):
+                    return 202, job.info(), {"Retry-After": "1"}
+                return 200, job.result_body(), {}
+            if len(parts) == 2 and method == "GET":
+                return 200, job.info(), {}
+            if len(parts) == 2 and method == "DELETE":
+                if not job.done.is_set():
+                    raise ServiceError(409, "Việc chưa xong, không xóa được.")
+                del self.jobs[job.id]
+                return 200, {"job_id": job.id, "deleted": True}, {}
+            raise ServiceError(405, f"Không hỗ trợ {method} cho {url.path}.")
+        raise ServiceError(404, f"Không có endpoint {method} {url.path}.")
+
+    async def _post_job(self, query, headers, body):
+        if not body:
+            raise ServiceError(400, "Nội dung yêu cầu trống: gửi kèm tệp CSV, XLSX hoặc JSON.")
+        file_name = query.get("name")
+        if not file_name:
+            content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type not in CONTENT_TYPES:
+                raise ServiceError(400, "Cần tham số name (ví dụ name=diem.csv) hoặc Content-Type là "
+                                        f"một trong: {', '.join(CONTENT_TYPES)}.")
+            file_name = f"upload.{CONTENT_TYPES[content_type]}"
+        if file_name.rsplit(".", 1)[-1].lower() not in ACCEPTED_EXTENSIONS:
+            raise ServiceError(400, f"Định dạng tệp '{file_name}' không được hỗ trợ.")
+        try:
+            threshold = analysis.parse_threshold(query.get("threshold", DEFAULT_THRESHOLD))
+        except ValueError as e:
+            raise ServiceError(400, f"Tham số threshold không hợp lệ: {e}") from None
+
+        job = self.submit(body, file_name, threshold, query.get("group") or None)
+        if query.get("wait") in ("1", "true"):
+            await job.done.wait()
+            return 200, job.result_body(), {}
+        return 202, job.info(), {"Location": f"/jobs/{job.id}"}
+
+    async def handle(self, reader, writer):
+        """Đọc một yêu cầu HTTP/1.1, trả lời rồi đóng kết nối."""
+        self.connections += 1
+        try:
+            try:
+                if self.connections > self.max_connections:
+                    raise ServiceError(503, "Quá nhiều kết nối đồng thời.", {"Retry-After": "1"})
+                method, target, headers, body = await asyncio.wait_for(self._read_request(reader),
+                                                                       REQUEST_TIMEOUT_S)
+                status, content, extra = await self.route(method, target, headers, body)
+            except ServiceError as e:
+                status, content, extra = e.status, {"error": str(e)}, e.headers
+            except Exception as e:
+                status, content, extra = 500, {"error": f"{type(e).__name__}: {e}"}, {}
+            await self._write_response(writer, status, content, extra)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            # Bên gọi ngắt kết nối hoặc gửi quá chậm: không trả lời
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise ServiceError(400, "Dòng yêu cầu HTTP không hợp lệ.") from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise ServiceError(411, "Không hỗ trợ Transfer-Encoding: chunked, hãy gửi kèm Content-Length.")
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise ServiceError(400, "Content-Length không hợp lệ.") from None
+        if length < 0:
+            raise ServiceError(400, "Content-Length không hợp lệ.")
+        if length > self.max_body_bytes:
+            raise ServiceError(413, f"Nội dung quá lớn ({length} byte, tối đa {self.max_body_bytes}).")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    async def _write_response(writer, status, content, headers):
+        if not isinstance(content, bytes):
+            content = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                "Content-Type: application/json; charset=utf-8",
+                f"Content-Length: {len(content)}",
+                "Connection: close"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + content)
+        await writer.drain()
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None, **options):
+    """
+    Chạy dịch vụ cho tới khi bị dừng.
+
+    Args:
+        host, port: Địa chỉ lắng nghe.
+        ready (callable, optional): Được gọi với (host, port) khi máy chủ đã sẵn sàng.
+        **options: Các giới hạn của `AnalysisService`.
+    """
+    service = AnalysisService(**options)
+    service.start()
+    server = await asyncio.start_server(service.handle, host, port, limit=64 * 1024)
+    try:
+        async with server:
+            bound_host, bound_port = server.sockets[0].getsockname()[:2]
+            if ready is not None:
+                ready(bound_host, bound_port)
+            await server.serve_forever()
+    finally:
+        service.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP cục bộ phân tích điểm bất thường.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Địa chỉ lắng nghe (mặc định {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Cổng (mặc định {DEFAULT_PORT})")
+    parser.add_argument("--workers", type=int, default=None, help="Số tiến trình phân tích (mặc định: số CPU)")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help=f"Số việc chờ hoặc chạy tối đa (mặc định {PENDING_PER_WORKER} x số tiến trình)")
+    parser.add_argument("--max-body-mb", type=float, default=MAX_BODY_BYTES / 2**20,
+                        help="Kích thước tệp gửi lên tối đa (MB)")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS, help="Số kết nối đồng thời tối đa")
+    parser.add_argument("--result-ttl", type=float, default=RESULT_TTL_S, help="Số giây giữ kết quả đã xong")
+    args = parser.parse_args(argv)
+
+    def ready(host, port):
+        print(f"Dịch vụ phân tích đang chạy tại http://{host}:{port} "
+              f"({args.workers or os.cpu_count() or 1} tiến trình). Nhấn Ctrl+C để dừng.", flush=True)
+
+    try:
+        asyncio.run(serve(args.host, args.port, ready, workers=args.workers, max_pending=args.max_pending,
+                          max_body_bytes=int(args.max_body_mb * 2**20), max_connections=args.max_connections,
+                          result_ttl=args.result_ttl))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# modules/stats.py
+
+"""
+Thống kê tích lũy (count, mean, M2) theo nhóm, gộp và tách từng khối dữ liệu.
+
+Dùng cho chế độ phân tích luồng (`modules.streaming`, gộp các khối của tệp) và
+phân tích lại tăng dần (`modules.incremental`, bỏ hàng cũ/thêm hàng mới). Module
+chỉ phụ thuộc numpy/pandas để cả hai module trên cùng dùng được.
+"""
+
+import numpy as np
+import pandas as pd
+
+class RunningStats:
+    """
+    Thống kê tích lũy (count, mean, M2) cho từng (nhóm, cột điểm).
+
+    Mỗi khối dữ liệu được tóm tắt bằng một lượt groupby vector hóa, rồi gộp vào
+    thống kê hiện có bằng công thức của Chan và cộng sự, nên kết quả không phụ
+    thuộc vào việc chia khối (sai khác chỉ ở mức làm tròn dấu phẩy động).
+    """
+
+    def __init__(self, score_cols):
+        self.score_cols = list(score_cols)
+        n_cols = len(self.score_cols)
+        self.groups = pd.Index([], dtype=object)
+        self.count = np.zeros((0, n_cols))
+        self.mean = np.zeros((0, n_cols))
+        self.m2 = np.zeros((0, n_cols))
+        self.n_rows = 0
+
+    def group_codes(self, keys):
+        """
+        Trả về mã nhóm (chỉ số hàng trong các mảng thống kê) cho từng phần tử
+        của `keys`, đăng ký thêm các nhóm mới nếu cần.
+        """
+        codes, uniques = pd.factorize(keys, use_na_sentinel=False)
+        uniques = pd.Index(uniques, dtype=object)
+        new_groups = uniques[self.groups.get_indexer(uniques) < 0]
+        if len(new_groups):
+            self.groups = self.groups.append(new_groups)
+            extra = np.zeros((len(new_groups), len(self.score_cols)))
+            self.count = np.vstack([self.count, extra])
+            self.mean = np.vstack([self.mean, extra])
+            self.m2 = np.vstack([self.m2, extra])
+        return self.groups.get_indexer(uniques)[codes]
+
+    def update(self, values, codes):
+        """
+        Gộp một khối điểm (số hàng x số cột, NaN là thiếu) vào thống kê.
+
+        Args:
+            values (np.ndarray): Ma trận điểm của khối.
+            codes (np.ndarray): Mã nhóm của từng hàng (từ `group_codes`).
+        """
+        self.merge(*self._summarize(values, codes))
+        self.n_rows += len(values)
+
+    def remove(self, values, codes):
+        """
+        Bỏ một khối điểm đã được gộp trước đó ra khỏi thống kê (phép ngược của
+        `update`), dùng khi phân tích lại tăng dần: sửa một ô là bỏ hàng cũ rồi
+        thêm hàng mới.
+        """
+        self.unmerge(*self._summarize(values, codes))
+        self.n_rows -= len(values)
+
+    @staticmethod
+    def _summarize(values, codes):
+        # (nhóm, count, mean, M2) của một khối, tính bằng một lượt groupby
+        block = pd.DataFrame(values)
+        grouped = block.groupby(codes, sort=False)
+        count_b = grouped.count()
+        present = count_b.index.to_numpy()
+        mean_b = grouped.mean()
+        # M2 của khối: tổng bình phương độ lệch so với trung bình nhóm trong khối
+        m2_b = ((block - grouped.transform('mean')) ** 2).groupby(codes, sort=False).sum()
+        return (present, count_b.to_numpy(dtype=float), mean_b.to_numpy(dtype=float),
+                m2_b.loc[present].to_numpy(dtype=float))
+
+    def merge(self, group_idx, count_b, mean_b, m2_b):
+        """
+        Gộp thống kê (count, mean, M2) của các nhóm `group_idx` theo công thức Chan.
+        """
+        count_a = self.count[group_idx]
+        mean_a = self.mean[group_idx]
+        m2_a = self.m2[group_idx]
+
+        total = count_a + count_b
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = np.where(count_b > 0, mean_b - mean_a, 0.0)
+            weight = np.where(total > 0, count_b / total, 0.0)
+            self.mean[group_idx] = mean_a + delta * weight
+            self.m2[group_idx] = np.where(
+                count_b > 0, m2_a + np.nan_to_num(m2_b) + delta ** 2 * count_a * weight, m2_a
+            )
+        self.count[group_idx] = total
+
+    def unmerge(self, group_idx, count_b, mean_b, m2_b):
+        """
+        Tách thống kê (count, mean, M2) của các nhóm `group_idx` ra khỏi thống kê
+        hiện có (giải ngược công thức Chan).
+        """
+        count = self.count[group_idx]
+        mean = self.mean[group_idx]
+        m2 = self.m2[group_idx]
+
+        rest = count - count_b
+        removed = count_b > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_a = np.where(rest > 0, (count * mean - count_b * np.nan_to_num(mean_b)) / rest, 0.0)
+            delta = np.nan_to_num(mean_b) - mean_a
+            m2_a = np.where(rest > 0, m2 - np.nan_to_num(m2_b) - delta ** 2 * rest * count_b / count, 0.0)
+        self.mean[group_idx] = np.where(removed, mean_a, mean)
+        # Sai số làm tròn có thể cho M2 hơi âm
+        self.m2[group_idx] = np.where(removed, np.maximum(m2_a, 0.0), m2)
+        self.count[group_idx] = rest
+
+    def copy(self):
+        """Bản sao độc lập (các mảng thống kê được sao chép)."""
+        other = RunningStats(self.score_cols)
+        other.groups = self.groups
+        other.count, other.mean, other.m2 = self.count.copy(), self.mean.copy(), self.m2.copy()
+        other.n_rows = self.n_rows
+        return other
+
+    @property
+    def nbytes(self):
+        return self.count.nbytes + self.mean.nbytes + self.m2.nbytes
+
+    def means_stds(self):
+        """
+        Trung bình và độ lệch chuẩn (ddof=1) của từng (nhóm, cột); NaN nếu nhóm
+        có dưới 2 điểm hợp lệ.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(self.count >= 2, self.mean, np.nan)
+            stds = np.where(self.count >= 2, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+        return means, stds
@@ -0,0 +1,207 @@
+# modules/streaming.py
+
+"""
+Chế độ phân tích luồng (streaming) cho các tệp CSV rất lớn, không đọc được
+toàn bộ vào bộ nhớ.
+
+Phân tích gồm hai lượt đọc tệp theo từng khối (`read_csv(chunksize=...)`):
+1. Tích lũy số lượng, trung bình và M2 (tổng bình phương độ lệch) cho từng cột
+   điểm (và từng nhóm, nếu so sánh theo lớp), gộp các khối bằng công thức
+   Welford/Chan.
+2. Đọc lại tệp, tính Z-score của từng khối theo thống kê toàn cục ở lượt 1 và
+   ghi các bất thường ra tệp CSV/Parquet ngay khi tìm thấy.
+
+Bộ nhớ sử dụng chỉ phụ thuộc vào kích thước khối và số nhóm. Chế độ này chỉ
+phát hiện điểm lệch so với nhóm (Z-score), điểm lệch so với chính học sinh (điểm
+tổng hợp) và ô thiếu điểm. Các phát hiện cần so sánh giữa các khối hoặc cần
+toàn bộ điểm của một nhóm không có ở đây: dãy điểm trùng lặp, hồ sơ điểm bất
+thường (Mahalanobis), quy tắc kiểm tra và các phương pháp trung vị/MAD, IQR.
+
+Ví dụ:
+    python -m modules.streaming diem_toan_tinh.csv bat_thuong.parquet --type summary --group lop
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from modules import analysis, cli, ingest
+from modules.stats import RunningStats
+
+DEFAULT_CHUNKSIZE = 100_000
+
+def _score_cols_for(columns, analysis_type):
+    """Các cột điểm có trong tệp cho loại dữ liệu 'component' hoặc 'summary'."""
+    known = analysis.COMPONENT_SCORE_COLS if analysis_type == 'component' else analysis.SUMMARY_SUBJECT_COLS
+    return [col for col in known if col in columns]
+
+def _read_chunks(path, chunksize, encoding=None, group_col=None):
+    with open(path, 'rb') as f:
+        sample = f.read(ingest.SNIFF_BYTES)
+    # Bảng mã xác định từ đầu tệp (tệp có BOM sẽ không bị dính BOM vào tên cột đầu)
+    encoding = encoding or ingest.detect_encoding(sample)
+    # Cột mã và cột nhóm luôn đọc dạng chuỗi: kiểu suy ra riêng cho từng khối có
+    # thể khác nhau (lớp "10" là số ở khối này, chuỗi ở khối khác), làm tách một nhóm thành hai
+    text_cols = set(ingest.ID_COLUMNS) | set(ingest.CATEGORY_COLUMNS) | {group_col}
+    dtypes = {col: str for col in ingest.read_header(sample, encoding) if col in text_cols}
+    for chunk in pd.read_csv(path, chunksize=chunksize, encoding=encoding, dtype=dtypes):
+        yield ingest.normalize_id_columns(chunk)
+
+def compute_streaming_statistics(path, analysis_type, group_col=None, chunksize=DEFAULT_CHUNKSIZE,
+                                 encoding=None):
+    """
+    Lượt 1: tích lũy thống kê của từng cột điểm (và từng nhóm) trên toàn tệp.
+
+    Args:
+        path (str): Đường dẫn tệp CSV.
+        analysis_type (str): 'component' (điểm thành phần) hoặc 'summary' (điểm tổng hợp).
+        group_col (str, optional): Cột chia nhóm so sánh; None để dùng toàn bộ tệp.
+        chunksize (int): Số dòng mỗi khối.
+        encoding (str, optional): Bảng mã của tệp; mặc định tự nhận diện.
+
+    Returns:
+        RunningStats: Thống kê toàn cục.
+    """
+    stats = None
+    for chunk in _read_chunks(path, chunksize, encoding, group_col):
+        if stats is None:
+            stats = RunningStats(_score_cols_for(chunk.columns, analysis_type))
+        values = chunk[stats.score_cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        keys = chunk[group_col] if group_col is not None else np.zeros(len(chunk))
+        stats.update(values, stats.group_codes(keys))
+
+    if stats is None:
+        raise ValueError(f"Tệp '{path}' không có dữ liệu.")
+    return stats
+
+def _chunk_inter_zscores(chunk, stats, means, stds, labels, group_col):
+    """Z-score Inter-student của một khối theo thống kê toàn cục."""
+    values = analysis.score_matrix(chunk, stats.score_cols)
+    keys = chunk[group_col] if group_col is not None else np.zeros(len(chunk))
+    codes = stats.group_codes(keys)
+
+    # Tránh trường hợp độ lệch chuẩn bằng 0 (khi tất cả các điểm giống nhau)
+    stds = np.where(stds == 0, np.nan, stds)
+    z_scores = ((values - means[codes]) / stds[codes]).astype(analysis.Z_DTYPE)
+
+    return analysis.ZScoreMatrix(
+        z_scores, means, stds, codes.astype(np.int32), labels,
+        high_type="Điểm cao bất thường", low_type="Điểm thấp bất thường", column_major=True,
+    )
+
+class _AnomalySink:
+    """Ghi bảng bất thường ra CSV hoặc Parquet theo từng khối."""
+
+    def __init__(self, path):
+        self.path = path
+        self.is_parquet = os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+        self._writer = None
+        self._wrote_header = False
+        self.rows = 0
+
+    def write(self, frame):
+        if frame.empty:
+            return
+        # Giữ ViTriDong (vị trí dòng trong tệp) để tra lại dữ liệu gốc
+        frame = analysis.format_anomalies(frame, drop_internal=False)
+        if self.is_parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # Cố định kiểu cột để mọi khối có cùng schema
+            frame = frame.astype({
+                "MaHS": "string", "lop": "string", "CotDiem": "string", "DiemBatThuong": "string",
+                "LoaiBatThuong": "string", "MucDo": "string", "NhomThamChieu": "string",
+            })
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        elif not self._wrote_header:
+            # Khối đầu tiên: ghi đè tệp, kèm BOM để Excel nhận đúng tiếng Việt
+            frame.to_csv(self.path, index=False, encoding='utf-8-sig')
+            self._wrote_header = True
+        else:
+            frame.to_csv(self.path, mode='a', header=False, index=False, encoding='utf-8')
+        self.rows += len(frame)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def stream_anomalies(path, output_path, analysis_type, z_thresh, group_col=None,
+                     chunksize=DEFAULT_CHUNKSIZE, encoding=None):
+    """
+    Phân tích một tệp CSV lớn theo hai lượt và ghi các bất thường ra `output_path`
+    (định dạng theo phần mở rộng: .csv hoặc .parquet).
+
+    Chỉ gồm các phát hiện Z-score (so với nhóm, và so với chính học sinh với điểm
+    tổng hợp) và ô thiếu điểm; không có dãy điểm trùng lặp, hồ sơ điểm bất
+    thường (Mahalanobis), quy tắc kiểm tra và các phương pháp trung vị/MAD, IQR
+    như `run_component_analysis`/`run_summary_analysis`. Với các phát hiện có
+    mặt, kết quả giống phân tích toàn bộ tệp trừ thứ tự (các bất thường được ghi
+    lần lượt theo từng khối; cột ViTriDong vẫn là vị trí dòng trong tệp) và sai
+    số làm tròn dấu phẩy động của thống kê gộp theo khối (Z-score, trung bình
+    tham chiếu), nên một điểm sát ngưỡng có thể được kết luận khác.
+
+    Args:
+        path (str): Đường dẫn tệp CSV.
+        output_path (str): Tệp kết quả (.csv hoặc .parquet).
+        analysis_type (str): 'component' hoặc 'summary'.
+        z_thresh (float): Ngưỡng Z-score.
+        group_col (str, optional): Cột chia nhóm so sánh.
+        chunksize (int): Số dòng mỗi khối.
+        encoding (str, optional): Bảng mã của tệp; mặc định tự nhận diện.
+
+    Returns:
+        dict: Tóm tắt gồm số dòng đã đọc, số nhóm và số bất thường đã ghi.
+    """
+    stats = compute_streaming_statistics(path, analysis_type, group_col, chunksize, encoding)
+    means, stds = stats.means_stds()
+    if group_col is None:
+        labels = np.array([analysis.GLOBAL_BASELINE], dtype=object)
+    else:
+        labels = np.array([f"{group_col}={value}" for value in stats.groups], dtype=object)
+
+    sink = _AnomalySink(output_path)
+    offset = 0
+    try:
+        for chunk in _read_chunks(path, chunksize, encoding, group_col):
+            cols = stats.score_cols
+            zscores = [_chunk_inter_zscores(chunk, stats, means, stds, labels, group_col)]
+            if analysis_type == 'summary':
+                zscores.append(analysis.compute_intra_student_zscores(chunk, cols))
+            prepared = analysis.PreparedAnalysis(
+                chunk, cols, zscores, analysis.detect_missing_values(chunk, cols)
+            )
+            anomalies = prepared.detect(z_thresh)
+            # Vị trí dòng tính trên toàn tệp, không phải trong khối
+            anomalies["ViTriDong"] += offset
+            sink.write(anomalies)
+            offset += len(chunk)
+    finally:
+        sink.close()
+
+    return {"rows": stats.n_rows, "groups": len(stats.groups), "anomalies": sink.rows}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Phân tích điểm bất thường theo luồng cho tệp CSV lớn.")
+    parser.add_argument("input", help="Tệp CSV đầu vào")
+    parser.add_argument("output", help="Tệp kết quả (.csv hoặc .parquet)")
+    parser.add_argument("--type", choices=["component", "summary"], required=True,
+                        help="component: điểm thành phần; summary: điểm tổng hợp")
+    parser.add_argument("--threshold", type=cli.threshold_arg, default=2.5, help="Ngưỡng Z-score (mặc định 2.5)")
+    parser.add_argument("--group", default=None, help="Cột chia nhóm so sánh, ví dụ 'lop'")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Số dòng mỗi khối")
+    parser.add_argument("--encoding", default=None, help="Bảng mã của tệp đầu vào (mặc định tự nhận diện)")
+    args = parser.parse_args(argv)
+
+    summary = stream_anomalies(args.input, args.output, args.type, args.threshold, args.group,
+                               args.chunksize, args.encoding)
+    print(f"Đã đọc {summary['rows']} dòng, {summary['groups']} nhóm; "
+          f"ghi {summary['anomalies']} bất thường vào '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# modules/students.py
+
+"""
+Tra cứu nhanh một học sinh trong bảng điểm đã tải và bảng bất thường.
+
+`build_student_index` dựng một lần cho mỗi bảng điểm:
+- MaHS đã sắp xếp cùng vị trí dòng tương ứng: tra đúng mã hoặc theo tiền tố
+  bằng tìm kiếm nhị phân (`np.searchsorted`), không quét cả bảng.
+- Nếu bảng có cột họ tên (NAME_COLUMNS): mọi đoạn cuối theo từ của họ tên đã
+  bỏ dấu và viết thường ("nguyen van an", "van an", "an"), nên gõ phần đầu
+  của họ, tên đệm hay tên đều tìm được.
+- Vị trí các dòng của từng lớp, để tính Z-score so với lớp của một học sinh
+  chỉ trên các dòng của lớp đó.
+
+Bất thường của một học sinh được lấy qua `analysis.AnomalyIndex.rows_of`
+(theo cột ViTriDong của bảng bất thường).
+"""
+
+import unicodedata
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from modules import analysis, profiling
+
+# Các cột họ tên được dùng để tìm kiếm (lấy cột đầu tiên có trong bảng)
+NAME_COLUMNS = ("HoTen", "HoVaTen", "TenHS")
+# Số kết quả tối đa của một lần tìm kiếm
+SEARCH_LIMIT = 20
+# Ký tự lớn nhất, dùng làm cận trên khi tìm theo tiền tố
+_MAX_CHAR = "\U0010ffff"
+
+def normalize_text(text):
+    """Chuỗi viết thường, bỏ dấu tiếng Việt và khoảng trắng thừa (dùng cho tìm kiếm)."""
+    text = unicodedata.normalize("NFD", str(text).replace("đ", "d").replace("Đ", "D"))
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return " ".join(text.casefold().split())
+
+def _prefix_range(keys, prefix):
+    """Khoảng [lo, hi) của các khóa đã sắp xếp bắt đầu bằng `prefix`."""
+    return np.searchsorted(keys, prefix, side="left"), np.searchsorted(keys, prefix + _MAX_CHAR, side="left")
+
+@dataclass
+class StudentIndex:
+    """Chỉ mục tra cứu học sinh của một bảng điểm (xem `build_student_index`)."""
+    ids: np.ndarray                 # MaHS đã sắp xếp
+    id_rows: np.ndarray             # Vị trí dòng của từng phần tử trong ids
+    name_column: str = None         # Cột họ tên được dùng, None nếu không có
+    name_keys: np.ndarray = None    # Các đoạn cuối theo từ của họ tên đã chuẩn hóa, đã sắp xếp
+    name_rows: np.ndarray = None    # Vị trí dòng của từng phần tử trong name_keys
+    class_codes: np.ndarray = None  # Mã lớp của từng dòng (None nếu không có cột 'lop')
+    class_rows: np.ndarray = None   # Vị trí dòng sắp xếp theo mã lớp
+    class_offsets: np.ndarray = None  # Dòng của lớp c là class_rows[class_offsets[c]:class_offsets[c + 1]]
+
+    def lookup(self, student_id):
+        """Vị trí các dòng có đúng MaHS `student_id` (nhiều dòng nếu mã bị trùng)."""
+        key = str(student_id).strip()
+        lo, hi = np.searchsorted(self.ids, key, side="left"), np.searchsorted(self.ids, key, side="right")
+        return np.sort(self.id_rows[lo:hi])
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """
+        Vị trí các dòng có MaHS hoặc một từ của họ tên bắt đầu bằng `query`
+        (tối đa `limit` dòng, MaHS khớp trước).
+        """
+        query = str(query).strip()
+        if not query:
+            return np.array([], dtype=np.intp)
+        lo, hi = _prefix_range(self.ids, query)
+        found = list(self.id_rows[lo:min(hi, lo + limit)])
+        if self.name_keys is not None and len(found) < limit:
+            lo, hi = _prefix_range(self.name_keys, normalize_text(query))
+            # Một học sinh có thể khớp ở nhiều từ: lấy dư rồi bỏ trùng
+            for row in self.name_rows[lo:min(hi, lo + 4 * limit)]:
+                if row not in found:
+                    found.append(row)
+                if len(found) >= limit:
+                    break
+        return np.asarray(found, dtype=np.intp)
+
+    def classmates(self, row):
+        """Vị trí các dòng cùng lớp với dòng `row` (cả dòng đó); cả bảng nếu không có cột 'lop'."""
+        if self.class_codes is None:
+            return None
+        code = self.class_codes[row]
+        return np.sort(self.class_rows[self.class_offsets[code]:self.class_offsets[code + 1]])
+
+    @property
+    def nbytes(self):
+        arrays = (self.ids, self.id_rows, self.name_keys, self.name_rows, self.class_codes, self.class_rows,
+                  self.class_offsets)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+@profiling.profiled()
+def build_student_index(df):
+    """
+    Dựng `StudentIndex` cho bảng điểm (một lần sắp xếp cho MaHS, một cho họ tên
+    nếu có, một cho lớp).
+
+    Args:
+        df (pd.DataFrame): Bảng điểm có cột MaHS.
+
+    Returns:
+        StudentIndex: Chỉ mục tra cứu.
+    """
+    ids = df["MaHS"].astype(str).to_numpy(dtype=str) if "MaHS" in df.columns else np.array([], dtype=str)
+    order = np.argsort(ids, kind="stable")
+    index = StudentIndex(ids[order], order.astype(np.intp))
+
+    name_column = next((col for col in NAME_COLUMNS if col in df.columns), None)
+    if name_column is not None:
+        # Họ tên hay trùng nhau: chỉ chuẩn hóa và sắp xếp các họ tên khác nhau
+        name_codes, names = pd.factorize(df[name_column])
+        suffixes = [[" ".join(words[i:]) for i in range(len(words))]
+                    for words in (normalize_text(name).split() for name in names)]
+        counts = np.fromiter(map(len, suffixes), dtype=np.intp, count=len(suffixes))
+        starts = np.cumsum(counts) - counts
+        flat = np.asarray([key for keys in suffixes for key in keys], dtype=object)
+        rank = np.empty(len(flat), dtype=np.intp)
+        rank[np.argsort(flat, kind="stable")] = np.arange(len(flat))
+
+        # Mỗi dòng có họ tên nhận các đoạn cuối của họ tên đó (vị trí trong flat)
+        valid = np.flatnonzero(name_codes >= 0)
+        per_row = counts[name_codes[valid]]
+        within = np.arange(per_row.sum()) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+        key_pos = np.repeat(starts[name_codes[valid]], per_row) + within
+        rows = np.repeat(valid, per_row)
+        order = np.argsort(rank[key_pos], kind="stable")
+        index.name_column = name_column
+        index.name_keys, index.name_rows = flat[key_pos[order]], rows[order]
+
+    if "lop" in df.columns:
+        codes, _ = pd.factorize(df["lop"], use_na_sentinel=False)
+        index.class_codes = codes.astype(np.int32)
+        index.class_rows = np.argsort(codes, kind="stable").astype(np.intp)
+        index.class_offsets = np.concatenate([[0], np.cumsum(np.bincount(codes))])
+    return index
+
+def student_profile(df, score_cols, row, index):
+    """
+    Điểm của học sinh ở dòng `row` cùng Z-score so với lớp (chỉ tính trên các
+    dòng của lớp, như `analysis.compute_inter_student_zscores`) và Z-score cá
+    nhân (so với trung bình các cột điểm của chính học sinh đó, như
+    `analysis.compute_intra_student_zscores`).
+
+    Returns:
+        pd.DataFrame: Mỗi cột điểm một dòng: CotDiem, Diem, TrungBinhLop,
+        DoLechChuanLop, ZScoreLop, TrungBinhCaNhan, ZScoreCaNhan.
+    """
+    rows = index.classmates(row)
+    class_df = df if rows is None else df.iloc[rows]
+    student = df.iloc[[row]]
+    values = analysis.score_matrix(student, score_cols)[0]
+
+    # Trung bình/độ lệch chuẩn của lớp (một nhóm) và của riêng học sinh;
+    # Z-score tính lại ở float64 thay vì lấy từ ma trận float16
+    class_z = analysis.compute_inter_student_zscores(class_df, score_cols)
+    personal = analysis.compute_intra_student_zscores(student, score_cols)
+    personal_mean, personal_std = personal.means[0, 0], personal.stds[0, 0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            "CotDiem": list(score_cols),
+            "Diem": values,
+            "TrungBinhLop": class_z.means[0],
+            "DoLechChuanLop": class_z.stds[0],
+            "ZScoreLop": (values - class_z.means[0]) / class_z.stds[0],
+            "TrungBinhCaNhan": personal_mean,
+            "ZScoreCaNhan": (values - personal_mean) / personal_std,
+        })
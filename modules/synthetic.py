@@ -0,0 +1,110 @@
+# modules/synthetic.py
+
+"""
+Sinh dữ liệu điểm giả lập có cùng cấu trúc với các tệp mẫu trong `assets/`
+(điểm thành phần: TX1, TX2, TX3, GK, CK; điểm tổng hợp: 9 môn), dùng để đo
+hiệu năng và thử nghiệm ở các quy mô khác nhau (1 nghìn đến 1 triệu học sinh).
+
+Điểm của mỗi học sinh = năng lực của lớp + năng lực riêng + độ lệch theo môn +
+nhiễu, được làm tròn và giới hạn trong [0, 10]. Có thể điều chỉnh số lớp, tỷ lệ
+ô trống và tỷ lệ điểm bất thường được cài sẵn (điểm bị đẩy về phía đối diện
+với năng lực của học sinh).
+
+Ví dụ:
+    python -m modules.synthetic diem_gia_lap.csv --students 100000 --type summary --classes 2500
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from modules import analysis
+
+# Khối lớp dùng để đặt tên lớp (ví dụ 10A1, 11A12)
+GRADES = (10, 11, 12)
+
+def class_names(n_classes):
+    """Tên lớp theo dạng `<khối>A<số thứ tự>`, chia đều cho các khối."""
+    return [f"{GRADES[i % len(GRADES)]}A{i // len(GRADES) + 1}" for i in range(n_classes)]
+
+def generate_scores(n_students, analysis_type='summary', n_classes=None, missing_rate=0.03,
+                    outlier_rate=0.005, seed=0):
+    """
+    Sinh một bảng điểm giả lập.
+
+    Args:
+        n_students (int): Số học sinh (số dòng).
+        analysis_type (str): 'component' (điểm thành phần) hoặc 'summary' (điểm tổng hợp).
+        n_classes (int, optional): Số lớp; mặc định khoảng 40 học sinh mỗi lớp.
+        missing_rate (float): Tỷ lệ ô điểm bị bỏ trống.
+        outlier_rate (float): Tỷ lệ ô điểm được cài thành bất thường.
+        seed (int): Hạt giống ngẫu nhiên, cùng tham số cho cùng dữ liệu.
+
+    Returns:
+        pd.DataFrame: Các cột STT, MaHS, lop và các cột điểm của loại dữ liệu.
+    """
+    if analysis_type == 'component':
+        score_cols = analysis.COMPONENT_SCORE_COLS
+    elif analysis_type == 'summary':
+        score_cols = analysis.SUMMARY_SUBJECT_COLS
+    else:
+        raise ValueError(f"Loại dữ liệu '{analysis_type}' không hợp lệ (dùng 'component' hoặc 'summary').")
+
+    rng = np.random.default_rng(seed)
+    n_classes = n_classes or max(1, n_students // 40)
+    n_cols = len(score_cols)
+
+    class_idx = np.sort(rng.integers(0, n_classes, n_students))
+    class_level = rng.normal(0, 0.6, n_classes)
+    ability = 6.8 + class_level[class_idx] + rng.normal(0, 1.0, n_students)
+    subject_bias = rng.normal(0, 0.4, n_cols)
+    scores = ability[:, None] + subject_bias[None, :] + rng.normal(0, 0.9, (n_students, n_cols))
+
+    # Điểm bất thường: đẩy về phía đối diện với năng lực của học sinh
+    outliers = rng.random((n_students, n_cols)) < outlier_rate
+    high = rng.uniform(9.5, 10, (n_students, n_cols))
+    low = rng.uniform(0, 2, (n_students, n_cols))
+    scores = np.where(outliers, np.where(ability[:, None] < 6, high, low), scores)
+
+    if analysis_type == 'component':
+        # Điểm thường xuyên chấm nguyên, GK/CK lẻ 0,1 như tệp mẫu
+        scores[:, :3] = np.round(scores[:, :3])
+    scores = np.clip(np.round(scores, 1), 0, 10)
+    scores[rng.random((n_students, n_cols)) < missing_rate] = np.nan
+
+    # Mã học sinh 8 chữ số, không trùng nhau
+    student_ids = 10_000_000 + rng.choice(90_000_000, n_students, replace=False)
+    df = pd.DataFrame(scores, columns=score_cols)
+    df.insert(0, 'lop', np.asarray(class_names(n_classes), dtype=object)[class_idx])
+    df.insert(0, 'MaHS', student_ids.astype(str))
+    df.insert(0, 'STT', np.arange(1, n_students + 1))
+    return df
+
+def write_dataset(df, path):
+    """Ghi bảng điểm ra CSV (UTF-8 có BOM như tệp mẫu) hoặc Excel theo phần mở rộng."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.xlsx', '.xls'):
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu điểm giả lập theo cấu trúc tệp mẫu.")
+    parser.add_argument("output", help="Tệp đầu ra (.csv hoặc .xlsx)")
+    parser.add_argument("--students", type=int, default=10_000, help="Số học sinh (mặc định 10000)")
+    parser.add_argument("--type", choices=["component", "summary"], default="summary",
+                        help="component: điểm thành phần; summary: điểm tổng hợp")
+    parser.add_argument("--classes", type=int, default=None, help="Số lớp (mặc định ~40 học sinh/lớp)")
+    parser.add_argument("--missing", type=float, default=0.03, help="Tỷ lệ ô trống (mặc định 0.03)")
+    parser.add_argument("--outliers", type=float, default=0.005, help="Tỷ lệ điểm bất thường cài sẵn (mặc định 0.005)")
+    parser.add_argument("--seed", type=int, default=0, help="Hạt giống ngẫu nhiên")
+    args = parser.parse_args(argv)
+
+    df = generate_scores(args.students, args.type, args.classes, args.missing, args.outliers, args.seed)
+    write_dataset(df, args.output)
+    print(f"Đã ghi {len(df)} học sinh, {df['lop'].nunique()} lớp vào '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,27 @@
 # modules/utils.py
 
+import hashlib
+import os
 import pandas as pd
 import streamlit as st
 from io import BytesIO
 
+from modules import analysis, cache, incremental, ingest, profiling, rules, students
+
+# Loại dữ liệu trên giao diện -> tên dùng trong các module phân tích, dòng lệnh và kho lịch sử
+ANALYSIS_KINDS = {"Điểm thành phần": "component", "Điểm tổng hợp": "summary"}
+
+# Tùy chọn đọc tệp; là một phần của khóa cache trên đĩa nên cần đổi khi cách đọc thay đổi
+READ_OPTIONS = {"reader": "ingest", "version": 4}
+
+@profiling.profiled("utils.load_data")
 @st.cache_data(show_spinner="Đang tải và xử lý tệp...")
 def load_data(uploaded_file):
     """
     Đọc dữ liệu từ tệp CSV hoặc Excel được người dùng tải lên.
-    Hàm này sử dụng cache của Streamlit để tránh việc đọc lại tệp mỗi khi có thay đổi trên giao diện.
+    Hàm này sử dụng cache của Streamlit để tránh việc đọc lại tệp mỗi khi có thay đổi trên giao diện,
+    và cache trên đĩa (theo mã băm nội dung tệp) để không phải đọc lại tệp đã gặp sau khi
+    ứng dụng khởi động lại.
 
     Args:
         uploaded_file: Đối tượng tệp được trả về từ st.file_uploader.
@@ -20,54 +33,318 @@ def load_data(uploaded_file):
         return None
 
     try:
-        # Lấy phần mở rộng của tên tệp để xác định loại tệp
-        file_extension = uploaded_file.name.split('.')[-1].lower()
-
-        if file_extension == 'csv':
-            # Đọc tệp CSV, thử các encoding phổ biến nếu utf-8 lỗi
-            try:
-                df = pd.read_csv(uploaded_file)
-            except UnicodeDecodeError:
-                uploaded_file.seek(0) # Quay lại đầu tệp để đọc lại
-                df = pd.read_csv(uploaded_file, encoding='latin1')
-        elif file_extension in ['xlsx', 'xls']:
-            # Đọc tệp Excel
-            df = pd.read_excel(uploaded_file, engine='openpyxl')
-        else:
-            st.error(f"Lỗi: Định dạng tệp '{file_extension}' không được hỗ trợ. Vui lòng sử dụng tệp CSV hoặc Excel.")
-            return None
-        
-        # Xử lý các cột STT, MaHS có thể bị đọc thành số thực
-        if 'MaHS' in df.columns:
-            df['MaHS'] = df['MaHS'].astype(str)
-        if 'STT' in df.columns:
-            df['STT'] = df['STT'].astype(str)
-            
-        return df
+        extension = uploaded_file.name.split('.')[-1].lower()
+        key = cache.make_key("data", file_fingerprint(uploaded_file), extension, READ_OPTIONS)
+        return cache.default_cache().get_or_compute(key, lambda: ingest.read_table(uploaded_file))
+    except ingest.UnsupportedFileTypeError as e:
+        st.error(f"Lỗi: {e}")
+        return None
+    except Exception as e:
+        st.error(f"Đã có lỗi xảy ra khi đọc tệp: {e}")
+        return None
+
+def file_fingerprint(uploaded_file):
+    """
+    Tính mã băm SHA-256 của nội dung tệp tải lên, dùng làm khóa cache cho các
+    bước phân tích (hai tệp có cùng nội dung cho cùng một mã).
 
+    Args:
+        uploaded_file: Đối tượng tệp được trả về từ st.file_uploader.
+
+    Returns:
+        str: Chuỗi hex của mã băm.
+    """
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+def files_fingerprint(uploaded_files):
+    """
+    Mã băm của một danh sách tệp tải lên (theo thứ tự, gồm cả tên tệp vì tên
+    được ghi vào cột TepNguon); một tệp thì giống `file_fingerprint`.
+    """
+    if len(uploaded_files) == 1:
+        return file_fingerprint(uploaded_files[0])
+    h = hashlib.sha256()
+    for uploaded_file in uploaded_files:
+        h.update(uploaded_file.name.encode("utf-8"))
+        h.update(file_fingerprint(uploaded_file).encode("ascii"))
+    return h.hexdigest()
+
+@profiling.profiled("utils.load_files")
+def load_files(uploaded_files, fingerprint=None):
+    """
+    Đọc một hoặc nhiều tệp tải lên. Một tệp được đọc như `load_data`; nhiều
+    tệp được đọc song song (xem `ingest.read_tables`, kèm thanh tiến độ) rồi gộp bằng
+    `ingest.merge_tables`. Từng tệp vẫn dùng cache trên đĩa như `load_data`, và bảng
+    đã gộp được giữ trong phiên theo `fingerprint` (xem `files_fingerprint`).
+
+    Returns:
+        pd.DataFrame or None: Bảng điểm, hoặc None nếu có tệp không đọc được.
+    """
+    if len(uploaded_files) == 1:
+        return load_data(uploaded_files[0])
+    fingerprint = fingerprint or files_fingerprint(uploaded_files)
+    loaded = st.session_state.get("loaded_files")
+    if loaded is not None and loaded[0] == fingerprint:
+        return loaded[1]
+
+    names = [uploaded_file.name for uploaded_file in uploaded_files]
+    if len(set(names)) < len(names):
+        st.error("Lỗi: Có nhiều tệp trùng tên; vui lòng đổi tên để phân biệt nguồn của từng học sinh.")
+        return None
+    disk_cache = cache.default_cache()
+    keys = [cache.make_key("data", file_fingerprint(f), f.name.split('.')[-1].lower(), READ_OPTIONS)
+            for f in uploaded_files]
+    frames = [disk_cache.get_frame(key) for key in keys]
+    missing = [i for i, frame in enumerate(frames) if frame is None]
+
+    progress_bar = st.progress(0.0, text=f"Đang đọc {len(missing)} tệp...")
+    try:
+        parsed = ingest.read_tables(
+            [(names[i], uploaded_files[i].getvalue()) for i in missing],
+            progress=lambda n_done, total, name: progress_bar.progress(
+                n_done / total, text=f"Đã đọc {n_done}/{total} tệp (vừa xong: {name})"
+            ),
+        ) if missing else []
+        for i, df in zip(missing, parsed):
+            frames[i] = df
+            disk_cache.put_frame(keys[i], df)
+        df = ingest.merge_tables(frames, names)
     except Exception as e:
         st.error(f"Đã có lỗi xảy ra khi đọc tệp: {e}")
         return None
+    finally:
+        progress_bar.empty()
+    st.session_state["loaded_files"] = (fingerprint, df)
+    return df
+
+@st.cache_resource(show_spinner="Đang tính toán Z-score...", max_entries=8)
+def _prepare_analysis_cached(_df, fingerprint, analysis_type, group_col, rules_fingerprint, methods,
+                             _previous=None):
+    # `_df`, `_previous` không được Streamlit băm; khóa cache là (fingerprint, analysis_type,
+    # group_col, rules_fingerprint, methods), nên sửa tệp quy tắc sẽ đánh giá lại các quy tắc
+    if _previous is not None:
+        return incremental.update_analysis(_previous, _df, ANALYSIS_KINDS[analysis_type], group_col, methods=methods)
+    if analysis_type == "Điểm thành phần":
+        return analysis.prepare_component_analysis(_df, group_col, methods=methods)
+    return analysis.prepare_summary_analysis(_df, group_col, methods)
+
+def detection_methods(methods=None):
+    """Các phương pháp phát hiện đã chọn theo thứ tự của DETECTION_METHODS (mặc định: chỉ Z-score)."""
+    if methods is None:
+        return analysis.DEFAULT_DETECTION_METHODS
+    return tuple(method for method in analysis.DETECTION_METHODS if method in methods)
+
+def prepare_analysis(df, fingerprint, analysis_type, group_col=None, previous=None, methods=None):
+    """
+    Lấy (hoặc tính và cache) phần phân tích không phụ thuộc ngưỡng Z-score.
+
+    Kết quả được giữ trong bộ nhớ của tiến trình theo mã băm nội dung tệp và
+    nhóm so sánh, nên việc kéo thanh trượt ngưỡng chỉ gọi `PreparedAnalysis.detect`
+    thay vì tính lại toàn bộ Z-score.
+
+    Args:
+        df (pd.DataFrame): Dữ liệu đã đọc từ tệp.
+        fingerprint (str): Mã băm nội dung tệp (xem `file_fingerprint`).
+        analysis_type (str): "Điểm thành phần" hoặc "Điểm tổng hợp".
+        group_col (str, optional): Cột chia nhóm so sánh.
+        previous (analysis.PreparedAnalysis, optional): Kết quả của phiên bản
+            trước của cùng danh sách (cùng loại dữ liệu, nhóm so sánh, quy tắc và
+            phương pháp, xem `analysis_settings`); nếu có thì chỉ tính lại phần
+            thay đổi (xem `modules/incremental.py`).
+        methods (list, optional): Các phương pháp phát hiện (khóa của
+            analysis.DETECTION_METHODS); mặc định chỉ Z-score. Thống kê của mỗi
+            kiểu so sánh được tính một lần cho mọi phương pháp.
+
+    Returns:
+        analysis.PreparedAnalysis: Đối tượng dùng chung, không được sửa đổi.
+    """
+    return _prepare_analysis_cached(df, fingerprint, analysis_type, group_col, _rules_fingerprint(analysis_type),
+                                    detection_methods(methods), previous)
+
+def _rules_fingerprint(analysis_type):
+    # Quy tắc kiểm tra chỉ áp dụng cho điểm thành phần
+    if analysis_type != "Điểm thành phần":
+        return None
+    return rules.rules_fingerprint(rules.default_rules())
+
+def analysis_settings(analysis_type, group_col=None, methods=None):
+    """
+    Các thiết lập ảnh hưởng tới kết quả ngoài nội dung tệp (loại dữ liệu, nhóm
+    so sánh, quy tắc kiểm tra, phương pháp phát hiện); chỉ phân tích lại tăng
+    dần giữa hai tệp có cùng thiết lập.
+    """
+    return (analysis_type, group_col, _rules_fingerprint(analysis_type), detection_methods(methods))
 
-def prepare_excel_download(df_dict: dict):
+@profiling.profiled()
+def detect_anomalies(df, fingerprint, analysis_type, z_thresh, group_col=None, previous=None, methods=None):
+    """
+    Trả về bảng bất thường cho (tệp, loại dữ liệu, nhóm so sánh, ngưỡng, phương
+    pháp), ưu tiên lấy từ cache trên đĩa; nếu chưa có thì lọc từ `prepare_analysis`
+    rồi lưu lại.
+    """
+    methods = detection_methods(methods)
+    key = cache.make_key("anomalies", fingerprint, analysis_type, group_col, _rules_fingerprint(analysis_type),
+                         round(float(z_thresh), 6), methods)
+    return cache.default_cache().get_or_compute(
+        key, lambda: prepare_analysis(df, fingerprint, analysis_type, group_col, previous, methods).detect(z_thresh)
+    )
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _score_distribution_cached(_df, fingerprint, column, group_col):
+    # `_df` không được Streamlit băm; khóa cache là (fingerprint, column, group_col)
+    return analysis.score_distribution(_df, column, group_col)
+
+def score_distribution(df, fingerprint, column, group_col=None):
+    """
+    Phân bố điểm đã gom của một cột (xem `analysis.score_distribution`), cache
+    theo (tệp, cột, cột chia nhóm): đổi nhóm được so sánh trên biểu đồ không
+    phải đếm lại.
+    """
+    return _score_distribution_cached(df, fingerprint, column, group_col)
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _anomaly_index_cached(_df_anomalies, fingerprint, analysis_type, group_col, rules_fingerprint, z_thresh,
+                          methods):
+    # `_df_anomalies` không được Streamlit băm; khóa cache giống khóa của `detect_anomalies`
+    return analysis.build_anomaly_index(_df_anomalies)
+
+def anomaly_index(df_anomalies, fingerprint, analysis_type, z_thresh, group_col=None, methods=None):
+    """
+    Chỉ mục lọc (xem `analysis.AnomalyIndex`) của bảng bất thường trả về bởi
+    `detect_anomalies` với cùng tham số; được dựng một lần cho mỗi bảng, các lần
+    bấm bộ lọc sau đó chỉ tra mã.
+    """
+    return _anomaly_index_cached(df_anomalies, fingerprint, analysis_type, group_col,
+                                 _rules_fingerprint(analysis_type), round(float(z_thresh), 6),
+                                 detection_methods(methods))
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _student_index_cached(_df, fingerprint):
+    # `_df` không được Streamlit băm; khóa cache là dấu vân tay của tệp
+    return students.build_student_index(_df)
+
+def student_index(df, fingerprint):
+    """
+    Chỉ mục tra cứu học sinh (xem `students.StudentIndex`) của bảng điểm, dựng
+    một lần cho mỗi tệp; mỗi lần gõ tìm kiếm sau đó chỉ là tìm kiếm nhị phân.
+    """
+    return _student_index_cached(df, fingerprint)
+
+# Số dòng được chuyển đổi và ghi mỗi lần khi xuất báo cáo
+EXPORT_CHUNK_ROWS = 20_000
+
+def _iter_export_chunks(df, formatter=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Chia DataFrame thành các khối để ghi lần lượt; `formatter` (nếu có) được áp
+    dụng cho từng khối, nên các cột chỉ dùng khi xuất (ví dụ GiaiThich) không
+    bao giờ được tạo cho cả bảng cùng lúc.
+    """
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield formatter(chunk) if formatter is not None else chunk
+
+@profiling.profiled()
+def prepare_excel_download(df_dict: dict, formatters: dict = None):
     """
     Tạo một tệp Excel trong bộ nhớ với nhiều sheet từ một dictionary các DataFrame.
 
+    Tệp được ghi theo chế độ write-only của openpyxl: các dòng được ghi lần lượt
+    theo từng khối thay vì dựng toàn bộ cây ô trong bộ nhớ, nên bộ nhớ dùng thêm
+    gần như không đổi dù sheet có hàng trăm nghìn dòng.
+
     Args:
         df_dict (dict): Một dictionary trong đó key là tên sheet và value là DataFrame tương ứng.
+        formatters (dict, optional): Hàm định dạng áp dụng cho từng khối dòng của
+            sheet cùng tên (ví dụ `analysis.format_anomalies`).
 
     Returns:
         bytes: Dữ liệu bytes của tệp Excel đã được tạo, sẵn sàng để tải xuống.
     """
+    from openpyxl import Workbook
+
+    formatters = formatters or {}
+    workbook = Workbook(write_only=True)
+    for sheet_name, df in df_dict.items():
+        # Ghi mỗi DataFrame vào một sheet riêng (tên sheet tối đa 31 ký tự)
+        worksheet = workbook.create_sheet(title=sheet_name[:31])
+        header_written = False
+        for chunk in _iter_export_chunks(df, formatters.get(sheet_name)):
+            if not header_written:
+                worksheet.append([str(col) for col in chunk.columns])
+                header_written = True
+            # Chuyển về kiểu Python, giá trị thiếu thành ô trống
+            values = chunk.astype(object).where(chunk.notna(), None)
+            for row in values.itertuples(index=False, name=None):
+                worksheet.append(row)
+
     # Tạo một buffer in-memory để lưu file Excel
     output = BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+@profiling.profiled()
+def prepare_csv_zip_download(df_dict: dict, formatters: dict = None):
+    """
+    Tạo tệp ZIP chứa mỗi DataFrame dưới dạng một tệp CSV (UTF-8 có BOM để Excel
+    đọc đúng tiếng Việt). Nhanh hơn nhiều so với Excel cho các bảng lớn.
+
+    Args:
+        df_dict (dict): Tên tệp (không có đuôi) -> DataFrame.
+        formatters (dict, optional): Như `prepare_excel_download`.
+
+    Returns:
+        bytes: Nội dung tệp ZIP.
+    """
+    import io
+    import zipfile
+
+    formatters = formatters or {}
+    output = BytesIO()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, df in df_dict.items():
+            with archive.open(f"{name}.csv", 'w') as raw, io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as text:
+                for i, chunk in enumerate(_iter_export_chunks(df, formatters.get(name))):
+                    chunk.to_csv(text, header=(i == 0), index=False)
+    return output.getvalue()
+
+@profiling.profiled()
+def prepare_parquet_zip_download(df_dict: dict, formatters: dict = None):
+    """
+    Tạo tệp ZIP chứa mỗi DataFrame dưới dạng một tệp Parquet (mỗi khối dòng là
+    một row group). Phù hợp để nạp lại vào các công cụ phân tích dữ liệu.
+
+    Args:
+        df_dict (dict): Tên tệp (không có đuôi) -> DataFrame.
+        formatters (dict, optional): Như `prepare_excel_download`.
+
+    Returns:
+        bytes: Nội dung tệp ZIP.
+    """
+    import zipfile
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    formatters = formatters or {}
+    output = BytesIO()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, df in df_dict.items():
+            buffer = BytesIO()
+            writer = None
+            for chunk in _iter_export_chunks(df, formatters.get(name)):
+                # Cột object (ví dụ DiemBatThuong lẫn số và "Bị trống") được ghi dạng chuỗi
+                chunk = chunk.astype({col: "string" for col in chunk.columns if chunk[col].dtype == object})
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(buffer, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            writer.close()
+            archive.writestr(f"{name}.parquet", buffer.getvalue())
+    return output.getvalue()
 
-    # Sử dụng Pandas ExcelWriter để ghi nhiều sheet vào buffer
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        for sheet_name, df in df_dict.items():
-            # Ghi mỗi DataFrame vào một sheet riêng
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-    
-    # Lấy dữ liệu từ buffer sau khi đã ghi xong
-    processed_data = output.getvalue()
-    return processed_data
\ No newline at end of file
+# Các định dạng báo cáo: nhãn -> (hàm tạo tệp, phần mở rộng, MIME type)
+REPORT_FORMATS = {
+    "Excel (.xlsx)": (prepare_excel_download, "xlsx",
+                      "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV (.zip)": (prepare_csv_zip_download, "zip", "application/zip"),
+    "Parquet (.zip)": (prepare_parquet_zip_download, "zip", "application/zip"),
+}
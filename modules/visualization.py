@@ -1,16 +1,43 @@
 # modules/visualization.py
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 
-def plot_score_distribution(df: pd.DataFrame, column: str):
+from modules import analysis, profiling
+
+# Giới hạn kích thước heatmap: số học sinh mỗi trang và tổng số ô được vẽ
+HEATMAP_ROWS_PER_PAGE = 200
+HEATMAP_MAX_CELLS = 20_000
+# Dùng trace WebGL (Scattergl) cho lớp đánh dấu khi số ô được vẽ vượt ngưỡng này
+WEBGL_CELL_THRESHOLD = 5_000
+# Biểu đồ phân bố: số nhóm tối đa được chồng histogram, và số nhóm tối đa
+# được vẽ một hộp riêng khi không chọn nhóm nào
+DISTRIBUTION_MAX_OVERLAYS = 8
+DISTRIBUTION_MAX_BOXES = 40
+
+@profiling.profiled()
+def plot_score_distribution(df: pd.DataFrame, column: str, group_col: str = None, groups: list = None,
+                            distribution: analysis.ScoreDistribution = None):
     """
-    Tạo biểu đồ histogram để hiển thị phân bố điểm của một cột điểm được chọn.
+    Tạo biểu đồ histogram (kèm biểu đồ hộp ở trên) để hiển thị phân bố điểm
+    của một cột điểm được chọn.
+
+    Số học sinh trong từng khoảng và các tứ phân vị được tính sẵn bằng
+    `analysis.score_distribution`, biểu đồ chỉ nhận các giá trị đã gom nên kích
+    thước không phụ thuộc số học sinh.
 
     Args:
         df (pd.DataFrame): DataFrame chứa dữ liệu.
         column (str): Tên cột điểm cần vẽ biểu đồ.
+        group_col (str, optional): Cột chia nhóm (ví dụ 'lop').
+        groups (list, optional): Các nhóm cần chồng histogram để so sánh (tối đa
+            DISTRIBUTION_MAX_OVERLAYS). Không chọn thì vẽ histogram của cả tệp và
+            (nếu số nhóm không quá DISTRIBUTION_MAX_BOXES) một hộp cho mỗi nhóm.
+        distribution (analysis.ScoreDistribution, optional): Phân bố đã tính sẵn
+            (ví dụ lấy từ cache); phải được tính với cùng `column` và `group_col`.
 
     Returns:
         go.Figure: Đối tượng biểu đồ Plotly.
@@ -18,39 +45,64 @@ def plot_score_distribution(df: pd.DataFrame, column: str):
     if column not in df.columns:
         return go.Figure().update_layout(title_text=f"Cột '{column}' không tồn tại.")
 
-    # Chuyển đổi cột sang dạng số, bỏ qua lỗi
-    scores = pd.to_numeric(df[column], errors='coerce').dropna()
-
-    if scores.empty:
+    if distribution is None:
+        distribution = analysis.score_distribution(df, column, group_col)
+    if distribution.stats["SoHocSinh"].iloc[0] == 0:
         return go.Figure().update_layout(title_text=f"Không có dữ liệu hợp lệ trong cột '{column}'.")
 
-    fig = px.histogram(
-        scores,
-        x=column,
-        nbins=20,  # Số lượng cột trong biểu đồ
-        title=f"Phân bố điểm của cột '{column}'",
-        labels={column: "Điểm số"},
-        marginal="box", # Thêm box plot ở trên để xem Q1, Q3, median
-    )
+    stats = distribution.stats
+    if groups:
+        bar_rows = distribution.rows(list(groups)[:DISTRIBUTION_MAX_OVERLAYS])
+        box_rows = bar_rows
+    else:
+        bar_rows = distribution.rows()
+        n_groups = len(distribution.labels) - 1
+        box_rows = np.arange(len(distribution.labels)) if 0 < n_groups <= DISTRIBUTION_MAX_BOXES else bar_rows
 
-    # Thêm đường thẳng đứng chỉ giá trị trung bình
-    mean_value = scores.mean()
-    fig.add_vline(
-        x=mean_value,
-        line_width=3,
-        line_dash="dash",
-        line_color="red",
-        annotation_text=f"Trung bình: {mean_value:.2f}",
-        annotation_position="top right"
-    )
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.3, 0.7], vertical_spacing=0.03)
+    # Biểu đồ hộp ở trên (Q1, trung vị, Q3, trung bình và râu 1.5 IQR) từ các giá trị tính sẵn
+    for i in box_rows[::-1]:
+        row = stats.iloc[i]
+        fig.add_trace(go.Box(
+            y=[row["Nhom"]], q1=[row["Q1"]], median=[row["TrungVi"]], q3=[row["Q3"]], mean=[row["TrungBinh"]],
+            lowerfence=[row["RaoDuoi"]], upperfence=[row["RaoTren"]], orientation="h", name=str(row["Nhom"]),
+            showlegend=False, hoverinfo="x+name",
+        ), row=1, col=1)
+
+    edges = distribution.edges
+    centers, widths = (edges[:-1] + edges[1:]) / 2, np.diff(edges)
+    ranges = [f"{lo:.2f} – {hi:.2f}" for lo, hi in zip(edges[:-1], edges[1:])]
+    for i in bar_rows:
+        fig.add_trace(go.Bar(
+            x=centers, y=distribution.counts[i], width=widths, name=str(distribution.labels[i]),
+            customdata=ranges, opacity=0.6 if len(bar_rows) > 1 else 1.0,
+            hovertemplate="Khoảng %{customdata}<br>Số lượng: %{y}<extra>%{fullData.name}</extra>",
+        ), row=2, col=1)
+
+    if len(bar_rows) == 1:
+        # Thêm đường thẳng đứng chỉ giá trị trung bình
+        mean_value = stats["TrungBinh"].iloc[bar_rows[0]]
+        fig.add_vline(
+            x=mean_value,
+            line_width=3,
+            line_dash="dash",
+            line_color="red",
+            annotation_text=f"Trung bình: {mean_value:.2f}",
+            annotation_position="top right"
+        )
 
     fig.update_layout(
-        xaxis_title="Điểm số",
-        yaxis_title="Số lượng học sinh",
+        title_text=f"Phân bố điểm của cột '{column}'",
+        barmode="overlay",
+        bargap=0,
+        showlegend=len(bar_rows) > 1,
         title_x=0.5, # Căn giữa tiêu đề
     )
+    fig.update_xaxes(title_text="Điểm số", row=2, col=1)
+    fig.update_yaxes(title_text="Số lượng học sinh", row=2, col=1)
     return fig
 
+@profiling.profiled()
 def plot_anomalies_by_class(df_anomalies: pd.DataFrame):
     """
     Tạo biểu đồ cột hiển thị số lượng bất thường được tìm thấy ở mỗi lớp.
@@ -64,8 +116,10 @@ def plot_anomalies_by_class(df_anomalies: pd.DataFrame):
     if df_anomalies.empty or 'lop' not in df_anomalies.columns:
         return go.Figure().update_layout(title_text="Không có dữ liệu bất thường để thống kê theo lớp.")
 
-    # Đếm số lượng bất thường theo lớp
-    anomaly_counts = df_anomalies['lop'].value_counts().reset_index()
+    # Đếm số lượng bất thường theo lớp; cột lop có thể là category (đọc bằng
+    # ingest): bỏ các lớp không có bất thường nào (số lượng 0)
+    anomaly_counts = df_anomalies['lop'].value_counts()
+    anomaly_counts = anomaly_counts[anomaly_counts > 0].reset_index()
     anomaly_counts.columns = ['lop', 'count']
     
     # Sắp xếp để các lớp có nhiều bất thường nhất hiển thị trước
@@ -83,6 +137,7 @@ def plot_anomalies_by_class(df_anomalies: pd.DataFrame):
     fig.update_layout(title_x=0.5)
     return fig
 
+@profiling.profiled()
 def plot_anomaly_types(df_anomalies: pd.DataFrame):
     """
     Tạo biểu đồ tròn để hiển thị tỷ lệ của các loại bất thường khác nhau.
@@ -96,7 +151,9 @@ def plot_anomaly_types(df_anomalies: pd.DataFrame):
     if df_anomalies.empty or 'LoaiBatThuong' not in df_anomalies.columns:
         return go.Figure().update_layout(title_text="Không có dữ liệu để phân loại bất thường.")
 
-    type_counts = df_anomalies['LoaiBatThuong'].value_counts().reset_index()
+    # Cột LoaiBatThuong là category: bỏ các loại không xuất hiện (số lượng 0)
+    type_counts = df_anomalies['LoaiBatThuong'].value_counts()
+    type_counts = type_counts[type_counts > 0].reset_index()
     type_counts.columns = ['LoaiBatThuong', 'count']
 
     fig = px.pie(
@@ -111,54 +168,212 @@ def plot_anomaly_types(df_anomalies: pd.DataFrame):
     fig.update_layout(title_x=0.5)
     return fig
 
-def plot_anomalies_heatmap(df: pd.DataFrame, df_anomalies: pd.DataFrame, score_cols: list):
+@profiling.profiled()
+def plot_history_anomalies(counts: pd.DataFrame):
+    """
+    Tạo biểu đồ đường số bất thường trên 100 học sinh qua các kỳ đã lưu.
+
+    Args:
+        counts (pd.DataFrame): Kết quả `HistoryStore.anomaly_counts` (cột Ky,
+            SoHocSinh, SoBatThuong và có thể có cột lop).
+
+    Returns:
+        go.Figure: Đối tượng biểu đồ Plotly.
+    """
+    if counts.empty:
+        return go.Figure().update_layout(title_text="Chưa có dữ liệu lịch sử.")
+
+    counts = counts.assign(TyLe=100 * counts['SoBatThuong'] / counts['SoHocSinh'].where(counts['SoHocSinh'] > 0))
+    fig = px.line(
+        counts,
+        x='Ky',
+        y='TyLe',
+        color='lop' if 'lop' in counts.columns else None,
+        markers=True,
+        title="Số bất thường trên 100 học sinh qua các kỳ",
+        labels={'Ky': 'Kỳ', 'TyLe': 'Bất thường / 100 HS', 'lop': 'Lớp'},
+        hover_data=['SoBatThuong', 'SoHocSinh'],
+    )
+    fig.update_layout(title_x=0.5, xaxis_type='category')
+    return fig
+
+@profiling.profiled()
+def plot_history_scores(trend: pd.DataFrame, title: str = "Điểm trung bình qua các kỳ"):
+    """
+    Tạo biểu đồ đường điểm (trung bình) của từng cột điểm qua các kỳ đã lưu.
+
+    Args:
+        trend (pd.DataFrame): Bảng có cột Ky, CotDiem và DiemTrungBinh (kết quả
+            `HistoryStore.score_trend`) hoặc bảng điểm dạng rộng của một học sinh.
+        title (str): Tiêu đề biểu đồ.
+
+    Returns:
+        go.Figure: Đối tượng biểu đồ Plotly.
+    """
+    if trend.empty:
+        return go.Figure().update_layout(title_text="Chưa có dữ liệu lịch sử.")
+
+    if 'CotDiem' not in trend.columns:
+        # Bảng dạng rộng (mỗi cột điểm một cột): chuyển sang dạng dài
+        score_cols = [col for col in trend.columns if col not in ('Ky', 'NamHoc', 'HocKy', 'lop')]
+        trend = trend.melt(id_vars=['Ky'], value_vars=score_cols, var_name='CotDiem', value_name='DiemTrungBinh')
+
+    fig = px.line(
+        trend,
+        x='Ky',
+        y='DiemTrungBinh',
+        color='CotDiem',
+        markers=True,
+        title=title,
+        labels={'Ky': 'Kỳ', 'DiemTrungBinh': 'Điểm', 'CotDiem': 'Cột điểm'},
+    )
+    fig.update_layout(title_x=0.5, xaxis_type='category')
+    return fig
+
+@profiling.profiled()
+def plot_student_profile(profile: pd.DataFrame, title: str = "Điểm của học sinh so với lớp"):
+    """
+    Tạo biểu đồ cột điểm của một học sinh cạnh điểm trung bình của lớp, kèm
+    Z-score so với lớp khi rê chuột.
+
+    Args:
+        profile (pd.DataFrame): Kết quả `students.student_profile`.
+        title (str): Tiêu đề biểu đồ.
+
+    Returns:
+        go.Figure: Đối tượng biểu đồ Plotly.
+    """
+    if profile.empty:
+        return go.Figure().update_layout(title_text="Không có dữ liệu điểm.")
+
+    fig = go.Figure([
+        go.Bar(x=profile['CotDiem'], y=profile['Diem'], name='Học sinh',
+               customdata=profile[['ZScoreLop', 'ZScoreCaNhan']].to_numpy(),
+               hovertemplate="%{x}: %{y:.2f}<br>Z lớp: %{customdata[0]:.2f}<br>Z cá nhân: %{customdata[1]:.2f}"
+                             "<extra></extra>"),
+        go.Bar(x=profile['CotDiem'], y=profile['TrungBinhLop'], name='Trung bình lớp',
+               error_y=dict(type='data', array=profile['DoLechChuanLop'], visible=True),
+               hovertemplate="%{x}: %{y:.2f}<extra></extra>"),
+    ])
+    fig.update_layout(title_text=title, title_x=0.5, barmode='group',
+                      xaxis_title='Cột điểm', yaxis_title='Điểm')
+    return fig
+
+def heatmap_layout(n_rows: int, n_cols: int, rows_per_page: int = HEATMAP_ROWS_PER_PAGE,
+                   max_cells: int = HEATMAP_MAX_CELLS):
+    """
+    Tính số hàng thực tế mỗi trang (không vượt quá `max_cells` ô) và số trang
+    của heatmap.
+
+    Returns:
+        tuple: (rows_per_page, n_pages).
+    """
+    rows_per_page = max(1, min(rows_per_page, max_cells // max(n_cols, 1)))
+    n_pages = max(1, -(-n_rows // rows_per_page))
+    return rows_per_page, n_pages
+
+@profiling.profiled()
+def plot_anomalies_heatmap(df: pd.DataFrame, df_anomalies: pd.DataFrame, score_cols: list,
+                           page: int = 0, rows_per_page: int = HEATMAP_ROWS_PER_PAGE,
+                           sort_by_anomalies: bool = False, max_cells: int = HEATMAP_MAX_CELLS):
     """
     Tạo heatmap của bảng điểm và đánh dấu các ô có điểm bất thường.
 
+    Chỉ một "cửa sổ" hàng (một trang) được đưa vào biểu đồ, với tổng số ô không
+    vượt quá `max_cells`, nên thời gian dựng và dung lượng biểu đồ gần như không
+    đổi dù danh sách học sinh dài đến đâu. Các vị trí bất thường được vẽ bằng
+    một lớp scatter duy nhất (dùng WebGL khi có nhiều điểm) thay vì từng
+    annotation riêng lẻ.
+
     Args:
         df (pd.DataFrame): DataFrame gốc chứa toàn bộ điểm.
         df_anomalies (pd.DataFrame): DataFrame chỉ chứa các bất thường.
         score_cols (list): Danh sách các cột điểm để hiển thị trên heatmap.
+        page (int): Trang cần hiển thị (bắt đầu từ 0).
+        rows_per_page (int): Số học sinh mỗi trang (xem `heatmap_layout`).
+        sort_by_anomalies (bool): Xếp học sinh có nhiều bất thường nhất lên đầu.
+        max_cells (int): Số ô tối đa được vẽ.
 
     Returns:
         go.Figure: Đối tượng biểu đồ Plotly.
     """
-    # Chuẩn bị dữ liệu cho heatmap
-    df_heatmap = df.set_index('MaHS')[score_cols].apply(pd.to_numeric, errors='coerce')
+    n_rows, n_cols = len(df), len(score_cols)
+    rows_per_page, n_pages = heatmap_layout(n_rows, n_cols, rows_per_page, max_cells)
+    page = min(max(page, 0), n_pages - 1)
+
+    # Vị trí (hàng, cột) của các bất thường trong bảng điểm gốc
+    anomaly_rows, anomaly_cols = _anomaly_cells(df, df_anomalies, score_cols)
+
+    # Chọn các hàng của trang hiện tại
+    if sort_by_anomalies:
+        counts = np.bincount(anomaly_rows, minlength=n_rows)
+        order = np.argsort(-counts, kind='stable')
+    else:
+        order = np.arange(n_rows)
+    window = order[page * rows_per_page:(page + 1) * rows_per_page]
+
+    # Chỉ chuyển đổi dữ liệu của các hàng được vẽ
+    df_window = df.iloc[window]
+    z_values = analysis.score_matrix(df_window, score_cols)
+    y_labels = df_window['MaHS'].astype(str).to_numpy() if 'MaHS' in df.columns else window.astype(str)
 
     fig = go.Figure(data=go.Heatmap(
-        z=df_heatmap.values,
-        x=df_heatmap.columns,
-        y=df_heatmap.index,
+        z=z_values,
+        x=score_cols,
+        y=y_labels,
         colorscale='Viridis',
         colorbar={'title': 'Điểm'},
     ))
 
-    # Thêm các đánh dấu cho điểm bất thường
-    annotations = []
-    for _, row in df_anomalies.iterrows():
-        mahs = row['MaHS']
-        cot_diem = row['CotDiem']
-        
-        # Kiểm tra xem mahs và cot_diem có trong heatmap không
-        if mahs in df_heatmap.index and cot_diem in df_heatmap.columns:
-             annotations.append(
-                go.layout.Annotation(
-                    x=cot_diem,
-                    y=mahs,
-                    text="🔥",  # Dùng emoji hoặc ký tự để đánh dấu
-                    showarrow=False,
-                    font=dict(color='white' if pd.notna(df_heatmap.loc[mahs, cot_diem]) and df_heatmap.loc[mahs, cot_diem] < 5 else 'black', size=14)
-                )
-            )
+    # Thêm các đánh dấu cho điểm bất thường thuộc trang hiện tại
+    position_in_window = np.full(n_rows, -1)
+    position_in_window[window] = np.arange(len(window))
+    in_window = position_in_window[anomaly_rows] >= 0
+    marker_rows = position_in_window[anomaly_rows[in_window]]
+    marker_cols = anomaly_cols[in_window]
+
+    if len(marker_rows):
+        marker_values = z_values[marker_rows, marker_cols]
+        # Chữ trắng trên nền tối (điểm < 5), chữ đen trên nền sáng
+        colors = np.where(~np.isnan(marker_values) & (marker_values < 5), 'white', 'black')
+        scatter = go.Scattergl if z_values.size > WEBGL_CELL_THRESHOLD else go.Scatter
+        fig.add_trace(scatter(
+            x=np.asarray(score_cols, dtype=object)[marker_cols],
+            y=y_labels[marker_rows],
+            mode='text',
+            text="🔥",  # Dùng emoji hoặc ký tự để đánh dấu
+            textfont=dict(color=colors, size=14),
+            hoverinfo='skip',
+            showlegend=False,
+        ))
 
+    title = 'Heatmap chi tiết điểm và các vị trí bất thường (🔥)'
+    if n_pages > 1:
+        title += f' — trang {page + 1}/{n_pages}'
     fig.update_layout(
-        title='Heatmap chi tiết điểm và các vị trí bất thường (🔥)',
+        title=title,
         xaxis_title='Môn học / Cột điểm',
         yaxis_title='Mã Học Sinh',
         yaxis={'type': 'category', 'autorange': 'reversed'}, # Đảo ngược trục y để dễ nhìn
-        annotations=annotations,
         title_x=0.5,
     )
 
-    return fig
\ No newline at end of file
+    return fig
+
+def _anomaly_cells(df: pd.DataFrame, df_anomalies: pd.DataFrame, score_cols: list):
+    """
+    Vị trí hàng và chỉ số cột (trong score_cols) của các bất thường nằm trên heatmap.
+    """
+    if df_anomalies.empty:
+        return np.array([], dtype=np.intp), np.array([], dtype=np.intp)
+
+    col_codes = pd.Index(score_cols).get_indexer(df_anomalies['CotDiem'].astype(str))
+    if 'ViTriDong' in df_anomalies.columns:
+        row_codes = df_anomalies['ViTriDong'].to_numpy(dtype=np.intp)
+    else:
+        # Bảng kết quả không có vị trí dòng: tra theo MaHS (lần xuất hiện đầu tiên)
+        positions = pd.Series(np.arange(len(df)), index=df['MaHS'].astype(str))
+        positions = positions[~positions.index.duplicated()]
+        row_codes = positions.reindex(df_anomalies['MaHS'].astype(str)).fillna(-1).to_numpy(dtype=np.intp)
+    valid = (col_codes >= 0) & (row_codes >= 0) & (row_codes < len(df))
+    return row_codes[valid], col_codes[valid]
@@ -0,0 +1,13 @@
+# tests/conftest.py
+
+"""
+Cấu hình pytest: thêm thư mục gốc của dự án vào sys.path để `modules` import
+được khi chạy pytest từ bất kỳ thư mục nào.
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
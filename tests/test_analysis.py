@@ -0,0 +1,336 @@
+# tests/test_analysis.py
+
+"""
+Các bộ phát hiện vector hóa phải cho đúng kết quả của cài đặt duyệt từng dòng
+ban đầu (iterrows), chép lại dưới đây làm tham chiếu.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import analysis, ingest, synthetic
+
+ASSETS = Path(__file__).resolve().parents[1] / "assets"
+COMPONENT_SAMPLE = ASSETS / "diemthanhphan_mau.csv"
+SUMMARY_SAMPLE = ASSETS / "diemtonghop_mau.csv"
+THRESHOLDS = [1.0, 1.5, 2.0, 2.5, 3.0]
+COLUMNS = ["MaHS", "lop", "CotDiem", "DiemBatThuong", "LoaiBatThuong", "MucDo", "GiaiThich"]
+
+def _reference_severity(z_score, threshold):
+    abs_z = abs(z_score)
+    if abs_z > threshold + 1.0:
+        return "Cao"
+    elif abs_z > threshold + 0.5:
+        return "Trung bình"
+    return "Thấp"
+
+def _reference_intra(df, subject_cols, z_thresh):
+    anomalies = []
+    numeric_df = df[subject_cols].apply(pd.to_numeric, errors='coerce')
+    for i, row in numeric_df.iterrows():
+        student_scores = row.dropna()
+        if len(student_scores) < 3:
+            continue
+        mean = student_scores.mean()
+        std = student_scores.std()
+        if std == 0:
+            continue
+        personal_z_scores = (student_scores - mean) / std
+        outlier_subjects = personal_z_scores[personal_z_scores.abs() > z_thresh]
+        for subject, z_score in outlier_subjects.items():
+            anomaly_score = student_scores[subject]
+            direction = "cao" if z_score > 0 else "thấp"
+            anomalies.append({
+                "MaHS": df.loc[i].get("MaHS", "N/A"),
+                "lop": df.loc[i].get("lop", "N/A"),
+                "CotDiem": subject,
+                "DiemBatThuong": anomaly_score,
+                "LoaiBatThuong": f"Môn có điểm lệch {direction}",
+                "MucDo": _reference_severity(z_score, z_thresh),
+                "GiaiThich": (
+                    f"Điểm môn '{subject}' ({anomaly_score}) {direction} hơn hẳn so với năng lực chung "
+                    f"của học sinh này (trung bình các môn: {mean:.2f})."
+                ),
+            })
+    return anomalies
+
+def _reference_inter(df, score_cols, z_thresh):
+    anomalies = []
+    numeric_df = df[score_cols].apply(pd.to_numeric, errors='coerce')
+    for col in score_cols:
+        col_data = numeric_df[col].dropna()
+        if len(col_data) < 2:
+            continue
+        mean = col_data.mean()
+        std = col_data.std()
+        if std == 0:
+            continue
+        z_scores = (numeric_df[col] - mean) / std
+        for i, row in df[z_scores.abs() > z_thresh].iterrows():
+            student_score = row[col]
+            student_z_score = z_scores.loc[i]
+            direction = "cao" if student_z_score > 0 else "thấp"
+            anomalies.append({
+                "MaHS": row.get("MaHS", "N/A"),
+                "lop": row.get("lop", "N/A"),
+                "CotDiem": col,
+                "DiemBatThuong": student_score,
+                "LoaiBatThuong": f"Điểm {direction} bất thường",
+                "MucDo": _reference_severity(student_z_score, z_thresh),
+                "GiaiThich": f"Điểm {student_score} ở cột '{col}' {direction} hơn đáng kể so với trung bình lớp ({mean:.2f}).",
+            })
+    return anomalies
+
+def _reference_missing(df, score_cols):
+    anomalies = []
+    for col in score_cols:
+        for i, row in df[df[col].isnull()].iterrows():
+            anomalies.append({
+                "MaHS": row.get("MaHS", "N/A"),
+                "lop": row.get("lop", "N/A"),
+                "CotDiem": col,
+                "DiemBatThuong": "Bị trống",
+                "LoaiBatThuong": "Thiếu dữ liệu",
+                "MucDo": "Cao",
+                "GiaiThich": f"Học sinh này bị thiếu điểm ở cột '{col}'.",
+            })
+    return anomalies
+
+def _as_records(frame):
+    """Bảng kết quả dạng hiển thị (như ứng dụng), so sánh được với tham chiếu."""
+    frame = analysis.format_anomalies(frame).reindex(columns=COLUMNS)
+    return frame.astype({"MaHS": str, "lop": str, "CotDiem": str, "LoaiBatThuong": str, "MucDo": str})
+
+def _assert_matches_reference(actual, expected):
+    expected = pd.DataFrame(expected, columns=COLUMNS).astype({"MaHS": str, "lop": str})
+    actual = _as_records(actual)
+    # Điểm được so sánh theo giá trị số (cột object chứa float hoặc "Bị trống")
+    pd.testing.assert_frame_equal(
+        actual.drop(columns="DiemBatThuong").reset_index(drop=True),
+        expected.drop(columns="DiemBatThuong").reset_index(drop=True),
+        check_dtype=False, check_exact=True,
+    )
+    assert actual["DiemBatThuong"].tolist() == expected["DiemBatThuong"].tolist()
+
+def _sample(path):
+    return ingest.read_csv_bytes(path.read_bytes())
+
+def _score_cols(df, analysis_type):
+    known = analysis.COMPONENT_SCORE_COLS if analysis_type == "component" else analysis.SUMMARY_SUBJECT_COLS
+    return [col for col in known if col in df.columns]
+
+@pytest.fixture(scope="module")
+def summary_frames():
+    return [pd.read_csv(SUMMARY_SAMPLE), _sample(SUMMARY_SAMPLE),
+            synthetic.generate_scores(1000, "summary", seed=11),
+            synthetic.generate_scores(1000, "summary", seed=12, missing_rate=0.2)]
+
+@pytest.fixture(scope="module")
+def component_frames():
+    return [pd.read_csv(COMPONENT_SAMPLE), _sample(COMPONENT_SAMPLE),
+            synthetic.generate_scores(1000, "component", seed=13)]
+
+@pytest.mark.parametrize("z_thresh", THRESHOLDS)
+def test_intra_student_deviation_matches_iterrows(summary_frames, z_thresh):
+    for df in summary_frames:
+        subject_cols = _score_cols(df, "summary")
+        _assert_matches_reference(
+            analysis.detect_intra_student_subject_deviation(df, subject_cols, z_thresh),
+            _reference_intra(df, subject_cols, z_thresh),
+        )
+
+@pytest.mark.parametrize("z_thresh", THRESHOLDS)
+def test_inter_student_anomalies_match_iterrows(summary_frames, component_frames, z_thresh):
+    for df, analysis_type in [(df, "summary") for df in summary_frames] + [(df, "component") for df in component_frames]:
+        score_cols = _score_cols(df, analysis_type)
+        _assert_matches_reference(
+            analysis.detect_inter_student_anomalies(df, score_cols, z_thresh),
+            _reference_inter(df, score_cols, z_thresh),
+        )
+
+def test_missing_values_match_iterrows(summary_frames, component_frames):
+    for df, analysis_type in [(df, "summary") for df in summary_frames] + [(df, "component") for df in component_frames]:
+        score_cols = _score_cols(df, analysis_type)
+        _assert_matches_reference(analysis.detect_missing_values(df, score_cols), _reference_missing(df, score_cols))
+
+@pytest.mark.parametrize("analysis_type", ["summary", "component"])
+@pytest.mark.parametrize("group_col", [None, "lop"])
+def test_prepared_analysis_matches_direct_detectors(analysis_type, group_col):
+    # Z-score tính sẵn (float16) rồi lọc theo ngưỡng phải trùng với tính trực tiếp
+    df = synthetic.generate_scores(3000, analysis_type, seed=14)
+    score_cols = _score_cols(df, analysis_type)
+    if analysis_type == "summary":
+        prepared = analysis.prepare_summary_analysis(df, group_col)
+    else:
+        prepared = analysis.prepare_component_analysis(df, group_col)
+    for z_thresh in THRESHOLDS:
+        result = prepared.detect(z_thresh)
+        expected = [analysis.detect_inter_student_anomalies(df, score_cols, z_thresh, group_col)]
+        if analysis_type == "summary":
+            expected.append(analysis.detect_intra_student_subject_deviation(df, score_cols, z_thresh))
+        expected = pd.concat(expected, ignore_index=True)
+        scored = result[result["LoaiBatThuong"].isin(expected["LoaiBatThuong"].unique())]
+        pd.testing.assert_frame_equal(
+            _as_records(scored).reset_index(drop=True), _as_records(expected).reset_index(drop=True)
+        )
+
+@pytest.mark.parametrize("method", ["mad", "iqr"])
+def test_robust_statistics_match_numpy(method):
+    df = synthetic.generate_scores(2000, "summary", seed=15)
+    score_cols = _score_cols(df, "summary")
+    values = analysis.score_matrix(df, score_cols)
+    zm = analysis.compute_inter_student_zscores(df, score_cols, "lop", method)
+    codes, groups = pd.factorize(df["lop"])
+    for g in range(len(groups)):
+        block = values[codes == g]
+        q1, median, q3 = np.nanpercentile(block, [25, 50, 75], axis=0)
+        if method == "mad":
+            centre, scale = median, analysis.MAD_SCALE * np.nanmedian(np.abs(block - median), axis=0)
+        else:
+            centre, scale = (q1 + q3) / 2, (q3 - q1) / analysis.IQR_SCALE
+        np.testing.assert_allclose(zm.means[g], centre)
+        usable = scale > 0
+        np.testing.assert_allclose(zm.stds[g][usable], scale[usable])
+
+@pytest.mark.parametrize("analysis_type", ["summary", "component"])
+@pytest.mark.parametrize("group_col", [None, "lop"])
+def test_blank_score_table_with_robust_methods(analysis_type, group_col):
+    # Tệp mẫu với các cột điểm để trống: chỉ còn các dòng thiếu dữ liệu
+    known = analysis.COMPONENT_SCORE_COLS if analysis_type == "component" else analysis.SUMMARY_SUBJECT_COLS
+    df = pd.DataFrame({"MaHS": ["1", "2", "3"], "lop": ["10A1", "10A1", "10A2"], **{col: np.nan for col in known}})
+    run = analysis.run_component_analysis if analysis_type == "component" else analysis.run_summary_analysis
+    result = run(df, 2.0, group_col, methods=tuple(analysis.DETECTION_METHODS))
+    assert len(result) == 3 * len(known)
+    assert (result["LoaiBatThuong"] == "Thiếu dữ liệu").all()
+
+def _duplicate_roster():
+    """HS0-HS1 trùng, HS2-HS3 khác một ô, HS5 trùng HS0 nhưng khác lớp, HS6-HS7 trùng nhưng chỉ có 4 điểm."""
+    cols = list(analysis.SUMMARY_SUBJECT_COLS)
+    values = np.round(np.random.default_rng(16).uniform(3, 10, (8, len(cols))), 1)
+    values[1] = values[0] + 0.001  # Lệch dưới mức làm tròn (DUPLICATE_DECIMALS) vẫn là trùng
+    values[3] = values[2]
+    values[3, 4] += 1.5
+    values[5] = values[0]
+    values[6, 4:] = np.nan
+    values[7] = values[6]
+    df = pd.DataFrame(values, columns=cols)
+    df.insert(0, "MaHS", [f"HS{i}" for i in range(8)])
+    df.insert(1, "lop", ["10A1"] * 5 + ["10A2"] + ["10A1"] * 2)
+    return df, cols
+
+def _duplicate_groups(result):
+    return {(label, kind) for label, kind in zip(result["NhomThamChieu"], result["LoaiBatThuong"].astype(str))}
+
+def test_duplicate_score_vectors_exact_and_near():
+    df, cols = _duplicate_roster()
+    result = analysis.detect_duplicate_score_vectors(df, cols)
+    assert result["MaHS"].tolist() == ["HS0", "HS1", "HS2", "HS3"]
+    assert _duplicate_groups(result) == {("MaHS HS0, HS1", "Trùng dãy điểm"), ("MaHS HS2, HS3", "Gần trùng dãy điểm")}
+    assert result["MucDo"].astype(str).tolist() == ["Cao", "Cao", "Trung bình", "Trung bình"]
+    assert result["CotDiem"].isna().all()
+
+def test_duplicate_score_vectors_options():
+    df, cols = _duplicate_roster()
+    # Chỉ tìm dãy trùng hoàn toàn
+    exact_only = analysis.detect_duplicate_score_vectors(df, cols, max_diff=0)
+    assert _duplicate_groups(exact_only) == {("MaHS HS0, HS1", "Trùng dãy điểm")}
+    # So sánh cả tệp: HS5 (lớp khác) cùng nhóm với HS0, HS1
+    whole_file = analysis.detect_duplicate_score_vectors(df, cols, scope_col=None)
+    assert ("MaHS HS0, HS1, HS5", "Trùng dãy điểm") in _duplicate_groups(whole_file)
+    # Đủ 4 điểm giống nhau thì HS6, HS7 cũng được tính
+    fewer_scores = analysis.detect_duplicate_score_vectors(df, cols, min_scores=4)
+    assert ("MaHS HS6, HS7", "Trùng dãy điểm") in _duplicate_groups(fewer_scores)
+
+def test_mahalanobis_matches_direct_leave_one_out():
+    # Khoảng cách của mỗi học sinh tới trung bình và hiệp phương sai (co về ma
+    # trận chung) của các bạn còn lại trong lớp, tính trực tiếp bằng NumPy
+    from scipy.stats import norm
+
+    rng = np.random.default_rng(17)
+    cols = list(analysis.SUMMARY_SUBJECT_COLS[:4])
+    cov = 0.5 * np.eye(len(cols)) + 0.5
+    sizes = {"10A1": 8, "10A2": 25, "10A3": 60}
+    frames = [pd.DataFrame(rng.multivariate_normal(np.full(len(cols), 6.5), cov, size=n), columns=cols).assign(lop=lop)
+              for lop, n in sizes.items()]
+    df = pd.concat(frames, ignore_index=True)
+    df.loc[3, cols] = [9.5, 3.0, 9.0, 3.5]
+    scores = analysis.compute_mahalanobis_scores(df, cols)
+
+    values = df[cols].to_numpy(dtype=float)
+    groups = [np.flatnonzero(df["lop"] == lop) for lop in sizes]
+    pooled = sum((len(rows) - 1) * np.cov(values[rows], rowvar=False) for rows in groups)
+    pooled /= sum(len(rows) - 1 for rows in groups)
+    distances = np.empty(len(df))
+    for rows in groups:
+        n = len(rows)
+        weight = analysis.MAHALANOBIS_PRIOR_WEIGHT / (n + analysis.MAHALANOBIS_PRIOR_WEIGHT)
+        for i in rows:
+            others = values[rows[rows != i]]
+            shrunk = (1 - weight) * np.cov(others, rowvar=False) + weight * pooled
+            diff = values[i] - others.mean(axis=0)
+            distances[i] = diff @ np.linalg.solve(shrunk, diff)
+    sample_sizes = df["lop"].map(sizes).to_numpy() - 1 + 2 * analysis.MAHALANOBIS_PRIOR_WEIGHT
+    tail = analysis._distance_tail(distances, np.full(len(df), len(cols)), sample_sizes)
+    np.testing.assert_allclose(scores.z_scores, norm.isf(tail / 2), rtol=1e-9)
+    assert np.nanargmax(scores.z_scores) == 3
+
+@pytest.mark.parametrize("n_bins", [7, analysis.DISTRIBUTION_BINS])
+def test_score_distribution_matches_numpy(n_bins):
+    rng = np.random.default_rng(18)
+    # Điểm làm tròn 0.25 nên nhiều điểm nằm đúng trên biên các khoảng
+    df = pd.DataFrame({"Toan": np.round(rng.normal(6.5, 1.8, 900).clip(0, 10) * 4) / 4,
+                       "lop": rng.choice(["10A1", "10A2", "10A3"], 900)})
+    df.loc[rng.choice(900, 60, replace=False), "Toan"] = np.nan
+    df.loc[len(df)] = [np.nan, "10A4"]  # Lớp không có điểm nào
+    distribution = analysis.score_distribution(df, "Toan", "lop", n_bins=n_bins)
+
+    assert distribution.labels[0] == analysis.GLOBAL_BASELINE
+    assert sorted(distribution.labels[1:]) == ["10A1", "10A2", "10A3", "10A4"]
+    for label, counts, (_, stats) in zip(distribution.labels, distribution.counts, distribution.stats.iterrows()):
+        values = df["Toan"] if label == analysis.GLOBAL_BASELINE else df.loc[df["lop"] == label, "Toan"]
+        values = values.dropna().to_numpy()
+        expected, _ = np.histogram(values, bins=distribution.edges)
+        np.testing.assert_array_equal(counts, expected)
+        assert stats["SoHocSinh"] == len(values)
+        if len(values):
+            np.testing.assert_allclose([stats["TrungBinh"], stats["Q1"], stats["TrungVi"], stats["Q3"]],
+                                       [values.mean(), *np.percentile(values, [25, 50, 75])])
+            assert (stats["NhoNhat"], stats["LonNhat"]) == (values.min(), values.max())
+    low, high = np.floor(df["Toan"].min()), np.ceil(df["Toan"].max())
+    np.testing.assert_allclose(distribution.edges, np.linspace(low, high, n_bins + 1))
+
+@pytest.fixture(scope="module")
+def indexed_anomalies():
+    df = synthetic.generate_scores(1500, "summary", seed=19)
+    df.loc[:40, "lop"] = np.nan
+    prepared = analysis.prepare_summary_analysis(df, "lop")
+    anomalies = analysis.format_anomalies(prepared.detect(2.0), drop_internal=False)
+    return anomalies, analysis.build_anomaly_index(anomalies)
+
+def test_anomaly_index_mask_matches_isin(indexed_anomalies):
+    anomalies, index = indexed_anomalies
+    rng = np.random.default_rng(20)
+    assert index.options["MucDo"].tolist() == [level for level in analysis.SEVERITY_LEVELS
+                                               if level in set(anomalies["MucDo"].astype(str))]
+    # Chọn mọi giá trị ở mọi cột: không lọc, trừ cột lop có dòng thiếu giá trị
+    everything = {column: index.options[column] for column in analysis.ANOMALY_FILTER_COLUMNS}
+    np.testing.assert_array_equal(index.mask(everything), anomalies["lop"].notna().to_numpy())
+    assert index.mask({column: everything[column] for column in ("LoaiBatThuong", "MucDo")}) is None
+    for _ in range(20):
+        selections = {column: [v for v in index.options[column] if rng.random() < 0.5]
+                      for column in analysis.ANOMALY_FILTER_COLUMNS if rng.random() < 0.8}
+        expected = np.ones(len(anomalies), dtype=bool)
+        for column, selected in selections.items():
+            expected &= anomalies[column].isin(selected).to_numpy()
+        mask = index.mask(selections)
+        np.testing.assert_array_equal(np.ones(len(anomalies), dtype=bool) if mask is None else mask, expected)
+
+def test_anomaly_index_rows_of(indexed_anomalies):
+    anomalies, index = indexed_anomalies
+    source_rows = anomalies["ViTriDong"].to_numpy()
+    for positions in ([], [0], [int(source_rows[5]), int(source_rows[-1]), 10**6],
+                      np.random.default_rng(21).choice(1500, 50, replace=False)):
+        np.testing.assert_array_equal(index.rows_of(positions), np.flatnonzero(np.isin(source_rows, positions)))
@@ -0,0 +1,59 @@
+# tests/test_cache.py
+
+"""Bộ nhớ đệm Parquet trên đĩa (`cache.DiskCache`): kiểu dữ liệu sau khi đọc lại và loại bỏ theo LRU."""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from modules import analysis, cache, synthetic
+
+def test_anomaly_frame_round_trip_keeps_dtypes(tmp_path):
+    df = analysis.compact_scores(synthetic.generate_scores(500, "summary", seed=22))
+    anomalies = analysis.prepare_summary_analysis(df, "lop").detect(2.0)
+    disk_cache = cache.DiskCache(str(tmp_path))
+    assert disk_cache.put_frame("anomalies", anomalies) and disk_cache.put_frame("data", df)
+
+    restored = disk_cache.get_frame("anomalies")
+    # Cột category (cả thứ tự của MucDo và các danh mục không xuất hiện) được giữ nguyên
+    pd.testing.assert_frame_equal(restored, anomalies)
+    assert restored["MucDo"].cat.ordered
+    assert restored["LoaiBatThuong"].cat.categories.tolist() == list(analysis.ANOMALY_TYPES)
+    # Điểm float32 đọc lại không đổi
+    pd.testing.assert_frame_equal(disk_cache.get_frame("data"), df)
+
+    z_scores = pd.DataFrame({"Toan": np.array([1.5, -2.25, np.nan, 65504], dtype=analysis.Z_DTYPE)})
+    disk_cache.put_frame("z", z_scores)
+    pd.testing.assert_frame_equal(disk_cache.get_frame("z"), z_scores)
+    assert disk_cache.stats()["hits"] == 3
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    frame = pd.DataFrame({"Toan": np.arange(2000, dtype=np.float64)})
+    disk_cache = cache.DiskCache(str(tmp_path))
+    disk_cache.put_frame("probe", frame)
+    entry_size = disk_cache.stats()["size_bytes"]
+    disk_cache.invalidate()
+
+    # Đủ chỗ cho ba mục
+    disk_cache.max_bytes = 3 * entry_size
+    for i, key in enumerate(["a", "b", "c"]):
+        disk_cache.put_frame(key, frame)
+        os.utime(disk_cache._path(key), (1_000_000 + i, 1_000_000 + i))
+    # Dùng lại "a" nên "b" trở thành mục ít dùng gần đây nhất
+    assert disk_cache.get_frame("a") is not None
+    disk_cache.put_frame("d", frame)
+
+    assert disk_cache.get_frame("b") is None
+    assert all(disk_cache.get_frame(key) is not None for key in ["a", "c", "d"])
+    assert disk_cache.stats()["entries"] == 3
+    assert (disk_cache.hits, disk_cache.misses) == (4, 1)
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    disk_cache = cache.DiskCache(str(tmp_path))
+    with open(disk_cache._path("broken"), "wb") as f:
+        f.write(b"not parquet")
+    calls = []
+    result = disk_cache.get_or_compute("broken", lambda: calls.append(1) or pd.DataFrame({"x": [1]}))
+    assert calls == [1] and result["x"].tolist() == [1]
+    pd.testing.assert_frame_equal(disk_cache.get_frame("broken"), result)
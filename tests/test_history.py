@@ -0,0 +1,79 @@
+# tests/test_history.py
+
+"""Kho lịch sử Parquet theo kỳ (`history.HistoryStore`)."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import analysis, history
+
+NAN = np.nan
+SCORE_COLS = ["Toan", "Van"]
+
+def _save(store, rows, school_year, term):
+    df = pd.DataFrame(rows, columns=["MaHS", "lop"] + SCORE_COLS)
+    # Mỗi ô trống là một bất thường "Thiếu dữ liệu"
+    anomalies = analysis.detect_missing_values(df, SCORE_COLS)
+    return store.save_run(df, anomalies, "summary", school_year, term, 2.0, group_col="lop", source=f"{term}.csv")
+
+@pytest.fixture
+def store(tmp_path):
+    store = history.HistoryStore(str(tmp_path))
+    _save(store, [("S1", "10A1", 6.0, 7.0), ("S2", "10A1", 5.0, NAN), ("S3", "10A2", 8.0, NAN)],
+          "2024-2025", "HK1")
+    # Lưu lại HK1 với tệp chỉ có lớp 10A1: thay lớp 10A1, giữ nguyên 10A2
+    _save(store, [("S1", "10A1", 6.5, 7.0), ("S4", "10A1", 9.0, 8.0)], "2024-2025", "HK1")
+    _save(store, [("S1", "10A1", 7.5, NAN), ("S3", "10A2", 8.5, 9.0)], "2024-2025", "HK2")
+    return store
+
+def test_resaving_a_term_replaces_only_its_classes(store):
+    scores = store.query("summary", "diem", filters={"HocKy": "HK1"})
+    saved = scores.sort_values(["MaHS", "CotDiem"])[["lop", "MaHS", "CotDiem", "Diem"]].reset_index(drop=True)
+    expected = pd.DataFrame([
+        ("10A1", "S1", "Toan", 6.5), ("10A1", "S1", "Van", 7.0), ("10A2", "S3", "Toan", 8.0),
+        ("10A2", "S3", "Van", NAN), ("10A1", "S4", "Toan", 9.0), ("10A1", "S4", "Van", 8.0),
+    ], columns=["lop", "MaHS", "CotDiem", "Diem"])
+    pd.testing.assert_frame_equal(saved, expected, check_dtype=False)
+    anomalies = store.query("summary", "batthuong", filters={"HocKy": "HK1"})
+    assert anomalies[["MaHS", "CotDiem"]].values.tolist() == [["S3", "Van"]]
+    assert sorted(store.query("summary", "hocsinh", filters={"HocKy": "HK1"})["MaHS"]) == ["S1", "S3", "S4"]
+    assert store.classes("summary") == ["10A1", "10A2"]
+    runs = store.runs("summary")
+    assert runs["Ky"].tolist() == ["2024-2025 HK1"] * 2 + ["2024-2025 HK2"]
+    # Hai lần lưu HK1 đều được ghi lại (thứ tự trong cùng kỳ không xác định)
+    assert sorted(runs.loc[runs["HocKy"] == "HK1", "SoLop"]) == [1, 2]
+
+def test_save_run_rejects_invalid_input(tmp_path):
+    store = history.HistoryStore(str(tmp_path))
+    with pytest.raises(history.HistoryError, match="Năm học"):
+        _save(store, [("S1", "10A1", 6.0, 7.0)], "2024-2026", "HK1")
+    with pytest.raises(history.HistoryError, match="Học kỳ"):
+        _save(store, [("S1", "10A1", 6.0, 7.0)], "2024-2025", "HK3")
+    with pytest.raises(history.HistoryError, match="MaHS"):
+        _save(store, [(None, "10A1", 6.0, 7.0)], "2024-2025", "HK1")
+
+def test_student_history(store):
+    scores, anomalies = store.student_history("S1", "summary")
+    expected = pd.DataFrame({"Ky": ["2024-2025 HK1", "2024-2025 HK2"], "NamHoc": ["2024-2025"] * 2,
+                             "HocKy": ["HK1", "HK2"], "lop": ["10A1"] * 2, "Toan": [6.5, 7.5], "Van": [7.0, NAN]})
+    pd.testing.assert_frame_equal(scores, expected, check_dtype=False)
+    assert anomalies[["Ky", "CotDiem", "LoaiBatThuong"]].values.tolist() == [["2024-2025 HK2", "Van", "Thiếu dữ liệu"]]
+    scores, anomalies = store.student_history("S9", "summary")
+    assert scores.empty and anomalies.empty
+
+def test_anomaly_counts_and_score_trend(store):
+    counts = store.anomaly_counts("summary")
+    assert counts[["HocKy", "lop", "SoHocSinh", "SoBatThuong"]].values.tolist() == [
+        ["HK1", "10A1", 2, 0], ["HK1", "10A2", 1, 1], ["HK2", "10A1", 1, 1], ["HK2", "10A2", 1, 0],
+    ]
+    by_term = store.anomaly_counts("summary", by=("NamHoc", "HocKy"), filters={"lop": "10A2"})
+    assert by_term[["HocKy", "SoHocSinh", "SoBatThuong"]].values.tolist() == [["HK1", 1, 1], ["HK2", 1, 0]]
+
+    trend = store.score_trend("summary", filters={"CotDiem": "Van"})
+    assert trend[["HocKy", "lop", "SoDiem"]].values.tolist() == [
+        ["HK1", "10A1", 2], ["HK1", "10A2", 0], ["HK2", "10A1", 0], ["HK2", "10A2", 1],
+    ]
+    np.testing.assert_allclose(trend["DiemTrungBinh"], [7.5, NAN, NAN, 9.0])
+    overall = store.score_trend("summary", by=("NamHoc", "HocKy", "CotDiem"))
+    np.testing.assert_allclose(overall["DiemTrungBinh"], [(6.5 + 8.0 + 9.0) / 3, 7.5, 8.0, 9.0])
@@ -0,0 +1,92 @@
+# tests/test_incremental.py
+
+"""
+Phân tích lại tăng dần (`incremental.update_analysis`) phải cho cùng bảng bất
+thường với phân tích toàn bộ bảng mới.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import analysis, incremental, synthetic
+
+N_ROWS = 5000
+KEY_COLUMNS = ["ViTriDong", "CotDiem", "LoaiBatThuong", "NhomThamChieu"]
+
+def _prepare(df, analysis_type, group_col, methods=analysis.DEFAULT_DETECTION_METHODS):
+    if analysis_type == "component":
+        return analysis.prepare_component_analysis(df, group_col, methods=methods)
+    return analysis.prepare_summary_analysis(df, group_col, methods=methods)
+
+def _sorted(frame):
+    frame = frame.astype({col: str for col in ("CotDiem", "LoaiBatThuong", "MucDo", "NhomThamChieu")})
+    return frame.sort_values(KEY_COLUMNS).reset_index(drop=True)
+
+def _assert_same_anomalies(updated, full, z_thresh=2.0):
+    expected, actual = _sorted(full.detect(z_thresh)), _sorted(updated.detect(z_thresh))
+    pd.testing.assert_frame_equal(
+        actual.drop(columns=["ZScore", "TrungBinhThamChieu", "DoLechChuanThamChieu"]),
+        expected.drop(columns=["ZScore", "TrungBinhThamChieu", "DoLechChuanThamChieu"]),
+    )
+    # Thống kê tích lũy chỉ lệch ở mức làm tròn dấu phẩy động
+    for col in ("ZScore", "TrungBinhThamChieu", "DoLechChuanThamChieu"):
+        np.testing.assert_allclose(actual[col], expected[col], rtol=1e-6, atol=1e-9)
+
+@pytest.mark.parametrize("analysis_type", ["summary", "component"])
+@pytest.mark.parametrize("group_col", [None, "lop"])
+def test_shuffled_rows_remap_positions(analysis_type, group_col):
+    df = synthetic.generate_scores(N_ROWS, analysis_type, seed=1)
+    previous = _prepare(df, analysis_type, group_col)
+    shuffled = df.sample(frac=1, random_state=3).reset_index(drop=True)
+
+    updated = incremental.update_analysis(previous, shuffled, analysis_type, group_col)
+    assert updated.changes.is_empty
+    assert updated.changes.mode == "tăng dần"
+    _assert_same_anomalies(updated, _prepare(shuffled, analysis_type, group_col))
+
+def test_shuffled_rows_with_robust_methods_fall_back_to_full_analysis():
+    methods = ("zscore", "mad", "iqr")
+    df = synthetic.generate_scores(N_ROWS, "summary", seed=2)
+    previous = _prepare(df, "summary", "lop", methods)
+    shuffled = df.sample(frac=1, random_state=4).reset_index(drop=True)
+
+    updated = incremental.update_analysis(previous, shuffled, "summary", "lop", methods=methods)
+    assert updated.changes.mode == "toàn bộ"
+    _assert_same_anomalies(updated, _prepare(shuffled, "summary", "lop", methods))
+
+def test_unchanged_file_reuses_previous_result():
+    df = synthetic.generate_scores(N_ROWS, "summary", seed=5)
+    previous = _prepare(df, "summary", "lop")
+    updated = incremental.update_analysis(previous, df.copy(), "summary", "lop")
+    assert updated.changes.mode == "tăng dần"
+    assert updated.zscores is previous.zscores
+
+@pytest.mark.parametrize("analysis_type", ["summary", "component"])
+def test_edited_roster_matches_full_analysis(analysis_type):
+    df = synthetic.generate_scores(N_ROWS, analysis_type, seed=6)
+    previous = _prepare(df, analysis_type, "lop")
+    rng = np.random.default_rng(7)
+    score_cols = list(previous.score_cols)
+
+    edited = df.copy()
+    for row in rng.choice(len(df), 50, replace=False):
+        edited.loc[row, score_cols[rng.integers(len(score_cols))]] = float(rng.integers(0, 11))
+    added = synthetic.generate_scores(30, analysis_type, seed=8)
+    added["MaHS"] = [f"MOI{i:04d}" for i in range(len(added))]
+    edited = pd.concat([edited.drop(index=rng.choice(len(df), 20, replace=False)), added], ignore_index=True)
+
+    updated = incremental.update_analysis(previous, edited, analysis_type, "lop")
+    assert updated.changes.mode == "tăng dần"
+    assert len(updated.changes.added) == 30 and len(updated.changes.removed) == 20
+    _assert_same_anomalies(updated, _prepare(edited, analysis_type, "lop"))
+
+@pytest.mark.parametrize("module", ["modules.streaming", "modules.incremental", "modules.utils"])
+def test_module_imports_in_fresh_interpreter(module):
+    # streaming -> cli -> ingest và utils -> incremental không được vòng lại streaming
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True, capture_output=True,
+                   cwd=Path(__file__).resolve().parents[1])
@@ -0,0 +1,41 @@
+# tests/test_ingest.py
+
+"""Đọc và gộp bảng điểm không cần giao diện Streamlit (`modules/ingest.py`)."""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import analysis, ingest
+
+@pytest.mark.parametrize("module", ["modules.cli", "modules.streaming", "modules.service", "modules.history"])
+def test_headless_modules_do_not_import_streamlit(module):
+    # Dòng lệnh và dịch vụ chạy ngoài `streamlit run`: nạp streamlit sẽ in cảnh báo và tốn thời gian khởi động
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print('streamlit' in sys.modules)"],
+        check=True, capture_output=True, text=True, cwd=Path(__file__).resolve().parents[1],
+    )
+    assert result.stdout.strip() == "False"
+
+def test_merge_tables_with_mismatched_columns():
+    first = pd.DataFrame({"MaHS": ["1", "2"], "lop": ["10A1", "10A1"], "Toan": [7.5, 8.0], "Van": [6.0, 5.5]})
+    # Tệp thứ hai thiếu cột Van, có thêm cột Ly và cột theo thứ tự khác
+    second = pd.DataFrame({"Ly": [9.0], "Toan": [4.25], "lop": ["10A2"], "MaHS": ["3"]})
+    third = pd.DataFrame({"MaHS": ["4"], "lop": ["10A1"], "Van": [np.nan]})
+    merged = ingest.merge_tables([first, second, third], ["a.csv", "b.xlsx", "c.csv"])
+
+    assert merged.columns.tolist() == [analysis.SOURCE_COLUMN, "MaHS", "lop", "Toan", "Van", "Ly"]
+    assert merged[analysis.SOURCE_COLUMN].tolist() == ["a.csv", "a.csv", "b.xlsx", "c.csv"]
+    assert merged[analysis.SOURCE_COLUMN].cat.categories.tolist() == ["a.csv", "b.xlsx", "c.csv"]
+    assert merged["MaHS"].tolist() == ["1", "2", "3", "4"]
+    assert isinstance(merged["lop"].dtype, pd.CategoricalDtype)
+    assert merged["lop"].tolist() == ["10A1", "10A1", "10A2", "10A1"]
+    # Cột điểm thiếu ở một tệp là ô trống; điểm được lưu gọn dạng float32
+    np.testing.assert_array_equal(analysis.score_matrix(merged, ["Toan", "Van", "Ly"]), [
+        [7.5, 6.0, np.nan], [8.0, 5.5, np.nan], [4.25, np.nan, 9.0], [np.nan, np.nan, np.nan],
+    ])
+    assert merged["Toan"].dtype == np.float32
@@ -0,0 +1,33 @@
+# tests/test_profiling.py
+
+"""Bản ghi thời gian và bộ nhớ của từng bước (`profiling.stage`)."""
+
+import numpy as np
+import pytest
+
+from modules import profiling
+
+pytestmark = pytest.mark.skipif(profiling._current_rss_mb() is None, reason="Cần /proc để đọc RSS hiện tại")
+
+def test_rss_delta_is_measured_per_stage():
+    with profiling.collect() as records:
+        # Bước đầu đẩy RSS đỉnh của tiến trình lên rồi giải phóng
+        with profiling.stage("tam"):
+            block = np.ones(40 * 2**20)
+            del block
+        # Bước sau vẫn ghi nhận phần bộ nhớ mới giữ lại, dù thấp hơn đỉnh cũ
+        with profiling.stage("giu_lai"):
+            kept = np.ones(20 * 2**20)
+    first, second = records
+    assert second["rss_delta_mb"] > 100
+    assert second["rss_mb"] >= first["rss_mb"] + 100
+    assert kept.sum() > 0
+
+def test_records_frame_columns():
+    with profiling.collect() as records:
+        with profiling.stage("cha", rows=3):
+            with profiling.stage("con"):
+                pass
+    frame = profiling.records_frame(records)
+    assert list(frame.columns) == ["stage", "wall_ms", "rows", "cols", "anomalies", "rss_mb", "rss_delta_mb"]
+    assert frame["stage"].tolist() == ["cha", "  con"]
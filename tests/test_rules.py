@@ -0,0 +1,74 @@
+# tests/test_rules.py
+
+"""Quy tắc kiểm tra chéo điểm thành phần (`modules/rules.py`) và tệp quy tắc mặc định."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import rules
+
+NAN = np.nan
+# Mỗi dòng: TX1, TX2, TX3, GK, CK
+ROWS = [
+    (7, 7, 7, 7, 7),          # 0: không vi phạm
+    (8, 8, 8, 7, 3),          # 1: CK giảm mạnh
+    (8, NAN, 8, 7, 4),        # 2: CK giảm mạnh, trung bình TX bỏ qua ô trống (đúng bằng ngưỡng)
+    (8, 8, 8, 3, 7),          # 3: GK giảm mạnh
+    (5, 5, 5, 5, 9.5),        # 4: CK tăng vọt
+    (7, 7, 7, NAN, 7),        # 5: thiếu GK nhưng có CK
+    (10, 10, 10, 4, 4.5),     # 6: TX tuyệt đối (kéo theo GK, CK giảm mạnh)
+    (7, -1, 7, 7, 7),         # 7: ngoài thang điểm
+    (7, 7, 7, 7, 10.5),       # 8: ngoài thang điểm
+    (NAN, NAN, NAN, NAN, NAN),  # 9: trống hết
+]
+EXPECTED = {
+    "ck_giam_manh": [1, 2, 6],
+    "gk_giam_manh": [3, 6],
+    "ck_tang_vot": [4],
+    "thieu_gk_co_ck": [5],
+    "tx_tuyet_doi": [6],
+    "diem_ngoai_thang": [7, 8],
+}
+
+@pytest.fixture(scope="module")
+def table():
+    return pd.DataFrame(ROWS, columns=["TX1", "TX2", "TX3", "GK", "CK"])
+
+def test_default_rules_flag_expected_rows(table):
+    default = rules.load_rules(rules.DEFAULT_RULES_PATH)
+    assert [rule.id for rule in default] == list(EXPECTED)
+    masks, timings = rules.evaluate_rules(table, default)
+    for rule_id, rows in EXPECTED.items():
+        assert np.flatnonzero(masks[rule_id]).tolist() == rows, rule_id
+    assert (timings["TrangThai"] == "OK").all()
+    assert timings["SoViPham"].tolist() == [len(rows) for rows in EXPECTED.values()]
+
+def test_rule_with_missing_column_is_skipped(table):
+    rule = rules.compile_rule({"id": "r", "expression": "TX4 > 5"})
+    masks, timings = rules.evaluate_rules(table, [rule])
+    assert masks["r"] is None
+    assert timings["TrangThai"].iloc[0] == "Bỏ qua: thiếu cột TX4"
+
+@pytest.mark.parametrize("expression, message", [
+    ("CK.real > 5", "Attribute"),
+    ("(CK > 5) and (GK > 5)", "dùng &, |, ~"),
+    ("not (CK > 5)", "dùng &, |, ~"),
+    ("CK[0] > 5", "Subscript"),
+    ("[CK] == [5]", "List"),
+    ("lambda: CK", "Lambda"),
+    ("__import__('os')", "chỉ được gọi các hàm"),
+    ("mean(CK, axis=0) > 5", "chỉ được gọi các hàm"),
+    ("CK == 'a'", "hằng số dạng số"),
+    ("1 < CK < 5", "so sánh liên tiếp"),
+    ("CK >", "sai cú pháp"),
+])
+def test_disallowed_expressions_are_rejected(expression, message):
+    with pytest.raises(rules.RuleError, match=message):
+        rules.compile_rule({"id": "r", "expression": expression})
+
+def test_invalid_rule_files_are_rejected():
+    with pytest.raises(rules.RuleError, match="bị trùng"):
+        rules.parse_rules('[{"id": "a", "expression": "CK > 1"}, {"id": "a", "expression": "GK > 1"}]')
+    with pytest.raises(rules.RuleError, match="mức độ"):
+        rules.parse_rules('[{"id": "a", "expression": "CK > 1", "severity": "Rất cao"}]')
@@ -0,0 +1,42 @@
+# tests/test_service.py
+
+"""Đọc yêu cầu HTTP của dịch vụ phân tích (`service.AnalysisService`)."""
+
+import asyncio
+
+import pytest
+
+from modules import service
+
+def _read(raw):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await service.AnalysisService(workers=1)._read_request(reader)
+    return asyncio.run(read())
+
+def test_reads_body_by_content_length():
+    method, target, headers, body = _read(b"POST /jobs?name=a.csv HTTP/1.1\r\nContent-Length: 3\r\n\r\nabcdef")
+    assert (method, target, body) == ("POST", "/jobs?name=a.csv", b"abc")
+    assert headers["content-length"] == "3"
+
+@pytest.mark.parametrize("value", [b"abc", b"1.5", b"-1", b"12 34"])
+def test_invalid_content_length_is_bad_request(value):
+    with pytest.raises(service.ServiceError) as error:
+        _read(b"POST /jobs HTTP/1.1\r\nContent-Length: " + value + b"\r\n\r\n")
+    assert error.value.status == 400
+
+def test_oversized_body_is_rejected():
+    with pytest.raises(service.ServiceError) as error:
+        _read(b"POST /jobs HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (service.MAX_BODY_BYTES + 1))
+    assert error.value.status == 413
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-1", "0", "abc"])
+def test_invalid_threshold_is_bad_request(value):
+    async def post():
+        analysis_service = service.AnalysisService(workers=1)
+        return await analysis_service._post_job({"name": "diem.csv", "threshold": value}, {}, b"MaHS,Toan\n1,5\n")
+    with pytest.raises(service.ServiceError) as error:
+        asyncio.run(post())
+    assert error.value.status == 400
@@ -0,0 +1,63 @@
+# tests/test_streaming.py
+
+"""
+Chế độ luồng (`streaming.stream_anomalies`, đọc tệp theo khối) phải cho cùng
+các bất thường Z-score và thiếu điểm với phân tích toàn bộ tệp trong bộ nhớ (bỏ
+các phát hiện không có ở chế độ luồng), với Z-score khớp đến sai số làm tròn.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import analysis, ingest, streaming, synthetic
+
+N_ROWS = 4000
+CHUNKSIZE = 700
+KEY_COLUMNS = ["ViTriDong", "CotDiem", "LoaiBatThuong", "NhomThamChieu"]
+
+def _write_roster(path, analysis_type, seed):
+    df = synthetic.generate_scores(N_ROWS, analysis_type, seed=seed)
+    # Khối đầu chỉ có tên lớp/tổ dạng số, các khối sau có cả chữ: kiểu cột không
+    # được suy ra riêng cho từng khối
+    df.loc[:CHUNKSIZE, "lop"] = df.loc[:CHUNKSIZE, "lop"].str.extract(r"(\d+)A", expand=False)
+    rows = np.arange(N_ROWS)
+    df["to"] = np.where((rows >= CHUNKSIZE) & (rows % 7 == 0), "khac", (rows % 3).astype(str))
+    df.to_csv(path, index=False, encoding="utf-8-sig")
+
+def _in_memory(path, analysis_type, z_thresh, group_col):
+    df = ingest.read_csv_bytes(path.read_bytes())
+    if group_col is not None:
+        # Nhãn nhóm luôn là chuỗi, như khi đọc theo khối
+        df[group_col] = df[group_col].astype(str)
+    if analysis_type == "component":
+        prepared = analysis.prepare_component_analysis(df, group_col)
+    else:
+        prepared = analysis.prepare_summary_analysis(df, group_col)
+    # Chế độ luồng không có dãy điểm trùng, Mahalanobis và quy tắc kiểm tra
+    prepared.duplicates = prepared.multivariate = prepared.rule_violations = None
+    return analysis.format_anomalies(prepared.detect(z_thresh), drop_internal=False)
+
+def _sorted(frame):
+    frame = frame.astype({col: str for col in KEY_COLUMNS[1:] + ["MaHS", "lop", "MucDo", "DiemBatThuong"]})
+    return frame.sort_values(KEY_COLUMNS).reset_index(drop=True)
+
+@pytest.mark.parametrize("analysis_type", ["summary", "component"])
+@pytest.mark.parametrize("group_col", [None, "lop", "to"])
+def test_streaming_matches_in_memory_analysis(tmp_path, analysis_type, group_col):
+    source, output = tmp_path / "diem.csv", tmp_path / "bat_thuong.parquet"
+    _write_roster(source, analysis_type, seed=21)
+
+    summary = streaming.stream_anomalies(str(source), str(output), analysis_type, 2.0, group_col,
+                                         chunksize=CHUNKSIZE)
+    streamed = _sorted(pd.read_parquet(output))
+    expected = _sorted(_in_memory(source, analysis_type, 2.0, group_col))
+
+    assert summary["rows"] == N_ROWS
+    assert summary["anomalies"] == len(expected)
+    # GiaiThich chứa trung bình làm tròn 2 chữ số nên không so sánh chính xác
+    columns = KEY_COLUMNS + ["MaHS", "lop", "MucDo", "DiemBatThuong"]
+    pd.testing.assert_frame_equal(streamed[columns], expected[columns], check_dtype=False)
+    # Thống kê gộp theo khối chỉ lệch ở mức làm tròn dấu phẩy động
+    np.testing.assert_allclose(streamed["ZScore"], expected["ZScore"], rtol=1e-6)
+    np.testing.assert_allclose(streamed["TrungBinhThamChieu"], expected["TrungBinhThamChieu"], rtol=1e-9)
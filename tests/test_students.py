@@ -0,0 +1,60 @@
+# tests/test_students.py
+
+"""Tra cứu học sinh theo MaHS và họ tên (`students.StudentIndex`)."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import students
+
+@pytest.fixture(scope="module")
+def roster():
+    df = pd.DataFrame({
+        "MaHS": ["HS010", "HS002", "HS011", "HS100", "HS002", "AB010"],
+        "HoTen": ["Nguyễn Văn An", "Trần Thị Ánh", "Lê Đức Anh", "Phạm An Bình", None, "Đỗ Văn Đạt"],
+        "lop": ["10A1", "10A2", "10A1", "10A2", "10A1", "10A2"],
+    })
+    return df, students.build_student_index(df)
+
+def test_lookup_exact_id(roster):
+    _, index = roster
+    assert index.lookup("HS002").tolist() == [1, 4]
+    assert index.lookup(" HS100 ").tolist() == [3]
+    assert index.lookup("HS01").tolist() == []
+
+def test_search_by_id_prefix(roster):
+    _, index = roster
+    assert sorted(index.search("HS01").tolist()) == [0, 2]
+    assert sorted(index.search("HS").tolist()) == [0, 1, 2, 3, 4]
+    assert index.search("HS", limit=2).tolist() == [1, 4]
+    assert index.search("  ").tolist() == []
+
+@pytest.mark.parametrize("query, rows", [
+    ("an", [0, 1, 2, 3]),        # Tên "An", "Anh", tên đệm "An" và "Ánh" khi bỏ dấu
+    ("anh", [1, 2]),
+    ("Ánh", [1, 2]),
+    ("van an", [0]),
+    ("NGUYEN", [0]),
+    ("dat", [5]),                # đ -> d
+    ("đức anh", [2]),
+    ("binh", [3]),
+    ("thi x", []),
+])
+def test_search_by_accent_stripped_name_suffix(roster, query, rows):
+    _, index = roster
+    assert sorted(index.search(query).tolist()) == rows
+
+def test_id_matches_come_first():
+    df = pd.DataFrame({"MaHS": ["X1", "an05", "X2"], "HoTen": ["Trần An", "Lê Thị Hoa", "An Văn An"]})
+    index = students.build_student_index(df)
+    assert index.search("an")[0] == 1
+    assert sorted(index.search("an").tolist()) == [0, 1, 2]
+    assert index.search("an", limit=1).tolist() == [1]
+    # Một học sinh khớp ở nhiều từ của họ tên chỉ được trả về một lần
+    assert index.search("a", limit=5).tolist().count(2) == 1
+
+def test_classmates(roster):
+    _, index = roster
+    assert index.classmates(0).tolist() == [0, 2, 4]
+    assert index.classmates(5).tolist() == [1, 3, 5]
@@ -0,0 +1,16 @@
+# tests/test_visualization.py
+
+"""Các biểu đồ trong `visualization` trên bảng bất thường đã lọc."""
+
+import pandas as pd
+
+from modules import visualization
+
+def test_anomalies_by_class_skips_empty_categories():
+    # Cột lop đọc bằng ingest là category: sau khi lọc một lớp, các lớp khác vẫn còn trong danh mục
+    lop = pd.Series(["10A1", "10A2", "11A6", "11A6"], dtype="category")
+    df_anomalies = pd.DataFrame({"lop": lop, "LoaiBatThuong": "Thiếu dữ liệu"})
+    fig = visualization.plot_anomalies_by_class(df_anomalies[df_anomalies["lop"] == "11A6"])
+    bar = fig.data[0]
+    assert list(bar.x) == ["11A6"]
+    assert list(bar.y) == [2]